@@ -0,0 +1,166 @@
+"""
+Multithreaded CSV parsing with Arrow, for the cleaner's and loader's inputs.
+
+pd.read_csv parses a file on one core. With pyarrow installed, read_csv
+parses it in blocks of BLOCK_SIZE bytes on every core (pyarrow's thread
+pool, sized by pa.set_cpu_count), from a memory map of the file, and
+converts only the columns asked for. The trip timestamps are parsed by
+Arrow too, in their ISO layout, so they arrive as datetime64[ns] and
+parse_timestamps passes them through.
+
+The frames match pd.read_csv's with the same `dtype`: integer columns
+without missing values are int64, with missing values float64, and empty
+strings are missing. Floats are parsed exactly (pd.read_csv's default
+parser can be one unit in the last digit off), so a coordinate may differ
+from pandas' in its 17th significant digit. Anything Arrow cannot read exactly like that (a
+timestamp in another layout, a text value in a numeric column, a compressed
+file, a keyword argument it has no equivalent for) is read by pd.read_csv
+instead, from where Arrow stopped when it was already streaming chunks. The
+timestamps of those chunks go through parse_timestamps, so every chunk of a
+stream has the same dtypes whichever parser read it.
+"""
+import os
+from itertools import islice
+
+import pandas as pd
+
+from timestamp_parser import TIMESTAMP_FORMAT, parse_timestamps
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# Bytes of the file parsed per task
+BLOCK_SIZE = 8 << 20
+
+# pd.read_csv keyword arguments read_csv also handles with Arrow
+_ARROW_KWARGS = {'dtype', 'usecols', 'chunksize', 'nrows'}
+
+
+def _arrow_type(dtype):
+    """Arrow type a column is parsed as to end up with pandas dtype `dtype`"""
+    if dtype == 'category' or isinstance(dtype, pd.CategoricalDtype):
+        return pa.dictionary(pa.int32(), pa.string())
+    if dtype is object or pd.api.types.is_string_dtype(dtype):
+        return pa.string()
+    return pa.from_numpy_dtype(pd.api.types.pandas_dtype(dtype))
+
+
+def _to_frame(table, dtype):
+    """Frame of a parsed table, with the pandas dtypes asked for"""
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        wanted = dtype.get(name)
+        if pa.types.is_timestamp(column.type):
+            column = column.cast(pa.timestamp('ns'))
+        if wanted is not None and wanted is not object and pd.api.types.is_string_dtype(wanted):
+            values = column.to_pandas(types_mapper={pa.string(): pd.api.types.pandas_dtype(wanted)}.get)
+        else:
+            values = column.to_pandas()
+        if isinstance(wanted, pd.CategoricalDtype) and wanted.categories is not None:
+            # astype() keeps Arrow's category order: unordered dtypes compare equal in any order
+            values = values.cat.set_categories(wanted.categories, ordered=wanted.ordered)
+        columns[name] = values
+    return pd.DataFrame(columns)
+
+
+def _options(dtype, usecols, timestamps):
+    types = {name: _arrow_type(wanted) for name, wanted in dtype.items()}
+    types.update({name: pa.timestamp('s') for name in timestamps})
+    read = pa_csv.ReadOptions(block_size=BLOCK_SIZE, use_threads=True)
+    convert = pa_csv.ConvertOptions(
+        column_types=types,
+        include_columns=list(usecols) if usecols is not None else None,
+        timestamp_parsers=[TIMESTAMP_FORMAT],
+        strings_can_be_null=True
+    )
+    return read, convert
+
+
+def _arrow_chunks(path, dtype, usecols, timestamps, chunksize):
+    """Tables of `chunksize` rows (the last one shorter), parsed as they are read"""
+    read, convert = _options(dtype, usecols, timestamps)
+    reader = pa_csv.open_csv(pa.memory_map(path), read_options=read, convert_options=convert)
+    text = [field.name for field in reader.schema if pa.types.is_string(field.type) and field.name not in dtype]
+    if text:
+        # Arrow types a column once for the file, pd.read_csv per chunk (numbers in the chunks without text)
+        raise pa.ArrowInvalid(f"Columns of text without a dtype: {text}")
+    pending, rows = [], 0
+    for batch in reader:
+        pending.append(batch)
+        rows += batch.num_rows
+        while rows >= chunksize:
+            table = pa.Table.from_batches(pending, schema=reader.schema)
+            yield table.slice(0, chunksize)
+            rest = table.slice(chunksize)
+            pending, rows = rest.to_batches(), rest.num_rows
+    if rows:
+        yield pa.Table.from_batches(pending, schema=reader.schema)
+
+
+def _read_chunks(path, dtype, usecols, timestamps, chunksize):
+    """
+    Frames of `chunksize` rows: Arrow's, then pd.read_csv's from the first
+    row Arrow could not read, with `timestamps` parsed like Arrow's
+    """
+    done = 0
+    try:
+        for table in _arrow_chunks(path, dtype, usecols, timestamps, chunksize):
+            frame = _to_frame(table, dtype)
+            frame.index = pd.RangeIndex(done, done + len(frame))
+            done += len(frame)
+            yield frame
+        return
+    except pa.ArrowException:
+        pass
+    for frame in pd.read_csv(path, dtype=dtype, usecols=usecols, chunksize=chunksize,
+                             skiprows=range(1, done + 1)):
+        frame.index += done
+        for name in timestamps:
+            frame[name] = parse_timestamps(frame[name])
+        yield frame
+
+
+def _arrow_readable(path, kwargs):
+    return (
+        pa is not None
+        and isinstance(path, (str, os.PathLike))
+        and os.path.isfile(path)
+        and os.path.splitext(path)[1].lower() == '.csv'
+        and set(kwargs) <= _ARROW_KWARGS
+    )
+
+
+def read_csv(path, timestamps=(), **kwargs):
+    """
+    pd.read_csv(path, **kwargs), parsed by Arrow where it can be (see the
+    module docstring). `timestamps` are the columns Arrow parses as
+    timestamps; read by pandas they stay strings, except in the chunks of
+    a stream (`chunksize` or `nrows`), which are all datetime64.
+    """
+    if not _arrow_readable(path, kwargs):
+        return pd.read_csv(path, **kwargs)
+
+    dtype = kwargs.get('dtype') or {}
+    usecols = kwargs.get('usecols')
+    if usecols is not None:
+        timestamps = [name for name in timestamps if name in usecols]
+    chunksize, nrows = kwargs.get('chunksize'), kwargs.get('nrows')
+    if chunksize is not None and nrows is not None:
+        return pd.read_csv(path, **kwargs)
+    if chunksize is not None:
+        return _read_chunks(path, dtype, usecols, timestamps, chunksize)
+    if nrows is not None:
+        # The first rows only: the head of a stream, not the whole file
+        for frame in islice(_read_chunks(path, dtype, usecols, timestamps, nrows), 1):
+            return frame
+        return pd.read_csv(path, **kwargs)
+
+    try:
+        read, convert = _options(dtype, usecols, timestamps)
+        table = pa_csv.read_csv(pa.memory_map(path), read_options=read, convert_options=convert)
+    except pa.ArrowException:
+        return pd.read_csv(path, **kwargs)
+    return _to_frame(table, dtype)
@@ -0,0 +1,544 @@
+"""
+In-memory stand-in for the PostgreSQL database, for benchmarking the loader
+without a server.
+
+RecordingConnection accepts the statements DatabaseLoader sends and keeps just
+enough state to answer its queries: rows of INSERT ... VALUES statements are
+kept per table (the first row of an ON CONFLICT (...) key wins, and SERIAL ids
+come from per-table sequences, which nextval() also draws from), and SELECTs
+of plain columns, COUNT(*) or rows matching a temporary table's are answered
+from them, as are counts and sums over a range of a date or timestamp column (the
+loader's reconciliation), and counters are advanced by UPDATE ... SET
+column = column + 1 RETURNING column. Statements only a real server can
+evaluate (DDL, INSERT ... SELECT from a real table) are just recorded. With `partitioned`,
+trip_facts reports being partitioned, the rows written to its partitions
+are kept as its own, and a table attached as a partition replaces the rows
+of its range. Every statement is recorded with the bytes of its SQL, so a benchmark
+measures the client side of a load (row preparation, SQL rendering, round
+trips); server costs such as index maintenance and WAL are not modelled.
+Parameters are rendered in Python, somewhat slower than psycopg2's own
+mogrify.
+"""
+import re
+import struct
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from psycopg2.extensions import adapt
+
+from trip_aggregates import trip_id_hashes
+
+# SERIAL primary key of the tables that have one
+SERIAL_COLUMNS = {
+    'locations': 'location_id',
+    'time_dimensions': 'time_id',
+    'data_quality_log': 'log_id',
+}
+
+_INSERT = re.compile(
+    r'INSERT\s+INTO\s+(\w+)\s*\(([^)]*)\)\s*VALUES.*?(?:ON\s+CONFLICT\s*\(([^)]*)\)(.*))?$',
+    re.IGNORECASE | re.DOTALL
+)
+_INSERT_SELECT = re.compile(
+    r'INSERT\s+INTO\s+(\w+)\s*\(([^)]*)\)\s*SELECT\s+(.*?)\s+FROM\s+(\w+)(?:.*?ON\s+CONFLICT\s*\(([^)]*)\)(.*))?',
+    re.IGNORECASE | re.DOTALL
+)
+_SELECT = re.compile(r'SELECT\s+(.*?)\s+FROM\s+(\w+)(?:\s+WHERE\s+(\w+)\s*=)?', re.IGNORECASE | re.DOTALL)
+_DO_UPDATE = re.compile(r'DO\s+UPDATE\s+SET\s+(.*?)(?:\s+WHERE\s+(.*?))?\s*$', re.IGNORECASE | re.DOTALL)
+_NULL_TEST = re.compile(r'(\w+)\.(\w+)\s+IS\s+(NOT\s+)?NULL', re.IGNORECASE)
+_JOIN = re.compile(
+    r'SELECT\s+(.*?)\s+FROM\s+(\w+)\s+(\w+)\s+JOIN\s+(\w+)\s+(\w+)\s+ON\s+(.*?)\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+_EXCLUDED_RANGE = re.compile(r"NOT\s*\((\w+)\.(\w+)\s*>=\s*'([^']*)'\s+AND\s+\1\.\2\s*<\s*'([^']*)'\)",
+                             re.IGNORECASE)
+_JOIN_CONDITION = re.compile(r'(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)(?:::(\w+(?:\s*\([^)]*\))?))?', re.IGNORECASE)
+_NEXTVAL = re.compile(
+    r"SELECT\s+nextval\(pg_get_serial_sequence\('(\w+)',\s*'(\w+)'\)\)\s+FROM\s+generate_series\(1,\s*(\d+)\)",
+    re.IGNORECASE
+)
+_CREATE_STAGING = re.compile(
+    r'CREATE\s+(TEMP(?:ORARY)?|UNLOGGED)\s+TABLE\s+(\w+)\s*\((.*)\)', re.IGNORECASE | re.DOTALL
+)
+_REGCLASS = re.compile(r"SELECT\s+to_regclass\('(\w+)'\)", re.IGNORECASE)
+_RELKIND = re.compile(r"SELECT\s+relkind\s+FROM\s+pg_class\s+WHERE\s+oid\s*=\s*to_regclass\('(\w+)'\)",
+                      re.IGNORECASE)
+_INHERITS = re.compile(
+    r"SELECT\s+1\s+FROM\s+pg_inherits\s+WHERE\s+inhrelid\s*=\s*to_regclass\('(\w+)'\)"
+    r"\s+AND\s+inhparent\s*=\s*to_regclass\('(\w+)'\)",
+    re.IGNORECASE
+)
+_PARTITION_OF = re.compile(
+    r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s+PARTITION\s+OF\s+(\w+)', re.IGNORECASE
+)
+_RANGE_AGGREGATE = re.compile(
+    r'SELECT\s+(.*?)\s+FROM\s+(\w+)\s+WHERE\s+(\w+)\s*>=\s*\S+\s+AND\s+\3\s*<\s*\S+\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+_SUM = re.compile(r'SUM\((\w+)\)', re.IGNORECASE)
+_ATTACH = re.compile(r'ALTER\s+TABLE\s+(\w+)\s+ATTACH\s+PARTITION\s+(\w+)\s+FOR\s+VALUES', re.IGNORECASE)
+_INCREMENT = re.compile(r'UPDATE\s+(\w+)\s+SET\s+(\w+)\s*=\s*\2\s*\+\s*1\s+RETURNING\s+\2\s*$', re.IGNORECASE)
+_RENAME = re.compile(r'ALTER\s+TABLE\s+(\w+)\s+RENAME\s+TO\s+(\w+)\s*$', re.IGNORECASE)
+_DROP = re.compile(r'DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+_COPY = re.compile(
+    r'COPY\s+(\w+)\s*\(([^)]*)\)\s*FROM\s+STDIN(?:\s+WITH\s*\(\s*FORMAT\s+(\w+)\s*\))?',
+    re.IGNORECASE
+)
+
+_PG_EPOCH = datetime(2000, 1, 1)
+_TEXT_UNESCAPES = {'\\\\': '\\', '\\t': '\t', '\\n': '\n', '\\r': '\r'}
+
+# Decoding of COPY fields by column type: (text, binary)
+_DECODERS = {
+    'integer': (int, lambda b: struct.unpack('>i', b)[0]),
+    'bigint': (int, lambda b: struct.unpack('>q', b)[0]),
+    'double precision': (float, lambda b: struct.unpack('>d', b)[0]),
+    'boolean': (lambda t: t == 't', lambda b: b != b'\x00'),
+    'timestamp': (datetime.fromisoformat,
+                  lambda b: _PG_EPOCH + timedelta(microseconds=struct.unpack('>q', b)[0])),
+    'text': (lambda t: re.sub(r'\\[\\tnr]', lambda m: _TEXT_UNESCAPES[m.group()], t), bytes.decode),
+}
+
+
+def _names(text):
+    """Comma-separated names or expressions (commas inside parentheses do not split)"""
+    names, depth, start = [], 0, 0
+    for i, char in enumerate(text + ','):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            names.append(text[start:i].strip())
+            start = i + 1
+    return [name for name in names if name]
+
+
+class RecordedTable:
+    """Rows of one table, with its conflict index"""
+
+    def __init__(self, name, columns, conflict_columns, nextval):
+        self.name = name
+        self.serial = SERIAL_COLUMNS.get(name)
+        # The SERIAL column is always stored, from `nextval` when not inserted
+        self.columns = list(columns)
+        if self.serial and self.serial not in self.columns:
+            self.columns.insert(0, self.serial)
+        self.rows = []
+        self._nextval = nextval
+        self._conflict = [self.columns.index(c) for c in conflict_columns]
+        self._keys = {}
+
+    def insert(self, columns, rows, action=''):
+        """
+        Insert rows of `columns`; a conflicting row is skipped, or applied per
+        the DO UPDATE SET ... [WHERE ...] clause in `action` (assignments of
+        EXCLUDED columns, CURRENT_TIMESTAMP or table.column + EXCLUDED.column,
+        conditions of IS [NOT] NULL tests). Returns the number of rows
+        inserted or updated.
+        """
+        positions = [columns.index(c) if c in columns else None for c in self.columns]
+        update = _DO_UPDATE.search(action or '')
+        written = 0
+        for row in rows:
+            row = tuple(self._nextval() if i is None else row[i] for i in positions)
+            if self._conflict:
+                key = tuple(row[i] for i in self._conflict)
+                if key in self._keys:
+                    if update and self._update(self._keys[key], row, *update.groups()):
+                        written += 1
+                    continue
+                self._keys[key] = len(self.rows)
+            self.rows.append(row)
+            written += 1
+        return written
+
+    def _update(self, number, excluded, assignments, condition):
+        current = self.rows[number]
+        for table, column, negated in _NULL_TEST.findall(condition or ''):
+            value = (excluded if table.upper() == 'EXCLUDED' else current)[self.columns.index(column)]
+            if (value is None) == bool(negated):
+                return False
+        row = list(current)
+        for assignment in _names(assignments):
+            column, value = (part.strip() for part in assignment.split('=', 1))
+            if column not in self.columns:
+                # A column with a default, never inserted
+                continue
+            position = self.columns.index(column)
+            if value.upper().startswith('EXCLUDED.'):
+                row[position] = excluded[self.columns.index(value.split('.', 1)[1])]
+            elif value.upper().endswith(f'+ EXCLUDED.{column}'.upper()):
+                row[position] = current[position] + excluded[position]
+            elif value.upper() == 'CURRENT_TIMESTAMP':
+                row[position] = datetime.now()
+        self.rows[number] = tuple(row)
+        return True
+
+    def select(self, columns):
+        positions = [self.columns.index(column) for column in columns]
+        return [tuple(row[i] for i in positions) for row in self.rows]
+
+
+def _in_range(value, start, end):
+    """Whether a timestamp is in [start, end), bounds given as 'YYYY-MM-DD'"""
+    return value is not None and start <= str(value)[:10] < end
+
+
+def _aggregate(expression, table, rows):
+    """COUNT(*), [COALESCE(]SUM(column)[, 0)] or SUM(trip_id_hash(column)) over `rows`"""
+    if expression.upper() == 'COUNT(*)':
+        return len(rows)
+    column = table.columns.index(_SUM.search(expression).group(1)) if _SUM.search(expression) else None
+    trip_id_hash = re.search(r'trip_id_hash\((\w+)\)', expression, re.IGNORECASE)
+    if trip_id_hash:
+        column = table.columns.index(trip_id_hash.group(1))
+        return int(trip_id_hashes([row[column] for row in rows]).sum())
+    values = [row[column] for row in rows if row[column] is not None]
+    if any(isinstance(value, float) for value in values):
+        # A DECIMAL column: exact sum of the stored (rounded) values
+        return sum((Decimal(round(value * 1000)) for value in values), Decimal(0)) / 1000
+    return sum(values)
+
+
+def _cast(value, cast):
+    """`value` as compared after `::cast`; DECIMAL(p, s) rounds to s places"""
+    decimal = re.match(r'(?:DECIMAL|NUMERIC)\s*\(\s*\d+\s*,\s*(\d+)\s*\)', cast or '', re.IGNORECASE)
+    if decimal and value is not None:
+        return round(float(value), int(decimal.group(1)))
+    return value
+
+
+def _decode_copy(data, types, copy_format):
+    """Rows of a COPY FROM STDIN payload"""
+    rows = []
+    if copy_format == 'binary':
+        position = 19  # signature, flags and header extension length
+        while True:
+            fields, = struct.unpack_from('>h', data, position)
+            position += 2
+            if fields == -1:
+                return rows
+            row = []
+            for column_type in types:
+                length, = struct.unpack_from('>i', data, position)
+                position += 4
+                if length == -1:
+                    row.append(None)
+                else:
+                    row.append(_DECODERS[column_type][1](data[position:position + length]))
+                    position += length
+            rows.append(tuple(row))
+    for line in data.decode().split('\n')[:-1]:
+        rows.append(tuple(
+            None if field == '\\N' else _DECODERS[column_type][0](field)
+            for field, column_type in zip(line.split('\t'), types)
+        ))
+    return rows
+
+
+class RecordingCursor:
+    """Cursor of a RecordingConnection (the subset of the psycopg2 API the loader uses)"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.query = None
+        self.rowcount = -1
+        self._pending = []
+        self._result = []
+
+    def mogrify(self, query, vars=None):
+        """Render `query` with `vars` the way psycopg2 would; execute_values uses this per row"""
+        if isinstance(query, bytes):
+            query = query.decode()
+        if vars is None:
+            return query.encode()
+        self._pending.append(tuple(vars))
+        return (query % tuple(adapt(v).getquoted().decode() for v in vars)).encode()
+
+    def execute(self, query, vars=None):
+        if vars is not None:
+            query = self.mogrify(query, vars)
+        self.query = query if isinstance(query, bytes) else query.encode()
+        rows, self._pending = self._pending, []
+        self._result = self.connection.run(self.query.decode(), rows)
+        self.rowcount = self.connection.rowcount
+
+    def copy_expert(self, sql, file, size=8192):
+        data = b''.join(iter(lambda: file.read(size), b''))
+        self.query = sql.encode() if isinstance(sql, str) else sql
+        self.connection.copy(self.query.decode(), data)
+
+    def fetchall(self):
+        result, self._result = self._result, []
+        return result
+
+    def fetchmany(self, size=1):
+        result, self._result = self._result[:size], self._result[size:]
+        return result
+
+    def fetchone(self):
+        return self._result.pop(0) if self._result else None
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    """psycopg2-like connection to an in-memory database (see module docstring)"""
+
+    encoding = 'UTF8'
+    closed = 0
+
+    def __init__(self, partitioned=False):
+        self.tables = {}
+        # Partition -> partitioned table, with `partitioned` (trip_facts only)
+        self.partitioned = {'trip_facts'} if partitioned else set()
+        self.partitions = {}
+        self.statements = Counter()
+        self.bytes_sent = 0
+        self.commits = 0
+        self.rowcount = -1
+        # Temporary and UNLOGGED staging tables: name -> (columns, types, rows)
+        self.staging = {}
+        # Staging tables dropped on commit or rollback
+        self._temporary = set()
+        # Last value of each table's SERIAL sequence
+        self.sequences = Counter()
+        # Time spent emulating the server, to subtract from client timings
+        self.server_s = 0.0
+
+    def cursor(self, *args, **kwargs):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+        self._drop_temporary()
+
+    def rollback(self):
+        self._drop_temporary()
+
+    def _drop_temporary(self):
+        for name in self._temporary:
+            self.staging.pop(name, None)
+        self._temporary.clear()
+
+    def close(self):
+        pass
+
+    def nextval(self, name):
+        self.sequences[name] += 1
+        return self.sequences[name]
+
+    def _table(self, name, columns, conflict_columns):
+        name = self.partitions.get(name, name)
+        if name not in self.tables:
+            self.tables[name] = RecordedTable(name, columns, conflict_columns,
+                                              lambda: self.nextval(name))
+        return self.tables[name]
+
+    def run(self, sql, rows):
+        """Apply one statement; `rows` are the parameter tuples rendered into it"""
+        started = time.perf_counter()
+        try:
+            return self._run(sql.strip(), rows)
+        finally:
+            self.server_s += time.perf_counter() - started
+
+    def copy(self, sql, data):
+        """Apply a COPY FROM STDIN of `data` into a temporary table"""
+        started = time.perf_counter()
+        self.bytes_sent += len(sql) + len(data)
+        copy = _COPY.match(sql.strip())
+        name, columns = copy.group(1), _names(copy.group(2))
+        self.statements[f'copy {name}'] += 1
+        staged_columns, types, rows = self.staging[name]
+        rows.extend(_decode_copy(data, [types[staged_columns.index(c)] for c in columns],
+                                 (copy.group(3) or 'text').lower()))
+        self.server_s += time.perf_counter() - started
+
+    def _run(self, sql, rows):
+        self.bytes_sent += len(sql)
+        self.rowcount = -1
+        insert = _INSERT_SELECT.match(sql)
+        if insert:
+            name, source = insert.group(1), insert.group(4)
+            self.statements[f'insert {name}'] += 1
+            if source not in self.staging:
+                # From a real table (e.g. a backfill): not evaluated
+                return []
+            staged_columns, _, staged_rows = self.staging[source]
+            positions = [staged_columns.index(c) for c in _names(insert.group(3))]
+            columns = _names(insert.group(2))
+            table = self._table(name, columns, _names(insert.group(5) or ''))
+            self.rowcount = table.insert(columns, (tuple(row[i] for i in positions) for row in staged_rows),
+                                         insert.group(6))
+            return []
+
+        insert = _INSERT.match(sql)
+        if insert:
+            name = insert.group(1)
+            self.statements[f'insert {name}'] += 1
+            columns = _names(insert.group(2))
+            if name in self.staging:
+                staged_columns, _, staged_rows = self.staging[name]
+                positions = [columns.index(c) for c in staged_columns]
+                staged_rows.extend(tuple(row[i] for i in positions) for row in rows)
+            else:
+                table = self._table(name, columns, _names(insert.group(3) or ''))
+                self.rowcount = table.insert(columns, rows, insert.group(4))
+            return []
+
+        nextval = _NEXTVAL.match(sql)
+        if nextval:
+            self.statements[f'nextval {nextval.group(1)}'] += 1
+            return [(self.nextval(nextval.group(1)),) for _ in range(int(nextval.group(3)))]
+
+        join = _JOIN.match(sql)
+        if join:
+            return self._join(*join.groups())
+
+        regclass = _REGCLASS.match(sql)
+        if regclass:
+            return [(regclass.group(1) if regclass.group(1) in self.tables else None,)]
+
+        relkind = _RELKIND.match(sql)
+        if relkind:
+            self.statements['select pg_class'] += 1
+            return [('p' if relkind.group(1) in self.partitioned else 'r',)]
+
+        inherits = _INHERITS.match(sql)
+        if inherits:
+            self.statements['select pg_inherits'] += 1
+            return [(1,)] if self.partitions.get(inherits.group(1)) == inherits.group(2) else []
+
+        partition = _PARTITION_OF.match(sql)
+        if partition:
+            self.statements['create partition'] += 1
+            if partition.group(2) in self.partitioned:
+                self.partitions[partition.group(1)] = partition.group(2)
+            return []
+
+        aggregate = _RANGE_AGGREGATE.match(sql)
+        if aggregate:
+            expressions, name, column = _names(aggregate.group(1)), aggregate.group(2), aggregate.group(3)
+            self.statements[f'select {name}'] += 1
+            table = self.tables.get(self.partitions.get(name, name))
+            if table is None:
+                return [tuple(0 for _ in expressions)]
+            position, (start, end) = table.columns.index(column), rows[0]
+            matching = [row for row in table.rows if _in_range(row[position], start, end)]
+            return [tuple(_aggregate(expression, table, matching) for expression in expressions)]
+
+        increment = _INCREMENT.match(sql)
+        if increment and increment.group(1) in self.tables:
+            # A counter (e.g. trip_facts' generation), advanced in every row
+            self.statements[f'update {increment.group(1)}'] += 1
+            table = self.tables[increment.group(1)]
+            position = table.columns.index(increment.group(2))
+            table.rows = [row[:position] + (row[position] + 1,) + row[position + 1:] for row in table.rows]
+            self.rowcount = len(table.rows)
+            return [(row[position],) for row in table.rows]
+
+        rename = _RENAME.match(sql)
+        if rename and rename.group(1) in self.tables:
+            self.statements['alter table'] += 1
+            table = self.tables.pop(rename.group(1))
+            table.name = rename.group(2)
+            self.tables[rename.group(2)] = table
+            return []
+
+        attach = _ATTACH.match(sql)
+        if attach and attach.group(1) in self.partitioned and attach.group(2) in self.tables:
+            # The attached table's rows replace those of its range
+            self.statements['alter table'] += 1
+            parent, attached = self.tables.get(attach.group(1)), self.tables.pop(attach.group(2))
+            self.partitions[attach.group(2)] = attach.group(1)
+            if parent is None:
+                attached.name = attach.group(1)
+                self.tables[attach.group(1)] = attached
+                return []
+            (start, end), position = rows[0], parent.columns.index('pickup_datetime')
+            kept = [row for row in parent.rows if not _in_range(row[position], start, end)]
+            parent.rows, parent._keys = [], {}
+            parent.insert(parent.columns, kept + attached.select(parent.columns))
+            return []
+
+        drop = _DROP.match(sql)
+        if drop and drop.group(1) in self.staging:
+            del self.staging[drop.group(1)]
+            self.statements['drop table'] += 1
+            return []
+
+        create = _CREATE_STAGING.match(sql)
+        if create:
+            kind, name = create.group(1).lower(), create.group(2)
+            definitions = [d.split(None, 1) for d in _names(create.group(3))]
+            self.staging[name] = ([d[0] for d in definitions], [d[1] for d in definitions], [])
+            if kind != 'unlogged':
+                self._temporary.add(name)
+            self.statements[f'create {kind} table'] += 1
+            return []
+
+        select = _SELECT.match(sql)
+        if select:
+            expressions, name, where = _names(select.group(1)), select.group(2), select.group(3)
+            self.statements[f'select {name}'] += 1
+            table = self.tables.get(self.partitions.get(name, name))
+            if name.startswith('pg_'):
+                # System catalogs are empty: no indexes or constraints to report
+                return []
+            if expressions == ['COUNT(*)']:
+                return [(len(table.rows) if table else 0,)]
+            if any('(' in e for e in expressions):
+                # Aggregates other than COUNT(*) are not evaluated
+                return [(None,) * len(expressions)]
+            if table is None:
+                return []
+            if where:
+                # WHERE column = %s: the one parameter
+                position = table.columns.index(where)
+                return [row for row, full in zip(table.select(expressions), table.rows)
+                        if full[position] == rows[0][0]]
+            return table.select(expressions)
+
+        self.statements[sql.split(None, 1)[0].lower()] += 1
+        return []
+
+    def _join(self, expressions, name, alias, stage, stage_alias, condition):
+        """SELECT of a table's rows matching the rows of a temporary table, on equal columns"""
+        self.statements[f'select {name}'] += 1
+        table = self.tables.get(self.partitions.get(name, name))
+        if table is None:
+            return []
+        staged_columns, _, staged_rows = self.staging[stage]
+        pairs = []
+        for left, left_column, right, right_column, cast in _JOIN_CONDITION.findall(condition):
+            if left != alias:
+                left_column, right_column = right_column, left_column
+            pairs.append((table.columns.index(left_column), staged_columns.index(right_column), cast))
+        wanted = {tuple(_cast(row[j], cast) for _, j, cast in pairs) for row in staged_rows}
+        # AND NOT (alias.column >= start AND alias.column < end): rows outside ranges
+        excluded = [(table.columns.index(column), start, end)
+                    for _, column, start, end in _EXCLUDED_RANGE.findall(condition)]
+        positions = [table.columns.index(e.split('.', 1)[-1]) for e in _names(expressions)]
+        return [
+            tuple(row[i] for i in positions) for row in table.rows
+            if tuple(_cast(row[i], cast) for i, _, cast in pairs) in wanted
+            and not any(_in_range(row[i], start, end) for i, start, end in excluded)
+        ]
+
+    def stats(self):
+        """Statement counts, bytes of SQL and rows per table"""
+        return {
+            'statements': dict(self.statements),
+            'bytes_sent': self.bytes_sent,
+            'commits': self.commits,
+            'server_s': round(self.server_s, 4),
+            'rows': {name: len(table.rows) for name, table in self.tables.items()},
+        }
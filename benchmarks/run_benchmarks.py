@@ -0,0 +1,208 @@
+"""
+Benchmark harness for the cleaning and loading pipelines.
+
+Generates (or reuses) a synthetic train.csv, runs NYCTaxiDataCleaner on it and
+loads the cleaned CSV with DatabaseLoader, by default into the in-memory
+stand-in of recording_db.py (pass --db-host etc. to use a throwaway Postgres
+instead). The per-stage performance of both is written as JSON, together with
+the commit and environment, so runs of different commits can be compared.
+
+Usage:
+    python benchmarks/run_benchmarks.py --rows 1M
+    python benchmarks/run_benchmarks.py --rows 10M --chunk-size 1000000 --compare benchmarks/results/base.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'database'))
+
+from data_cleaning import NYCTaxiDataCleaner
+from recording_db import RecordingConnection
+from synthetic_data import parse_rows, write_synthetic_csv
+
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Commit and machine the results were measured on"""
+    status = _git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': _git('rev-parse', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def synthetic_input(work_dir, rows, seed):
+    """Path of the synthetic CSV for (rows, seed), generated on first use"""
+    path = os.path.join(work_dir, f'synthetic_{rows}_{seed}.csv')
+    if not os.path.exists(path):
+        print(f"Generating {rows} rows into {path}...")
+        started = time.perf_counter()
+        write_synthetic_csv(f'{path}.tmp', rows, seed)
+        os.replace(f'{path}.tmp', path)
+        print(f"Generated in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+def benchmark_cleaner(input_path, output_dir, args):
+    cleaner = NYCTaxiDataCleaner(
+        input_path if args.workers is None else [input_path],
+        output_dir=output_dir,
+        chunk_size=args.chunk_size,
+        workers=args.workers
+    )
+    cleaner.run_pipeline()
+    return {
+        'final_records': cleaner.cleaning_log['statistics']['final_record_count'],
+        'performance': cleaner.performance.summary()
+    }, os.path.join(output_dir, 'cleaned_train.csv')
+
+
+def benchmark_loader(csv_path, args):
+    from load_data_to_db import DatabaseLoader
+    from taxi_zones import ZoneIndex
+
+    zone_index = ZoneIndex.from_geojson(args.zones) if args.zones else None
+    loader = DatabaseLoader(args.db_host, args.db_name, args.db_user, args.db_password, args.db_port,
+                            zone_index, args.method, args.copy_format, args.load_workers, args.bulk,
+                            pipeline_depth=args.pipeline_depth, prepare_threads=args.prepare_threads,
+                            commit_every=args.commit_every)
+    if args.db_host:
+        if not loader.connect():
+            raise SystemExit('Could not connect to the benchmark database')
+        database = None
+    else:
+        database = RecordingConnection()
+        loader.use_connection(database)
+
+    df = loader.load_csv(csv_path)
+    success = loader.load(df, args.batch_size)
+    loader.close()
+    return {
+        'database': 'postgres' if database is None else 'recording',
+        'success': success,
+        'performance': loader.performance.summary(),
+        **({'recorded': database.stats()} if database is not None else {})
+    }
+
+
+def compare(results, baseline_path):
+    """Print per-stage wall times against a baseline results file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline['environment']['commit']}):")
+    print(f"{'stage':<40}{'baseline s':>12}{'current s':>12}{'ratio':>8}")
+    for part in ('cleaner', 'loader'):
+        if part not in results or part not in baseline:
+            continue
+        before = {s['stage']: s for s in baseline[part]['performance']['stages']}
+        for stage in results[part]['performance']['stages']:
+            old = before.get(stage['stage'])
+            old_wall = old['wall_s'] if old else None
+            ratio = f"{stage['wall_s'] / old_wall:.2f}" if old_wall else '-'
+            old_text = f"{old_wall:.2f}" if old_wall is not None else '-'
+            print(f"{part + '.' + stage['stage']:<40}{old_text:>12}{stage['wall_s']:>12.2f}{ratio:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the NYC taxi cleaning and loading pipelines')
+    parser.add_argument('--rows', default='1M', help='Synthetic rows to generate, e.g. 1M, 10M, 100M')
+    parser.add_argument('--input', help='Benchmark this CSV instead of synthetic data')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic data')
+    parser.add_argument('--work-dir', default=os.path.join(BENCHMARK_DIR, 'work'),
+                        help='Directory for the synthetic input and the cleaner output')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Run the cleaner in streaming mode')
+    parser.add_argument('--workers', type=int, default=None, help='Run the cleaner in parallel mode')
+    parser.add_argument('--skip-loader', action='store_true', help='Only benchmark the cleaner')
+    parser.add_argument('--batch-size', type=int, default=None, help='Loader rows per batch')
+    parser.add_argument('--commit-every', type=int, default=1, help='Loader batches per transaction')
+    parser.add_argument('--pipeline-depth', type=int, default=2,
+                        help='Loader batches prepared ahead of the writes (0 for none)')
+    parser.add_argument('--prepare-threads', type=int, default=1, help='Loader threads preparing batches')
+    parser.add_argument('--method', choices=['insert', 'copy'], default='insert', help='Loader method')
+    parser.add_argument('--copy-format', choices=['binary', 'text'], default='binary',
+                        help='COPY format of --method copy')
+    parser.add_argument('--load-workers', type=int, default=None,
+                        help='Load trip_facts on N connections (needs --db-host)')
+    parser.add_argument('--bulk', action='store_true', help='Loader bulk mode (staged, indexes rebuilt)')
+    parser.add_argument('--zones', help='Taxi zone GeoJSON for the loader to assign zones from')
+    parser.add_argument('--db-host', help='Load into this (throwaway!) Postgres instead of the stand-in')
+    parser.add_argument('--db-name', default='nyc_taxi_benchmark', help='Database name')
+    parser.add_argument('--db-user', default='postgres', help='Database user')
+    parser.add_argument('--db-password', default='postgres', help='Database password')
+    parser.add_argument('--db-port', type=int, default=5432, help='Database port')
+    parser.add_argument('--output', help='Results JSON (default benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', metavar='BASELINE_JSON', help='Print stage times against these results')
+    args = parser.parse_args()
+    if args.load_workers and not args.db_host:
+        # Worker processes cannot share the in-memory stand-in
+        parser.error('--load-workers needs --db-host')
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    if args.input:
+        input_path = args.input
+    else:
+        input_path = synthetic_input(args.work_dir, parse_rows(args.rows), args.seed)
+
+    results = {
+        'environment': environment(),
+        'parameters': {
+            'input': input_path,
+            'rows': None if args.input else parse_rows(args.rows),
+            'seed': None if args.input else args.seed,
+            'chunk_size': args.chunk_size,
+            'workers': args.workers,
+            'batch_size': args.batch_size,
+            'commit_every': args.commit_every,
+            'pipeline_depth': args.pipeline_depth,
+            'prepare_threads': args.prepare_threads,
+            'method': args.method,
+            'copy_format': args.copy_format,
+            'load_workers': args.load_workers,
+            'bulk': args.bulk,
+            'zones': args.zones
+        }
+    }
+
+    results['cleaner'], cleaned_path = benchmark_cleaner(input_path, os.path.join(args.work_dir, 'data'), args)
+    if not args.skip_loader:
+        results['loader'] = benchmark_loader(cleaned_path, args)
+
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, 'results', f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
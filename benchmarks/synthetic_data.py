@@ -0,0 +1,200 @@
+"""
+Synthetic train.csv generator for benchmarking the cleaning and loading pipelines.
+
+Produces the Kaggle NYC taxi schema at any scale (rows are generated and
+written chunk by chunk, so 100M rows need no more memory than 1M) and
+injects the defects the cleaner removes at configurable rates. The same
+seed always gives the same file.
+
+Usage:
+    python benchmarks/synthetic_data.py --rows 10M --output synthetic_train.csv
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cleaning_rules import haversine_distance
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# Fraction of rows given each defect (roughly the rates seen in train.csv,
+# with duplicates and missing values added since the cleaner handles them)
+DEFAULT_DEFECT_RATES = {
+    'missing_values': 0.0005,
+    'duplicate_id': 0.001,
+    'invalid_time_sequence': 0.0002,
+    'outside_nyc': 0.002,
+    'zero_coordinates': 0.0005,
+    'bad_duration': 0.006,
+    'bad_passenger_count': 0.0005
+}
+
+# Relative trip demand per pickup hour (0-23)
+_HOURLY_DEMAND = np.array([
+    3.6, 2.6, 1.9, 1.4, 1.1, 1.0, 2.3, 3.8, 4.6, 4.6, 4.4, 4.6,
+    4.8, 4.8, 5.0, 4.8, 4.3, 4.9, 6.1, 6.3, 5.7, 5.6, 5.5, 4.6
+])
+_HOURLY_DEMAND = _HOURLY_DEMAND / _HOURLY_DEMAND.sum()
+
+_PASSENGERS = np.arange(1, 7)
+_PASSENGER_SHARES = np.array([0.71, 0.14, 0.04, 0.02, 0.06, 0.03])
+
+_PERIOD_START = np.datetime64('2016-01-01T00:00:00', 's')
+_PERIOD_DAYS = 182
+
+_SCALE_SUFFIXES = {'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}
+
+
+def parse_rows(value):
+    """'1M' / '10M' / '250K' / '1000' -> number of rows"""
+    value = str(value).strip().upper()
+    if value[-1:] in _SCALE_SUFFIXES:
+        return int(float(value[:-1]) * _SCALE_SUFFIXES[value[-1]])
+    return int(value)
+
+
+def _trip_ids(numbers, total_rows):
+    """Unique, shuffled-looking 'id<digits>' ids for row numbers 0..total_rows-1"""
+    digits = max(7, len(str(total_rows)))
+    modulus = 10 ** digits
+    # An affine map with a multiplier coprime to 10**digits is a bijection
+    scrambled = (numbers.astype(np.int64) * 7_919_987 + 1_234_567) % modulus
+    return ('id' + pd.Series(scrambled).astype(str).str.zfill(digits)).to_numpy(dtype=object)
+
+
+def _clean_chunk(rng, start, size, total_rows):
+    """`size` valid trips numbered from `start`"""
+    numbers = np.arange(start, start + size)
+    days = rng.integers(0, _PERIOD_DAYS, size)
+    hours = rng.choice(24, size=size, p=_HOURLY_DEMAND)
+    seconds = days * 86400 + hours * 3600 + rng.integers(0, 3600, size)
+    pickup = _PERIOD_START + seconds.astype('timedelta64[s]')
+
+    pickup_lat = rng.normal(40.752, 0.028, size)
+    pickup_lon = rng.normal(-73.975, 0.025, size)
+    dropoff_lat = pickup_lat + rng.normal(0, 0.025, size)
+    dropoff_lon = pickup_lon + rng.normal(0, 0.025, size)
+    # Keep valid trips inside the bounding box the cleaner enforces
+    pickup_lat, dropoff_lat = np.clip(pickup_lat, 40.55, 40.95), np.clip(dropoff_lat, 40.55, 40.95)
+    pickup_lon, dropoff_lon = np.clip(pickup_lon, -74.25, -73.75), np.clip(dropoff_lon, -74.25, -73.75)
+
+    distance = haversine_distance(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon)
+    speed = np.clip(rng.lognormal(np.log(14), 0.35, size), 3, 80)
+    duration = np.maximum(61, (distance / speed * 3600 + rng.integers(60, 240, size)).astype(np.int64))
+
+    return pd.DataFrame({
+        'id': _trip_ids(numbers, total_rows),
+        'vendor_id': rng.choice([1, 2], size=size, p=[0.47, 0.53]),
+        'pickup_datetime': pickup,
+        'dropoff_datetime': pickup + duration.astype('timedelta64[s]'),
+        'passenger_count': rng.choice(_PASSENGERS, size=size, p=_PASSENGER_SHARES).astype(float),
+        'pickup_longitude': pickup_lon,
+        'pickup_latitude': pickup_lat,
+        'dropoff_longitude': dropoff_lon,
+        'dropoff_latitude': dropoff_lat,
+        'store_and_fwd_flag': np.where(rng.random(size) < 0.994, 'N', 'Y'),
+        'trip_duration': duration
+    })
+
+
+def _inject_defects(rng, df, start, total_rows, rates):
+    """Damage random rows in place; each defect hits about rate * len(df) rows"""
+    size = len(df)
+
+    def pick(defect):
+        return np.flatnonzero(rng.random(size) < rates.get(defect, 0.0))
+
+    rows = pick('outside_nyc')
+    df.loc[rows, 'pickup_longitude'] = rng.uniform(-75.5, -74.5, len(rows))
+
+    rows = pick('zero_coordinates')
+    df.loc[rows, ['dropoff_latitude', 'dropoff_longitude']] = 0.0
+
+    rows = pick('bad_duration')
+    too_long = rng.random(len(rows)) < 0.1
+    durations = np.where(too_long, rng.integers(86_401, 3_500_000, len(rows)), rng.integers(1, 60, len(rows)))
+    df.loc[rows, 'trip_duration'] = durations
+    df.loc[rows, 'dropoff_datetime'] = (
+        df.loc[rows, 'pickup_datetime'].to_numpy() + durations.astype('timedelta64[s]')
+    )
+
+    rows = pick('invalid_time_sequence')
+    df.loc[rows, 'dropoff_datetime'] = (
+        df.loc[rows, 'pickup_datetime'].to_numpy() - rng.integers(1, 3600, len(rows)).astype('timedelta64[s]')
+    )
+
+    rows = pick('bad_passenger_count')
+    df.loc[rows, 'passenger_count'] = rng.choice([0, 7, 8, 9], size=len(rows))
+
+    rows = pick('missing_values')
+    df.loc[rows, 'passenger_count'] = np.nan
+
+    # Re-use the id of an earlier trip (earlier in the file, not just the chunk)
+    rows = pick('duplicate_id')
+    rows = rows[start + rows > 0]
+    earlier = (rng.random(len(rows)) * (start + rows)).astype(np.int64)
+    df.loc[rows, 'id'] = _trip_ids(earlier, total_rows)
+
+
+def generate_chunks(rows, seed=42, chunk_size=1_000_000, defect_rates=None):
+    """Yield the synthetic dataset as DataFrames of at most `chunk_size` rows"""
+    rates = DEFAULT_DEFECT_RATES if defect_rates is None else defect_rates
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, chunk_size):
+        df = _clean_chunk(rng, start, min(chunk_size, rows - start), rows)
+        _inject_defects(rng, df, start, rows, rates)
+        yield df
+
+
+def _write_chunk(df, f, header):
+    for column in ('pickup_datetime', 'dropoff_datetime'):
+        # Whole seconds, written as 'YYYY-MM-DD HH:MM:SS'
+        df[column] = df[column].to_numpy().astype('datetime64[s]')
+    if pa is not None:
+        if header:
+            f.write((','.join(df.columns) + '\n').encode())
+        # Ids, flags and numbers never need quoting
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pa_csv.write_csv(table, f, pa_csv.WriteOptions(include_header=False, quoting_style='none'))
+    else:
+        f.write(df.to_csv(index=False, header=header, date_format='%Y-%m-%d %H:%M:%S').encode())
+
+
+def write_synthetic_csv(path, rows, seed=42, chunk_size=1_000_000, defect_rates=None):
+    """Write a synthetic train.csv; returns the number of rows written"""
+    written = 0
+    with open(path, 'wb') as f:
+        for df in generate_chunks(rows, seed, chunk_size, defect_rates):
+            # Whole passenger counts as in train.csv, blank when missing
+            df['passenger_count'] = df['passenger_count'].astype('Int64')
+            _write_chunk(df, f, header=written == 0)
+            written += len(df)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic NYC taxi train.csv')
+    parser.add_argument('--rows', default='1M', help='Number of rows, e.g. 1M, 10M, 100M')
+    parser.add_argument('--output', default='synthetic_train.csv', help='Path of the CSV to write')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help='Rows generated at a time')
+    for defect, rate in DEFAULT_DEFECT_RATES.items():
+        parser.add_argument(f"--{defect.replace('_', '-')}-rate", type=float, default=rate,
+                            dest=f'{defect}_rate', help=f'Fraction of rows with {defect} (default {rate})')
+    args = parser.parse_args()
+
+    rates = {defect: getattr(args, f'{defect}_rate') for defect in DEFAULT_DEFECT_RATES}
+    rows = write_synthetic_csv(args.output, parse_rows(args.rows), args.seed, args.chunk_size, rates)
+    print(f"Wrote {rows} rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
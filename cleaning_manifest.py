@@ -0,0 +1,86 @@
+"""
+Manifest of the input files an incremental cleaning run has already processed.
+
+Inputs are identified by content hash, so renamed or re-delivered files are
+recognised; the hash of an unchanged file (same size and mtime) is reused
+instead of being recomputed. The manifest also records the pipeline version
+and output format it was built with; when either changes, or an input that
+was already cleaned changes content, the output has to be rebuilt.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CleaningManifest:
+    """Processed inputs of an incremental output directory (see module docstring)"""
+
+    def __init__(self, path, pipeline_version, output_format):
+        self.path = path
+        self.pipeline_version = pipeline_version
+        self.output_format = output_format
+        self.runs = 0
+        self.inputs = {}
+        # Size of the cleaned CSV after the last committed run (CSV output only)
+        self.output_bytes = 0
+
+    @classmethod
+    def load(cls, path):
+        """The saved manifest, or None when there is none"""
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            data = json.load(f)
+        manifest = cls(path, data['pipeline_version'], data['output_format'])
+        manifest.runs = data['runs']
+        manifest.inputs = data['inputs']
+        manifest.output_bytes = data['output_bytes']
+        return manifest
+
+    def save(self):
+        """Write atomically; the manifest is the commit point of a run"""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({
+                'pipeline_version': self.pipeline_version,
+                'output_format': self.output_format,
+                'runs': self.runs,
+                'output_bytes': self.output_bytes,
+                'inputs': self.inputs
+            }, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def fingerprint(self, path):
+        """Content hash, size and mtime of an input file"""
+        stat = os.stat(path)
+        known = self.inputs.get(os.path.abspath(path))
+        if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+            sha256 = known['sha256']
+        else:
+            sha256 = file_sha256(path)
+        return {'sha256': sha256, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def is_changed(self, path, fingerprint):
+        """Whether `path` was cleaned before with different content"""
+        known = self.inputs.get(os.path.abspath(path))
+        return known is not None and known['sha256'] != fingerprint['sha256']
+
+    def is_processed(self, fingerprint):
+        """Whether this content was already cleaned (under any path)"""
+        return any(entry['sha256'] == fingerprint['sha256'] for entry in self.inputs.values())
+
+    def record(self, path, fingerprint, **details):
+        self.inputs[os.path.abspath(path)] = {
+            **fingerprint,
+            **details,
+            'cleaned_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
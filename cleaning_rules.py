@@ -0,0 +1,247 @@
+import numpy as np
+import pandas as pd
+
+# NYC bounding box (approximate)
+# Latitude: 40.5 to 41.0
+# Longitude: -74.3 to -73.7
+VALID_LAT_MIN, VALID_LAT_MAX = 40.5, 41.0
+VALID_LON_MIN, VALID_LON_MAX = -74.3, -73.7
+
+# Trip duration limits in seconds (1 minute to 24 hours)
+MIN_DURATION = 60
+MAX_DURATION = 24 * 3600
+
+# NYC taxis typically accommodate 1-6 passengers
+MIN_PASSENGERS, MAX_PASSENGERS = 1, 6
+
+# Realistic speed range for completed trips (km/h)
+MIN_SPEED, MAX_SPEED = 1, 120
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great circle distance between two points
+    on the earth (specified in decimal degrees)
+    Returns distance in kilometers
+    """
+    # Convert to radians
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+
+    # Haversine formula
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+
+    # Radius of earth in kilometers
+    r = 6371
+
+    return c * r
+
+
+def iqr_bounds(durations):
+    """Outlier bounds at 3 * IQR beyond the quartiles"""
+    Q1 = durations.quantile(0.25)
+    Q3 = durations.quantile(0.75)
+    IQR = Q3 - Q1
+
+    return Q1 - 3 * IQR, Q3 + 3 * IQR
+
+
+class Rule:
+    """
+    One row-level cleaning rule.
+
+    `check(df, alive, context)` returns a boolean array that is True for the
+    rows failing the rule. Rules with `needs_survivors` only judge the rows
+    that passed every earlier rule (`alive`), e.g. keep-first duplicate
+    detection or the IQR bounds; all other rules look at every row.
+    `category` is the removed_records entry the rule reports under.
+    """
+
+    def __init__(self, name, category, description, check, needs_survivors=False):
+        self.name = name
+        self.category = category
+        self.description = description
+        self.check = check
+        self.needs_survivors = needs_survivors
+
+
+def _missing_values(df, alive, context):
+    return df.isnull().any(axis=1).to_numpy()
+
+
+def _duplicate_id(df, alive, context):
+    failed = np.zeros(len(df), dtype=bool)
+
+    known = context.get('duplicate_positions')
+    if known is not None:
+        # Parallel mode: decided globally, as positions among the rows alive here
+        failed[np.flatnonzero(alive)[known]] = True
+        return failed
+
+    ids = df['id'].to_numpy()[alive]
+    seen_ids = context.get('seen_ids')
+    if seen_ids is not None:
+        # Streaming: ids from earlier chunks count as duplicates too
+        is_new = seen_ids.mark_new(ids)
+    else:
+        is_new = ~pd.Series(ids).duplicated(keep='first').to_numpy()
+
+    failed[alive] = ~is_new
+    return failed
+
+
+def _invalid_time_sequence(df, alive, context):
+    return (df['dropoff_datetime'] <= df['pickup_datetime']).to_numpy()
+
+
+def _outside_nyc(df, alive, context):
+    valid_pickup = (
+        (df['pickup_latitude'] >= VALID_LAT_MIN) &
+        (df['pickup_latitude'] <= VALID_LAT_MAX) &
+        (df['pickup_longitude'] >= VALID_LON_MIN) &
+        (df['pickup_longitude'] <= VALID_LON_MAX)
+    )
+    valid_dropoff = (
+        (df['dropoff_latitude'] >= VALID_LAT_MIN) &
+        (df['dropoff_latitude'] <= VALID_LAT_MAX) &
+        (df['dropoff_longitude'] >= VALID_LON_MIN) &
+        (df['dropoff_longitude'] <= VALID_LON_MAX)
+    )
+    return (~(valid_pickup & valid_dropoff)).to_numpy()
+
+
+def _zero_coordinates(df, alive, context):
+    return (
+        (df['pickup_latitude'] == 0) |
+        (df['pickup_longitude'] == 0) |
+        (df['dropoff_latitude'] == 0) |
+        (df['dropoff_longitude'] == 0)
+    ).to_numpy()
+
+
+def _duration_out_of_range(df, alive, context):
+    return (
+        (df['trip_duration'] <= MIN_DURATION) |
+        (df['trip_duration'] > MAX_DURATION)
+    ).to_numpy()
+
+
+def _duration_outlier(df, alive, context):
+    # Bounds are fixed up front when streaming, otherwise taken from the
+    # durations that survived every earlier rule
+    bounds = context.get('duration_bounds')
+    if bounds is None:
+        bounds = iqr_bounds(df['trip_duration'][alive])
+    lower_bound, upper_bound = bounds
+
+    failed = (
+        (df['trip_duration'] < lower_bound) |
+        (df['trip_duration'] > upper_bound)
+    ).to_numpy()
+    return failed & alive
+
+
+def _invalid_passenger_count(df, alive, context):
+    return (
+        (df['passenger_count'] < MIN_PASSENGERS) |
+        (df['passenger_count'] > MAX_PASSENGERS)
+    ).to_numpy()
+
+
+def _unrealistic_speed(df, alive, context):
+    distance = haversine_distance(
+        df['pickup_latitude'].to_numpy(), df['pickup_longitude'].to_numpy(),
+        df['dropoff_latitude'].to_numpy(), df['dropoff_longitude'].to_numpy()
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = distance / (df['trip_duration'].to_numpy() / 3600)
+
+    # Kept so the derived features do not have to be recomputed
+    context['trip_distance_km'] = distance
+    context['trip_speed_kmh'] = speed
+    return ~((speed >= MIN_SPEED) & (speed <= MAX_SPEED))
+
+
+def _already_loaded(df, alive, context):
+    # Last, so the other rules and the IQR bounds see the same rows with or without it
+    failed = np.zeros(len(df), dtype=bool)
+    loaded_ids = context.get('loaded_ids')
+    if loaded_ids is not None:
+        failed[alive] = loaded_ids.contains(df['id'].to_numpy()[alive])
+    return failed
+
+
+# Rules in pipeline order; a removed row is attributed to the first rule it fails
+CLEANING_RULES = [
+    Rule('missing_values', 'missing_values', 'records with missing values', _missing_values),
+    Rule('duplicate_id', 'duplicates', 'duplicate IDs', _duplicate_id, needs_survivors=True),
+    Rule('invalid_time_sequence', None, 'records with invalid time sequence', _invalid_time_sequence),
+    Rule('outside_nyc', 'invalid_coordinates', 'records with coordinates outside NYC', _outside_nyc),
+    Rule('zero_coordinates', 'invalid_coordinates', 'records with zero coordinates', _zero_coordinates),
+    Rule('duration_out_of_range', 'invalid_duration',
+         'records with invalid duration (< 1 min or > 24 hours)', _duration_out_of_range),
+    Rule('duration_outlier', 'invalid_duration', 'statistical outliers in trip duration',
+         _duration_outlier, needs_survivors=True),
+    Rule('invalid_passenger_count', 'invalid_passengers', 'records with invalid passenger count',
+         _invalid_passenger_count),
+    Rule('unrealistic_speed', None, 'records with unrealistic speed', _unrealistic_speed),
+    Rule('already_loaded', 'already_loaded', 'trips already loaded into the database', _already_loaded,
+         needs_survivors=True),
+]
+
+
+class ValidationResult:
+    """Per-row reason bitmask (bit i set = rule i failed) and what it implies"""
+
+    def __init__(self, rules, reasons):
+        self.rules = rules
+        self.reasons = reasons
+
+    @property
+    def valid(self):
+        return self.reasons == 0
+
+    def _bit(self, rule_name):
+        return 1 << [rule.name for rule in self.rules].index(rule_name)
+
+    def failed(self, rule_name):
+        """Rows failing `rule_name`, whatever else they failed"""
+        return (self.reasons & self._bit(rule_name)) != 0
+
+    def first_failed(self, rule_name):
+        """Rows whose first failing rule is `rule_name`"""
+        bit = self._bit(rule_name)
+        return (self.reasons & (2 * bit - 1)) == bit
+
+    def removed_by_rule(self):
+        """Removed row count per rule, attributing each row to its first failing rule"""
+        lowest_bit = self.reasons & (~self.reasons + 1)
+        counts = np.bincount(lowest_bit, minlength=1 << len(self.rules))
+        return {rule.name: int(counts[1 << i]) for i, rule in enumerate(self.rules)}
+
+
+def evaluate_rules(df, context, rules=CLEANING_RULES, stop_before=None, skip=()):
+    """
+    Evaluate `rules` over the columns of `df` without copying the frame.
+
+    `context` carries state shared with the rules (streaming duplicate set,
+    fixed duration bounds) and receives intermediate columns they compute.
+    With `stop_before`, evaluation ends just before the named rule; rules
+    named in `skip` are not evaluated at all.
+    """
+    if len(rules) > 16:
+        raise ValueError("The reason mask holds at most 16 rules")
+
+    reasons = np.zeros(len(df), dtype=np.uint16)
+    for i, rule in enumerate(rules):
+        if rule.name == stop_before:
+            break
+        if rule.name in skip:
+            continue
+        alive = reasons == 0 if rule.needs_survivors else None
+        failed = rule.check(df, alive, context)
+        reasons[failed] |= np.uint16(1 << i)
+
+    return ValidationResult(rules, reasons)
@@ -0,0 +1,82 @@
+"""
+Columnar (Parquet) storage for the cleaned trip dataset.
+
+The cleaner writes a hive-partitioned dataset
+(`pickup_year=2016/pickup_month=3/part-0-0.parquet`) that keeps column
+types, so readers skip CSV and datetime parsing entirely and can load only
+the columns and months they need.
+"""
+import os
+import shutil
+
+PARTITION_COLUMNS = ['pickup_year', 'pickup_month']
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError as e:
+        raise ImportError(
+            "Parquet support requires pyarrow (pip install pyarrow)"
+        ) from e
+    return pyarrow
+
+
+def write_partitioned(df, root, part=0, overwrite=False):
+    """
+    Write a cleaned frame into the partitioned dataset at `root`.
+
+    Call with overwrite=True for the first (or only) part of a run and with
+    increasing `part` numbers for later chunks, so file names never collide.
+    """
+    pa = _require_pyarrow()
+    if overwrite and os.path.exists(root):
+        shutil.rmtree(root)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pa.dataset.write_dataset(
+        table,
+        root,
+        format='parquet',
+        partitioning=PARTITION_COLUMNS,
+        partitioning_flavor='hive',
+        basename_template=f'part-{part}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore'
+    )
+
+
+def _month_filter(months):
+    """Partition filter expression for a list of (year, month) pairs"""
+    ds = _require_pyarrow().dataset
+    expression = None
+    for year, month in months:
+        clause = (ds.field('pickup_year') == year) & (ds.field('pickup_month') == month)
+        expression = clause if expression is None else expression | clause
+    return expression
+
+
+def parse_months(values):
+    """Parse 'YYYY-MM' strings into (year, month) pairs"""
+    months = []
+    for value in values:
+        year, month = value.split('-')
+        months.append((int(year), int(month)))
+    return months
+
+
+def read_partitioned(root, columns=None, months=None):
+    """
+    Read the partitioned dataset into a DataFrame.
+
+    `columns` restricts the columns read from disk and `months`, a list of
+    (year, month) pairs, restricts the partitions that are opened at all.
+    """
+    ds = _require_pyarrow().dataset
+    dataset = ds.dataset(root, format='parquet', partitioning='hive')
+    table = dataset.to_table(
+        columns=columns,
+        filter=_month_filter(months) if months else None
+    )
+    return table.to_pandas()
+
@@ -1,248 +1,296 @@
-import pandas as pd
 import numpy as np
 from datetime import datetime
+import argparse
+import functools
 import os
+import glob
 import json
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from cleaning_manifest import CleaningManifest
+from cleaning_rules import CLEANING_RULES, evaluate_rules, iqr_bounds
+from columnar_io import write_partitioned
+from instrumentation import PerformanceLog
+from streaming_stats import CountHistogram, RunningSummary, SpilledColumn
+from taxi_schema import (
+    DATETIME_COLUMNS, STATISTIC_COLUMNS, downcast_integers, memory_report, read_raw_csv, time_of_day
+)
+from timestamp_parser import parse_timestamps
+from trip_ids import TripIdSet, encode_trip_ids
+from trip_sketches import TripSketches
+
+# Working-set multiplier applied to the raw per-row size of a chunk when
+# deriving a chunk size from a memory ceiling (masks, copies, derived columns)
+CHUNK_MEMORY_OVERHEAD = 6
+
+# Resolution of the medians kept by incremental runs (seconds, km, km/h)
+STATISTIC_RESOLUTION = {
+    'trip_duration': 1,
+    'trip_distance_km': 0.001,
+    'trip_speed_kmh': 0.01
+}
+
+# Bump whenever the rules or the output columns change: incremental runs
+# then rebuild the output instead of appending to data cleaned differently
+PIPELINE_VERSION = 2
+
+
+def _timed_step(name=None, frame_rows=True):
+    """
+    Record every call of a pipeline step as a stage of self.performance
+    (named after the method unless `name` is given). With `frame_rows`,
+    len(self.df) before and after the call are the rows in and out;
+    otherwise the step reports its rows itself.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def step(self, *args, **kwargs):
+            rows_in = len(self.df) if frame_rows and self.df is not None else None
+            with self.performance.stage(name or method.__name__, rows_in=rows_in) as call:
+                result = method(self, *args, **kwargs)
+                if frame_rows and self.df is not None:
+                    call.add_rows(rows_out=len(self.df))
+            return result
+        return step
+    return decorate
+
 
 class NYCTaxiDataCleaner:
     """
     Comprehensive data cleaning pipeline for NYC Taxi Trip Dataset
+
+    By default the whole input is loaded into memory. Passing `chunk_size`
+    and/or `memory_limit_mb` switches run_pipeline to a streaming mode that
+    processes the input in fixed-size chunks and produces the same cleaned
+    CSV, cleaning log and report.
+
+    Passing a list of input files (e.g. one per month) cleans them in
+    parallel on `workers` processes, as if they were one concatenated file:
+    duplicate ids are removed across files and the IQR bounds are global.
+    
+    With `incremental=True` only inputs not cleaned by an earlier
+    incremental run (by content hash) are cleaned, and their output is
+    appended; see _run_incremental_pipeline.
+    
+    `output_format='parquet'` writes the cleaned data as a Parquet dataset
+    partitioned by pickup_year/pickup_month instead of a CSV file.
+    
+    Every mode also writes mergeable quantile and distinct-count sketches
+    of the cleaned trips per pickup date, hour and vendor (TripSketches).
+    
+    In streaming mode `chunk_sink` is called with every cleaned chunk as
+    soon as it is ready (e.g. to hand it to the database loader), and
+    `write_output=False` skips writing the cleaned data itself.
+    
+    `skip_loaded`, the path of the database loader's trip index, drops the
+    trips it lists (already loaded) after every other rule. The index is
+    only used if it matches trip_facts as the database at `database_url`
+    holds it now (see database/trip_index.py).
     """
     
-    def __init__(self, input_path, output_dir='data'):
+    def __init__(self, input_path, output_dir='data', chunk_size=None, memory_limit_mb=None,
+                 output_format='csv', workers=None, incremental=False, chunk_sink=None,
+                 write_output=True, skip_loaded=None, database_url=None):
+        if output_format not in ('csv', 'parquet'):
+            raise ValueError(f"Unsupported output format: {output_format}")
+        if (chunk_sink is not None or not write_output) and chunk_size is None and memory_limit_mb is None:
+            raise ValueError("chunk_sink and write_output=False need chunked streaming "
+                             "(chunk_size or memory_limit_mb)")
+        if incremental and not isinstance(input_path, (list, tuple)):
+            input_path = [input_path]
+        if isinstance(input_path, (list, tuple)) and (chunk_size or memory_limit_mb):
+            raise ValueError("Chunked streaming works on a single input file; several files "
+                             "(and incremental runs) are cleaned one file per process")
+        
         self.input_path = input_path
+        self.incremental = incremental
         self.output_dir = output_dir
+        self.output_format = output_format
+        self.chunk_size = chunk_size
+        self.memory_limit_mb = memory_limit_mb
+        self.workers = workers
+        self.chunk_sink = chunk_sink
+        self.write_output = write_output
+        self.skip_loaded = skip_loaded
+        self.database_url = database_url
+        self.verbose = True
         self.df = None
-        self.cleaning_log = {
+        self.cleaning_log = self._new_cleaning_log()
+        self.performance = PerformanceLog()
+        self.sketches = TripSketches()
+        
+        # Streaming state: global IQR bounds, ids seen in earlier chunks
+        # and the spilled columns used for the final statistics
+        self._duration_bounds = None
+        self._seen_ids = None
+        self._duplicate_positions = None
+        self._loaded_ids = None
+        self._loaded_generation = None
+        self._stat_columns = None
+        self._final_count = None
+        
+        # Features computed by the rules while validating the current frame
+        self._validated_features = None
+        
+        # Create output directory if it doesn't exist
+        os.makedirs(output_dir, exist_ok=True)
+        os.makedirs(f'{output_dir}/logs', exist_ok=True)
+    
+    @staticmethod
+    def _new_cleaning_log():
+        return {
             'total_records': 0,
             'removed_records': {},
+            'removed_by_rule': {},
             'suspicious_records': [],
             'statistics': {}
         }
+    
+    @property
+    def output_path(self):
+        if self.output_format == 'parquet':
+            return f"{self.output_dir}/cleaned_train.parquet"
+        return f"{self.output_dir}/cleaned_train.csv"
+    
+    @property
+    def sketches_path(self):
+        return f"{self.output_dir}/trip_sketches.npz"
+    
+    def _sketch(self, df):
+        """Add cleaned rows to the trip sketches"""
+        with self.performance.stage('build_sketches', rows_in=len(df)):
+            self.sketches.add(df)
+    
+    def _write_cleaned(self, df, part):
+        """Write cleaned rows; part 0 replaces any previous output, later parts append"""
+        first = part == 0
+        with self.performance.stage('write_output', rows_in=len(df)) as call:
+            if self.output_format == 'parquet':
+                write_partitioned(df, self.output_path, part=part, overwrite=first)
+            else:
+                df.to_csv(self.output_path, index=False, mode='w' if first else 'a', header=first)
+            call.add_rows(rows_out=len(df))
+    
+    @property
+    def streaming(self):
+        return self.chunk_size is not None or self.memory_limit_mb is not None
+    
+    @property
+    def parallel(self):
+        return isinstance(self.input_path, (list, tuple))
+    
+    @property
+    def in_memory(self):
+        """Whether the whole cleaned dataset is held in self.df"""
+        return not (self.streaming or self.parallel)
+    
+    def _log(self, message):
+        """Print step progress (silenced per chunk in streaming mode)"""
+        if self.verbose:
+            print(message)
+    
+    def _count_removed(self, category, count, section='removed_records'):
+        """Add to a removed-records counter (accumulates across chunks)"""
+        removed = self.cleaning_log[section]
+        removed[category] = removed.get(category, 0) + count
         
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
-        os.makedirs(f'{output_dir}/logs', exist_ok=True)
-        
+    @_timed_step()
     def load_data(self):
         """Load the raw CSV data"""
         print("Loading data...")
-        self.df = pd.read_csv(self.input_path)
+        self.df = read_raw_csv(self.input_path)
         self.cleaning_log['total_records'] = len(self.df)
         print(f"Loaded {len(self.df)} records")
         print(f"Columns: {list(self.df.columns)}")
+        print(memory_report(self.df))
         return self
     
-    def handle_missing_values(self):
-        """Identify and handle missing values"""
-        print("\n=== Handling Missing Values ===")
-        missing_counts = self.df.isnull().sum()
-        print("Missing values per column:")
-        print(missing_counts[missing_counts > 0])
+    @_timed_step()
+    def validate(self):
+        """
+        Evaluate every cleaning rule in one vectorized pass and drop the
+        failing rows with a single filter.
         
-        # Log missing values
-        self.cleaning_log['removed_records']['missing_values'] = int(missing_counts.sum())
+        Each row gets a bitmask of the rules it failed (see cleaning_rules);
+        removed_records and removed_by_rule are derived from those masks.
+        """
+        self._log("\n=== Validating Records ===")
+        
+        self._parse_timestamps()
+        context = self._rule_context()
+        result = evaluate_rules(self.df, context)
+        self._record_validation(result)
+        
+        # The one filter of the run; take() returns an independent frame
+        valid = result.valid
+        self.df = downcast_integers(self.df.take(np.flatnonzero(valid)))
+        self._validated_features = {
+            column: context[column][valid]
+            for column in ('trip_distance_km', 'trip_speed_kmh')
+        }
         
-        # Remove rows with any missing values
-        initial_count = len(self.df)
-        self.df = self.df.dropna()
-        removed = initial_count - len(self.df)
-        print(f"Removed {removed} records with missing values")
+        self._log(f"Kept {len(self.df)} valid records")
+        self._log(f"Timestamp range: {self.df['pickup_datetime'].min()} to {self.df['pickup_datetime'].max()}")
         
         return self
     
-    def handle_duplicates(self):
-        """Remove duplicate records"""
-        print("\n=== Handling Duplicates ===")
-        initial_count = len(self.df)
-        
-        # Check for duplicate IDs
-        duplicate_ids = self.df['id'].duplicated().sum()
-        print(f"Found {duplicate_ids} duplicate IDs")
-        
-        # Remove duplicates based on ID
-        self.df = self.df.drop_duplicates(subset=['id'], keep='first')
-        
-        removed = initial_count - len(self.df)
-        self.cleaning_log['removed_records']['duplicates'] = removed
-        print(f"Removed {removed} duplicate records")
-        
-        return self
+    def _rule_context(self):
+        """State shared with the cleaning rules (streaming id set, fixed IQR bounds)"""
+        return {
+            'seen_ids': self._seen_ids,
+            'duplicate_positions': self._duplicate_positions,
+            'duration_bounds': self._duration_bounds,
+            'loaded_ids': self._loaded_ids
+        }
     
-    def clean_timestamps(self):
-        """Parse and validate timestamps"""
-        print("\n=== Cleaning Timestamps ===")
-        
-        # Convert to datetime
-        self.df['pickup_datetime'] = pd.to_datetime(self.df['pickup_datetime'])
-        self.df['dropoff_datetime'] = pd.to_datetime(self.df['dropoff_datetime'])
-        
-        # Remove records where dropoff is before pickup
-        invalid_time = self.df['dropoff_datetime'] <= self.df['pickup_datetime']
-        invalid_count = invalid_time.sum()
-        
-        if invalid_count > 0:
-            print(f"Found {invalid_count} records with invalid time sequence")
+    def _parse_timestamps(self):
+        """Convert the pickup/dropoff columns to datetime (fixed format, cached)"""
+        for column in DATETIME_COLUMNS:
+            self.df[column] = parse_timestamps(self.df[column])
+    
+    def _record_validation(self, result):
+        """Attribute removed rows to categories and rules from the reason masks"""
+        removed_by_rule = result.removed_by_rule()
+        
+        for rule in CLEANING_RULES:
+            if rule.name == 'already_loaded' and not self.skip_loaded:
+                # Only a run skipping loaded trips reports them
+                continue
+            count = removed_by_rule[rule.name]
+            if count:
+                self._log(f"Found {count} {rule.description}")
+            if rule.category is not None:
+                self._count_removed(rule.category, count)
+            self._count_removed(rule.name, count, section='removed_by_rule')
+        
+        # Keep the ids of the first 100 trips with an invalid time sequence
+        remaining = 100 - len(self.cleaning_log['suspicious_records'])
+        if remaining > 0:
+            suspicious = result.first_failed('invalid_time_sequence')
             self.cleaning_log['suspicious_records'].extend(
-                self.df[invalid_time]['id'].tolist()[:100]  # Log first 100
+                self.df['id'][suspicious].tolist()[:remaining]
             )
-            self.df = self.df[~invalid_time]
-        
-        # Extract time features
-        self.df['pickup_hour'] = self.df['pickup_datetime'].dt.hour
-        self.df['pickup_day'] = self.df['pickup_datetime'].dt.day
-        self.df['pickup_month'] = self.df['pickup_datetime'].dt.month
-        self.df['pickup_weekday'] = self.df['pickup_datetime'].dt.dayofweek
-        self.df['pickup_year'] = self.df['pickup_datetime'].dt.year
-        
-        print(f"Timestamp range: {self.df['pickup_datetime'].min()} to {self.df['pickup_datetime'].max()}")
-        
-        return self
-    
-    def clean_coordinates(self):
-        """Validate and clean geographic coordinates"""
-        print("\n=== Cleaning Coordinates ===")
-        
-        # NYC bounding box (approximate)
-        # Latitude: 40.5 to 41.0
-        # Longitude: -74.3 to -73.7
-        valid_lat_min, valid_lat_max = 40.5, 41.0
-        valid_lon_min, valid_lon_max = -74.3, -73.7
-        
-        initial_count = len(self.df)
-        
-        # Filter invalid coordinates
-        valid_pickup = (
-            (self.df['pickup_latitude'] >= valid_lat_min) &
-            (self.df['pickup_latitude'] <= valid_lat_max) &
-            (self.df['pickup_longitude'] >= valid_lon_min) &
-            (self.df['pickup_longitude'] <= valid_lon_max)
-        )
-        
-        valid_dropoff = (
-            (self.df['dropoff_latitude'] >= valid_lat_min) &
-            (self.df['dropoff_latitude'] <= valid_lat_max) &
-            (self.df['dropoff_longitude'] >= valid_lon_min) &
-            (self.df['dropoff_longitude'] <= valid_lon_max)
-        )
-        
-        invalid_coords = ~(valid_pickup & valid_dropoff)
-        invalid_count = invalid_coords.sum()
-        
-        if invalid_count > 0:
-            print(f"Found {invalid_count} records with coordinates outside NYC")
-            self.df = self.df[~invalid_coords]
-        
-        # Remove records with zero coordinates
-        zero_coords = (
-            (self.df['pickup_latitude'] == 0) |
-            (self.df['pickup_longitude'] == 0) |
-            (self.df['dropoff_latitude'] == 0) |
-            (self.df['dropoff_longitude'] == 0)
-        )
-        zero_count = zero_coords.sum()
-        
-        if zero_count > 0:
-            print(f"Found {zero_count} records with zero coordinates")
-            self.df = self.df[~zero_coords]
-        
-        removed = initial_count - len(self.df)
-        self.cleaning_log['removed_records']['invalid_coordinates'] = removed
-        print(f"Removed {removed} records with invalid coordinates")
-        
-        return self
-    
-    def clean_trip_duration(self):
-        """Clean and validate trip duration"""
-        print("\n=== Cleaning Trip Duration ===")
-        
-        initial_count = len(self.df)
-        
-        # Remove trips with duration <= 0 or extremely long (> 24 hours)
-        max_duration = 24 * 3600  # 24 hours in seconds
-        min_duration = 60  # 1 minute
-        
-        invalid_duration = (
-            (self.df['trip_duration'] <= min_duration) |
-            (self.df['trip_duration'] > max_duration)
-        )
-        
-        invalid_count = invalid_duration.sum()
-        print(f"Found {invalid_count} records with invalid duration (< 1 min or > 24 hours)")
-        
-        self.df = self.df[~invalid_duration]
-        
-        # Statistical outlier removal using IQR method
-        Q1 = self.df['trip_duration'].quantile(0.25)
-        Q3 = self.df['trip_duration'].quantile(0.75)
-        IQR = Q3 - Q1
-        
-        lower_bound = Q1 - 3 * IQR
-        upper_bound = Q3 + 3 * IQR
-        
-        outliers = (
-            (self.df['trip_duration'] < lower_bound) |
-            (self.df['trip_duration'] > upper_bound)
-        )
-        
-        outlier_count = outliers.sum()
-        print(f"Found {outlier_count} statistical outliers in trip duration")
-        self.df = self.df[~outliers]
-        
-        removed = initial_count - len(self.df)
-        self.cleaning_log['removed_records']['invalid_duration'] = removed
-        print(f"Removed {removed} records with invalid duration")
-        
-        return self
-    
-    def clean_passenger_count(self):
-        """Validate passenger count"""
-        print("\n=== Cleaning Passenger Count ===")
-        
-        initial_count = len(self.df)
-        
-        # NYC taxis typically accommodate 1-6 passengers
-        invalid_passengers = (
-            (self.df['passenger_count'] < 1) |
-            (self.df['passenger_count'] > 6)
-        )
-        
-        invalid_count = invalid_passengers.sum()
-        print(f"Found {invalid_count} records with invalid passenger count")
-        
-        self.df = self.df[~invalid_passengers]
-        
-        removed = initial_count - len(self.df)
-        self.cleaning_log['removed_records']['invalid_passengers'] = removed
-        print(f"Removed {removed} records with invalid passenger count")
-        
-        return self
     
+    @_timed_step()
     def calculate_derived_features(self):
         """Calculate derived features from the cleaned data"""
-        print("\n=== Calculating Derived Features ===")
+        self._log("\n=== Calculating Derived Features ===")
         
-        # 1. Trip Speed (km/h)
-        # Calculate distance using Haversine formula
-        self.df['trip_distance_km'] = self._haversine_distance(
-            self.df['pickup_latitude'], self.df['pickup_longitude'],
-            self.df['dropoff_latitude'], self.df['dropoff_longitude']
-        )
+        # Time features
+        self.df['pickup_hour'] = self.df['pickup_datetime'].dt.hour.astype('int8')
+        self.df['pickup_day'] = self.df['pickup_datetime'].dt.day.astype('int8')
+        self.df['pickup_month'] = self.df['pickup_datetime'].dt.month.astype('int8')
+        self.df['pickup_weekday'] = self.df['pickup_datetime'].dt.dayofweek.astype('int8')
+        self.df['pickup_year'] = self.df['pickup_datetime'].dt.year.astype('int16')
         
-        # Speed = distance / time (in hours)
-        self.df['trip_speed_kmh'] = (
-            self.df['trip_distance_km'] / 
-            (self.df['trip_duration'] / 3600)
-        )
-        
-        # Remove unrealistic speeds (> 120 km/h or < 1 km/h for completed trips)
-        valid_speed = (
-            (self.df['trip_speed_kmh'] >= 1) &
-            (self.df['trip_speed_kmh'] <= 120)
-        )
-        removed_speed = (~valid_speed).sum()
-        print(f"Removed {removed_speed} records with unrealistic speed")
-        self.df = self.df[valid_speed]
+        # 1. Trip Speed (km/h), from the Haversine distance already computed
+        # for the speed rule during validation
+        self.df['trip_distance_km'] = self._validated_features['trip_distance_km']
+        self.df['trip_speed_kmh'] = self._validated_features['trip_speed_kmh']
         
         # 2. Trip Efficiency Score (distance per minute)
         self.df['trip_efficiency'] = (
@@ -250,75 +298,45 @@ class NYCTaxiDataCleaner:
             (self.df['trip_duration'] / 60)
         )
         
-        # 3. Time of Day Category
-        def categorize_time(hour):
-            if 6 <= hour < 12:
-                return 'morning'
-            elif 12 <= hour < 18:
-                return 'afternoon'
-            elif 18 <= hour < 22:
-                return 'evening'
-            else:
-                return 'night'
-        
-        self.df['time_of_day'] = self.df['pickup_hour'].apply(categorize_time)
+        # 3. Time of Day Category (morning 6-11, afternoon 12-17, evening 18-21, night)
+        self.df['time_of_day'] = time_of_day(self.df['pickup_hour'])
         
         # 4. Is Weekend
-        self.df['is_weekend'] = self.df['pickup_weekday'].isin([5, 6]).astype(int)
+        self.df['is_weekend'] = self.df['pickup_weekday'].isin([5, 6]).astype('int8')
         
-        print(f"Added derived features: trip_distance_km, trip_speed_kmh, trip_efficiency, time_of_day, is_weekend")
+        self._log(f"Added derived features: trip_distance_km, trip_speed_kmh, trip_efficiency, time_of_day, is_weekend")
+        self._log(memory_report(self.df))
         
         return self
     
-    def _haversine_distance(self, lat1, lon1, lat2, lon2):
-        """
-        Calculate the great circle distance between two points 
-        on the earth (specified in decimal degrees)
-        Returns distance in kilometers
-        """
-        # Convert to radians
-        lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
-        
-        # Haversine formula
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
-        c = 2 * np.arcsin(np.sqrt(a))
-        
-        # Radius of earth in kilometers
-        r = 6371
-        
-        return c * r
-    
+    @_timed_step(frame_rows=False)
     def generate_statistics(self):
         """Generate cleaning statistics"""
         print("\n=== Generating Statistics ===")
         
+        if self.in_memory:
+            final_count = len(self.df)
+            columns = self.df
+        else:
+            final_count = self._final_count
+            columns = self._stat_columns
+        
         self.cleaning_log['statistics'] = {
-            'final_record_count': len(self.df),
-            'records_removed': self.cleaning_log['total_records'] - len(self.df),
+            'final_record_count': final_count,
+            'records_removed': self.cleaning_log['total_records'] - final_count,
             'removal_percentage': round(
-                ((self.cleaning_log['total_records'] - len(self.df)) / 
+                ((self.cleaning_log['total_records'] - final_count) / 
                  self.cleaning_log['total_records']) * 100, 2
-            ),
-            'trip_duration': {
-                'mean': float(self.df['trip_duration'].mean()),
-                'median': float(self.df['trip_duration'].median()),
-                'std': float(self.df['trip_duration'].std())
-            },
-            'trip_distance': {
-                'mean': float(self.df['trip_distance_km'].mean()),
-                'median': float(self.df['trip_distance_km'].median()),
-                'std': float(self.df['trip_distance_km'].std())
-            },
-            'trip_speed': {
-                'mean': float(self.df['trip_speed_kmh'].mean()),
-                'median': float(self.df['trip_speed_kmh'].median()),
-                'std': float(self.df['trip_speed_kmh'].std())
-            }
+            )
         }
+        for name, column in STATISTIC_COLUMNS.items():
+            self.cleaning_log['statistics'][name] = {
+                'mean': float(columns[column].mean()),
+                'median': float(columns[column].median()),
+                'std': float(columns[column].std())
+            }
         
-        print(f"Final dataset: {len(self.df)} records")
+        print(f"Final dataset: {final_count} records")
         print(f"Removed: {self.cleaning_log['statistics']['records_removed']} records ({self.cleaning_log['statistics']['removal_percentage']}%)")
         
         return self
@@ -327,12 +345,22 @@ class NYCTaxiDataCleaner:
         """Save cleaned data and logs"""
         print("\n=== Saving Cleaned Data ===")
         
-        # Save cleaned CSV
-        output_path = f"{self.output_dir}/cleaned_train.csv"
-        self.df.to_csv(output_path, index=False)
-        print(f"Saved cleaned data to: {output_path}")
-        
-        # Save cleaning log
+        # Save cleaned data (already written chunk by chunk or file by file otherwise)
+        output_path = self.output_path
+        if self.in_memory:
+            self._write_cleaned(self.df, part=0)
+            self._sketch(self.df)
+        if self.write_output:
+            print(f"Saved cleaned data to: {output_path}")
+        else:
+            print("Cleaned data was streamed without being saved")
+        
+        # Save trip sketches
+        self.sketches.save(self.sketches_path)
+        print(f"Saved trip sketches to: {self.sketches_path}")
+        
+        # Save cleaning log, with the performance of every step so far
+        self.cleaning_log['performance'] = self.performance.summary()
         log_path = f"{self.output_dir}/logs/cleaning_log.json"
         with open(log_path, 'w') as f:
             json.dump(self.cleaning_log, f, indent=2)
@@ -344,7 +372,8 @@ class NYCTaxiDataCleaner:
             f.write("=" * 60 + "\n")
             f.write("NYC TAXI DATA CLEANING REPORT\n")
             f.write("=" * 60 + "\n\n")
-            f.write(f"Input file: {self.input_path}\n")
+            input_files = ', '.join(self.input_path) if self.parallel else self.input_path
+            f.write(f"Input file: {input_files}\n")
             f.write(f"Processing date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
             
             f.write("CLEANING SUMMARY\n")
@@ -359,10 +388,24 @@ class NYCTaxiDataCleaner:
             for category, count in self.cleaning_log['removed_records'].items():
                 f.write(f"{category}: {count}\n")
             
+            f.write("\nRECORDS REMOVED BY RULE (first failing rule)\n")
+            f.write("-" * 60 + "\n")
+            for rule, count in self.cleaning_log['removed_by_rule'].items():
+                f.write(f"{rule}: {count}\n")
+            
+            f.write("\nPERFORMANCE BY STEP\n")
+            f.write("-" * 60 + "\n")
+            for line in self.performance.format_lines():
+                f.write(f"{line}\n")
+            
             f.write("\n" + "=" * 60 + "\n")
         
         print(f"Saved summary report to: {report_path}")
         
+        print("\nPerformance by step:")
+        for line in self.performance.format_lines():
+            print(f"  {line}")
+        
         return self
     
     def run_pipeline(self):
@@ -371,38 +414,530 @@ class NYCTaxiDataCleaner:
         print("NYC TAXI DATA CLEANING PIPELINE")
         print("=" * 60)
         
-        (self
-         .load_data()
-         .handle_missing_values()
-         .handle_duplicates()
-         .clean_timestamps()
-         .clean_coordinates()
-         .clean_trip_duration()
-         .clean_passenger_count()
-         .calculate_derived_features()
-         .generate_statistics()
-         .save_cleaned_data())
+        self._read_loaded_ids()
+        if self.incremental:
+            self._run_incremental_pipeline()
+        else:
+            # A full run replaces the output, so earlier incremental state no longer applies
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+            if self.parallel:
+                self._run_parallel_pipeline()
+            elif self.streaming:
+                self._run_streaming_pipeline()
+            else:
+                (self
+                 .load_data()
+                 .validate()
+                 .calculate_derived_features()
+                 .generate_statistics()
+                 .save_cleaned_data())
         
         print("\n" + "=" * 60)
         print("CLEANING PIPELINE COMPLETED SUCCESSFULLY")
         print("=" * 60)
         
-        return self.df
+        # The streaming and parallel pipelines never hold the full cleaned frame
+        return self.df if self.in_memory else None
+    
+    def _read_loaded_ids(self, generation=None):
+        """
+        Read the ids of the trips already loaded (skip_loaded), if there is an
+        index of them yet. The index has to be saved at the generation of
+        trip_facts in the database at database_url (or at `generation`, read
+        by the parent process); a stale index is refused.
+        """
+        if not self.skip_loaded:
+            return
+        if not os.path.exists(self.skip_loaded):
+            if self.verbose:
+                print(f"No trip index at {self.skip_loaded} yet; no trips are skipped as loaded")
+            return
+        
+        # The loader's modules, and psycopg2, are only needed here
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database'))
+        from trip_index import LoadedTripIndex, current_generation
+        if generation is None:
+            if not self.database_url:
+                raise ValueError("Skipping loaded trips needs the database (database_url), "
+                                 "to check that the trip index is current")
+            import psycopg2
+            conn = psycopg2.connect(self.database_url)
+            try:
+                generation = current_generation(conn)
+            finally:
+                conn.close()
+        index = LoadedTripIndex(self.skip_loaded)
+        if not index.read(generation):
+            raise ValueError(f"Trip index {self.skip_loaded} does not match trip_facts (generation "
+                             f"{generation}); a load with --trip-index {self.skip_loaded} brings it up to date")
+        self._loaded_ids = index.ids
+        self._loaded_generation = generation
+        if self.verbose:
+            print(f"Skipping the {len(self._loaded_ids)} trips already loaded ({self.skip_loaded})")
+    
+    def _resolve_chunk_size(self):
+        """Rows per chunk, derived from memory_limit_mb when one is set"""
+        if self.memory_limit_mb is None:
+            return self.chunk_size
+        
+        sample = read_raw_csv(self.input_path, nrows=10_000)
+        bytes_per_row = sample.memory_usage(deep=True).sum() / max(len(sample), 1)
+        fitting_rows = int(self.memory_limit_mb * 1024 ** 2 / (bytes_per_row * CHUNK_MEMORY_OVERHEAD))
+        chunk_size = min(fitting_rows, self.chunk_size) if self.chunk_size else fitting_rows
+        
+        if chunk_size < 1000:
+            raise ValueError(
+                f"memory_limit_mb={self.memory_limit_mb} leaves room for only "
+                f"{chunk_size} rows per chunk; raise the limit"
+            )
+        return chunk_size
+    
+    def _run_streaming_pipeline(self):
+        """
+        Clean the input in two passes over fixed-size chunks.
+        
+        Pass 1 finds the global IQR bounds for trip_duration; pass 2 cleans
+        each chunk with those bounds and appends it to the output CSV (and
+        hands it to chunk_sink). Duplicate ids are tracked across chunks in a TripIdSet, and the
+        final statistics are computed from columns spilled to disk, so
+        memory stays bounded by the chunk size plus 8 bytes per distinct id.
+        """
+        chunk_size = self._resolve_chunk_size()
+        spill_dir = tempfile.mkdtemp(prefix='spill-', dir=self.output_dir)
+        print(f"Streaming mode: {chunk_size} rows per chunk")
+        
+        self.verbose = False
+        try:
+            self._compute_duration_bounds(chunk_size, spill_dir)
+            self._clean_chunks(chunk_size, spill_dir)
+            self.verbose = True
+            self.generate_statistics().save_cleaned_data()
+        finally:
+            self.verbose = True
+            for column in (self._stat_columns or {}).values():
+                column.close()
+            shutil.rmtree(spill_dir, ignore_errors=True)
+    
+    @_timed_step('pass1_duration_bounds', frame_rows=False)
+    def _compute_duration_bounds(self, chunk_size, spill_dir):
+        """Pass 1: IQR bounds over every duration that reaches the outlier filter"""
+        print("\nPass 1/2: computing trip duration bounds...")
+        
+        cleaning_log = self.cleaning_log
+        self.cleaning_log = self._new_cleaning_log()  # counts are only kept from pass 2
+        self._seen_ids = TripIdSet()
+        durations = SpilledColumn(os.path.join(spill_dir, 'trip_duration_pass1.bin'))
+        try:
+            for chunk in read_raw_csv(self.input_path, chunksize=chunk_size):
+                self.df = chunk
+                self._parse_timestamps()
+                result = evaluate_rules(self.df, self._rule_context(), stop_before='duration_outlier')
+                durations.add(self.df['trip_duration'][result.valid])
+                self.performance.current.add_rows(rows_in=len(chunk))
+            
+            self._duration_bounds = iqr_bounds(durations)
+        finally:
+            durations.close()
+            self.cleaning_log = cleaning_log
+        
+        print(f"Trip duration bounds: {self._duration_bounds[0]} to {self._duration_bounds[1]}")
+    
+    @_timed_step('pass2_clean_chunks', frame_rows=False)
+    def _clean_chunks(self, chunk_size, spill_dir):
+        """Pass 2: clean every chunk, append it to the output CSV and pass it to chunk_sink"""
+        print("\nPass 2/2: cleaning chunks...")
+        
+        self._seen_ids = TripIdSet()
+        self._stat_columns = {
+            column: SpilledColumn(os.path.join(spill_dir, f'{column}.bin'))
+            for column in STATISTIC_COLUMNS.values()
+        }
+        self._final_count = 0
+        
+        for chunk_number, chunk in enumerate(read_raw_csv(self.input_path, chunksize=chunk_size)):
+            self.cleaning_log['total_records'] += len(chunk)
+            self.df = chunk
+            self.validate().calculate_derived_features()
+            
+            for column, spilled in self._stat_columns.items():
+                spilled.add(self.df[column])
+            
+            if self.write_output:
+                self._write_cleaned(self.df, part=chunk_number)
+            self._sketch(self.df)
+            if self.chunk_sink is not None:
+                with self.performance.stage('chunk_sink', rows_in=len(self.df)):
+                    self.chunk_sink(self.df)
+            self._final_count += len(self.df)
+            self.performance.current.add_rows(rows_in=len(chunk), rows_out=len(self.df))
+            print(f"Chunk {chunk_number + 1}: {len(chunk)} records in, {len(self.df)} kept")
+    
+    def _run_parallel_pipeline(self):
+        """
+        Clean several input files on a process pool, in two passes.
+        
+        Pass 1 (per file, in parallel) returns the packed ids and the
+        pre-outlier durations of every row reaching the duplicate check; the
+        parent resolves keep-first duplicates across files in input order and
+        builds the global IQR bounds from an exact duration histogram. Pass 2
+        cleans every file with those decisions; the parent merges the worker
+        logs, output parts and spilled statistic columns.
+        """
+        spill_dir = tempfile.mkdtemp(prefix='spill-', dir=self.output_dir)
+        self._stat_columns = {
+            column: SpilledColumn(os.path.join(spill_dir, f'{column}.bin'))
+            for column in STATISTIC_COLUMNS.values()
+        }
+        self._final_count = 0
+        try:
+            self._clean_files_on_pool(self.input_path, TripIdSet(), CountHistogram(), spill_dir)
+            self.generate_statistics().save_cleaned_data()
+        finally:
+            for column in self._stat_columns.values():
+                column.close()
+            shutil.rmtree(spill_dir, ignore_errors=True)
+    
+    def _clean_files_on_pool(self, paths, seen_ids, durations, spill_dir, append=False, run=0):
+        """
+        Run both parallel passes over `paths`. `seen_ids` and `durations`
+        may already hold earlier data (incremental runs); with `append` the
+        output is extended instead of replaced. Returns per-file row counts.
+        """
+        workers = min(self.workers or os.cpu_count() or 1, len(paths))
+        print(f"Parallel mode: {len(paths)} files on {workers} processes")
+        
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            duplicates = self._scan_input_files(pool, paths, seen_ids, durations)
+            return self._clean_input_files(pool, paths, duplicates, spill_dir, append, run)
+    
+    @_timed_step('pass1_scan_files', frame_rows=False)
+    def _scan_input_files(self, pool, paths, seen_ids, durations):
+        """Pass 1: global duplicate decisions and IQR bounds; returns duplicate positions per file"""
+        print("\nPass 1/2: resolving duplicates and trip duration bounds...")
+        
+        duplicates = []
+        for scan in pool.map(_scan_input_file, paths):
+            is_new = seen_ids.mark_new_encoded(scan['keys'], scan['encodable'], scan['other_ids'])
+            durations.add(scan['durations'][scan['passes'] & is_new])
+            duplicates.append(np.flatnonzero(~is_new))
+            self.performance.merge(scan['performance'])
+        
+        self._duration_bounds = iqr_bounds(durations)
+        print(f"Trip duration bounds: {self._duration_bounds[0]} to {self._duration_bounds[1]}")
+        return duplicates
+    
+    @_timed_step('pass2_clean_files', frame_rows=False)
+    def _clean_input_files(self, pool, paths, duplicates, spill_dir, append, run):
+        """Pass 2: clean every file and merge the per-file results in input order"""
+        print("\nPass 2/2: cleaning files...")
+        
+        if self.output_format == 'parquet' and not append:
+            shutil.rmtree(self.output_path, ignore_errors=True)
+        tasks = [
+            {
+                'index': index,
+                'path': path,
+                'part': f'r{run}-{index}',
+                'header': index == 0 and not append,
+                'output_dir': self.output_dir,
+                'output_format': self.output_format,
+                'spill_dir': spill_dir,
+                'duration_bounds': self._duration_bounds,
+                'duplicate_positions': duplicate_positions,
+                'skip_loaded': self.skip_loaded,
+                'loaded_generation': self._loaded_generation
+            }
+            for index, (path, duplicate_positions) in enumerate(zip(paths, duplicates))
+        ]
+        
+        counts = []
+        mode = 'ab' if append else 'wb'
+        with open(self.output_path, mode) if self.output_format == 'csv' else nullcontext() as output:
+            for task, part in zip(tasks, pool.map(_clean_input_file, tasks)):
+                self._merge_cleaning_log(part['cleaning_log'])
+                self._final_count += part['final_count']
+                self.performance.merge(part['performance'])
+                
+                for column, summary in self._stat_columns.items():
+                    summary.add_file(part['stat_files'][column])
+                self.sketches.merge(TripSketches.load(part['sketch_file']))
+                if output is not None:
+                    with open(part['csv_part'], 'rb') as f:
+                        shutil.copyfileobj(f, output)
+                
+                records = part['cleaning_log']['total_records']
+                self.performance.current.add_rows(rows_in=records, rows_out=part['final_count'])
+                counts.append({'path': task['path'], 'records': records, 'kept': part['final_count']})
+                print(f"{task['path']}: {records} records in, {part['final_count']} kept")
+        return counts
+    
+    def _run_incremental_pipeline(self):
+        """
+        Clean only the inputs the manifest has not seen and append their output.
+        
+        The duplicate-id set, the histogram of pre-outlier durations (for the
+        IQR bounds) and mergeable statistic summaries persist in state_dir, so
+        a run costs time in proportion to the new inputs and the log is
+        updated by merging. Rows cleaned by earlier runs are not re-filtered
+        when new data moves the IQR bounds. A changed input, pipeline version
+        or output format rebuilds the output from the given inputs.
+        """
+        manifest_path = os.path.join(self.state_dir, 'manifest.json')
+        previous = CleaningManifest.load(manifest_path)
+        manifest = previous or CleaningManifest(manifest_path, PIPELINE_VERSION, self.output_format)
+        fingerprints = {path: manifest.fingerprint(path) for path in self.input_path}
+        
+        rebuild_reason = self._rebuild_reason(previous, fingerprints)
+        if rebuild_reason:
+            print(f"Rebuilding the cleaned output: {rebuild_reason}")
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+            manifest = CleaningManifest(manifest_path, PIPELINE_VERSION, self.output_format)
+        
+        pending, pending_hashes = [], set()
+        for path in self.input_path:
+            fingerprint = fingerprints[path]
+            if not manifest.is_processed(fingerprint) and fingerprint['sha256'] not in pending_hashes:
+                pending.append(path)
+                pending_hashes.add(fingerprint['sha256'])
+        if not pending:
+            print("Every input is already cleaned; nothing to do")
+            return
+        print(f"Incremental mode: {len(pending)} new of {len(self.input_path)} input files")
+        
+        if rebuild_reason:
+            seen_ids, durations = self._new_incremental_state()
+        else:
+            self._discard_uncommitted_output(manifest)
+            seen_ids, durations = self._load_incremental_state(manifest.runs)
+        
+        run = manifest.runs + 1
+        spill_dir = tempfile.mkdtemp(prefix='spill-', dir=self.output_dir)
+        try:
+            counts = self._clean_files_on_pool(
+                pending, seen_ids, durations, spill_dir, append=not rebuild_reason, run=run
+            )
+            self.generate_statistics().save_cleaned_data()
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+        
+        self._save_incremental_state(run, seen_ids, durations)
+        for entry in counts:
+            manifest.record(entry['path'], fingerprints[entry['path']],
+                            records=entry['records'], kept=entry['kept'], run=run)
+        manifest.runs = run
+        if self.output_format == 'csv':
+            manifest.output_bytes = os.path.getsize(self.output_path)
+        manifest.save()
+        
+        # Only the state of the committed run is kept
+        shutil.rmtree(self._run_state_dir(run - 1), ignore_errors=True)
+    
+    @property
+    def state_dir(self):
+        """Manifest and persisted state of incremental runs"""
+        return f"{self.output_dir}/state"
+    
+    def _run_state_dir(self, run):
+        return os.path.join(self.state_dir, f'run-{run}')
+    
+    def _rebuild_reason(self, previous, fingerprints):
+        if previous is None:
+            return "no earlier incremental run"
+        if previous.pipeline_version != PIPELINE_VERSION:
+            return f"pipeline version changed ({previous.pipeline_version} -> {PIPELINE_VERSION})"
+        if previous.output_format != self.output_format:
+            return f"output format changed ({previous.output_format} -> {self.output_format})"
+        if not os.path.exists(self.output_path):
+            return "the cleaned output is missing"
+        changed = [path for path, fingerprint in fingerprints.items()
+                   if previous.is_changed(path, fingerprint)]
+        if changed:
+            return f"input changed since it was cleaned: {', '.join(changed)}"
+        return None
+    
+    def _new_incremental_state(self):
+        self._stat_columns = {
+            column: RunningSummary(STATISTIC_RESOLUTION[column])
+            for column in STATISTIC_COLUMNS.values()
+        }
+        self._final_count = 0
+        self.sketches = TripSketches()
+        return TripIdSet(), CountHistogram()
+    
+    def _load_incremental_state(self, run):
+        """Duplicate-id set, duration histogram, summaries, sketches and log of the last committed run"""
+        state = self._run_state_dir(run)
+        self._stat_columns = {
+            column: RunningSummary.load(os.path.join(state, f'{column}.npz'))
+            for column in STATISTIC_COLUMNS.values()
+        }
+        with open(os.path.join(state, 'cleaning_log.json')) as f:
+            self.cleaning_log = json.load(f)
+        self._final_count = self.cleaning_log['statistics']['final_record_count']
+        self.sketches = TripSketches.load(os.path.join(state, 'trip_sketches.npz'))
+        
+        seen_ids = TripIdSet.load(os.path.join(state, 'trip_ids.npz'))
+        durations = CountHistogram.load(os.path.join(state, 'durations.npy'))
+        return seen_ids, durations
+    
+    def _save_incremental_state(self, run, seen_ids, durations):
+        state = self._run_state_dir(run)
+        os.makedirs(state, exist_ok=True)
+        for column, summary in self._stat_columns.items():
+            summary.save(os.path.join(state, f'{column}.npz'))
+        with open(os.path.join(state, 'cleaning_log.json'), 'w') as f:
+            json.dump(self.cleaning_log, f, indent=2)
+        seen_ids.save(os.path.join(state, 'trip_ids.npz'))
+        self.sketches.save(os.path.join(state, 'trip_sketches.npz'))
+        durations.save(os.path.join(state, 'durations.npy'))
+    
+    def _discard_uncommitted_output(self, manifest):
+        """Drop output appended by a run that failed before saving its manifest"""
+        if self.output_format == 'csv':
+            if os.path.getsize(self.output_path) > manifest.output_bytes:
+                with open(self.output_path, 'r+b') as f:
+                    f.truncate(manifest.output_bytes)
+            return
+        for path in glob.glob(os.path.join(self.output_path, '**', 'part-r*.parquet'), recursive=True):
+            run = int(os.path.basename(path)[len('part-r'):].split('-')[0])
+            if run > manifest.runs:
+                os.remove(path)
+    
+    def _merge_cleaning_log(self, log):
+        """Fold one worker's cleaning_log into this one"""
+        self.cleaning_log['total_records'] += log['total_records']
+        for section in ('removed_records', 'removed_by_rule'):
+            for name, count in log[section].items():
+                self._count_removed(name, count, section=section)
+        
+        remaining = 100 - len(self.cleaning_log['suspicious_records'])
+        self.cleaning_log['suspicious_records'].extend(log['suspicious_records'][:max(remaining, 0)])
+
+
+def _scan_input_file(path):
+    """
+    Parallel pass 1 (worker process): for every row of one input file that
+    reaches the duplicate check, its packed id, its trip_duration and whether
+    it passes the other rules that come before the outlier filter.
+    """
+    performance = PerformanceLog()
+    with performance.stage('scan_input_file') as call:
+        df = read_raw_csv(path)
+        for column in DATETIME_COLUMNS:
+            df[column] = parse_timestamps(df[column])
+        result = evaluate_rules(df, {}, stop_before='duration_outlier', skip={'duplicate_id'})
+        
+        checked = ~result.failed('missing_values')
+        ids = df['id'][checked]
+        keys, encodable = encode_trip_ids(ids)
+        call.add_rows(rows_in=len(df), rows_out=len(ids))
+    return {
+        'performance': performance.stages(),
+        'keys': keys,
+        'encodable': encodable,
+        'other_ids': ids[~encodable].astype(str).tolist(),
+        'durations': df['trip_duration'].to_numpy()[checked],
+        'passes': result.valid[checked]
+    }
+
+
+def _clean_input_file(task):
+    """
+    Parallel pass 2 (worker process): clean one input file with the global
+    duplicate decisions and IQR bounds, write its share of the output and
+    spill its statistic columns and trip sketches for the parent.
+    """
+    cleaner = NYCTaxiDataCleaner(task['path'], task['output_dir'], output_format=task['output_format'],
+                                 skip_loaded=task['skip_loaded'])
+    cleaner.verbose = False
+    cleaner._duration_bounds = task['duration_bounds']
+    cleaner._duplicate_positions = task['duplicate_positions']
+    if task['loaded_generation'] is not None:
+        # The index the parent checked, and only if it did
+        cleaner._read_loaded_ids(task['loaded_generation'])
+    
+    with cleaner.performance.stage('load_data') as call:
+        cleaner.df = read_raw_csv(task['path'])
+        call.add_rows(rows_out=len(cleaner.df))
+    cleaner.cleaning_log['total_records'] = len(cleaner.df)
+    df = cleaner.validate().calculate_derived_features().df
+    
+    index, spill_dir = task['index'], task['spill_dir']
+    csv_part = None
+    with cleaner.performance.stage('write_output', rows_in=len(df)) as call:
+        if cleaner.output_format == 'parquet':
+            write_partitioned(df, cleaner.output_path, part=task['part'])
+        else:
+            # The parent concatenates the parts in input order; only the first may have a header
+            csv_part = os.path.join(spill_dir, f'part-{index:05d}.csv')
+            df.to_csv(csv_part, index=False, header=task['header'])
+        call.add_rows(rows_out=len(df))
+    
+    stat_files = {}
+    for column in STATISTIC_COLUMNS.values():
+        stat_files[column] = os.path.join(spill_dir, f'{column}-{index:05d}.bin')
+        df[column].to_numpy(dtype=np.float64).tofile(stat_files[column])
+    
+    cleaner._sketch(df)
+    sketch_file = os.path.join(spill_dir, f'sketches-{index:05d}.npz')
+    cleaner.sketches.save(sketch_file)
+    
+    return {
+        'cleaning_log': cleaner.cleaning_log,
+        'final_count': len(df),
+        'csv_part': csv_part,
+        'stat_files': stat_files,
+        'sketch_file': sketch_file,
+        'performance': cleaner.performance.stages()
+    }
 
 
 # Main execution
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Clean the NYC taxi trip dataset')
+    parser.add_argument('--input', nargs='+', default=['train.csv'],
+                        help='Path to the raw CSV file, or several files (e.g. one per month) to clean in parallel')
+    parser.add_argument('--output-dir', default='data', help='Directory for cleaned data and logs')
+    parser.add_argument('--chunk-size', type=int, help='Stream the input in chunks of this many rows')
+    parser.add_argument('--memory-limit-mb', type=float,
+                        help='Stream the input with chunks sized to stay under this memory ceiling')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='Write cleaned data as CSV or as Parquet partitioned by year/month')
+    parser.add_argument('--workers', type=int,
+                        help='Processes for cleaning several input files (default: CPU count)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only clean inputs not cleaned by an earlier incremental run and append them')
+    parser.add_argument('--skip-loaded', metavar='PATH',
+                        help="Drop trips listed in the database loader's trip index (--trip-index); "
+                             "needs --database-url to check that the index is current")
+    parser.add_argument('--database-url', metavar='DSN',
+                        help='PostgreSQL connection string of the loaded database, for --skip-loaded')
+    args = parser.parse_args()
+    if args.skip_loaded and not args.database_url:
+        parser.error('--skip-loaded needs --database-url, to check the trip index against trip_facts')
+    
+    # One file is cleaned in this process unless workers are requested
+    input_path = args.input[0] if len(args.input) == 1 and args.workers is None else args.input
+    
     # Initialize cleaner
     cleaner = NYCTaxiDataCleaner(
-        input_path='train.csv',
-        output_dir='data'
+        input_path=input_path,
+        output_dir=args.output_dir,
+        chunk_size=args.chunk_size,
+        memory_limit_mb=args.memory_limit_mb,
+        output_format=args.format,
+        workers=args.workers,
+        incremental=args.incremental,
+        skip_loaded=args.skip_loaded,
+        database_url=args.database_url
     )
     
     # Run the pipeline
     cleaned_df = cleaner.run_pipeline()
     
-    # Display sample of cleaned data
-    print("\nSample of cleaned data:")
-    print(cleaned_df.head())
-    print(f"\nCleaned dataset shape: {cleaned_df.shape}")
-    print(f"Columns: {list(cleaned_df.columns)}")
\ No newline at end of file
+    if cleaned_df is not None:
+        # Display sample of cleaned data
+        print("\nSample of cleaned data:")
+        print(cleaned_df.head())
+        print(f"\nCleaned dataset shape: {cleaned_df.shape}")
+        print(f"Columns: {list(cleaned_df.columns)}")
@@ -0,0 +1,84 @@
+"""
+Batch preparation running ahead of the database writes.
+
+Writing a batch has two halves: preparing it in Python (routing it to its
+partitions, converting its rows to INSERT records or encoding a COPY
+buffer) and sending it (the statement, then the commit). Done in turn, the
+client idles while the server works and the server idles while the next
+batch is prepared. BatchPipeline prepares the next `depth` batches on
+`threads` threads while the loader sends the current one on its connection;
+only the loader's thread touches the connection. Batches come out in input
+order, and at most `depth` prepared batches wait, so a slow database holds
+the preparation back instead of filling memory.
+
+Tuning, from the counters every pipeline adds to the loader's phase:
+
+- pipeline_stall_ms: time the writer waited for a batch to be prepared.
+  Large when preparation is the bottleneck; more threads help (the
+  encoding is partly numpy, which runs outside the GIL).
+- pipeline_ready_batches / pipeline_batches: mean number of prepared
+  batches waiting when the writer took one, out of `depth`.
+  pipeline_full_batches counts the takes that found all `depth` ready:
+  the database is the bottleneck, and a deeper queue only costs memory.
+"""
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+# Batches prepared ahead of the one being written
+PIPELINE_DEPTH = 2
+
+
+class BatchPipeline:
+    """Prepares batches ahead of their writer, keeping counts of the hand-off"""
+
+    def __init__(self, depth=PIPELINE_DEPTH, threads=1):
+        self.depth = depth
+        self.threads = max(threads, 1)
+        self.batches = 0
+        self.ready = 0
+        self.full = 0
+        self.stall_s = 0.0
+
+    def prepared(self, prepare, batches):
+        """
+        prepare(batch) of every batch, in order. With depth 0 each batch is
+        prepared when it is taken, in the caller's thread.
+        """
+        if self.depth <= 0:
+            for batch in batches:
+                yield prepare(batch)
+            return
+
+        batches = iter(batches)
+        pool = ThreadPoolExecutor(self.threads, thread_name_prefix='prepare')
+        pending = deque(pool.submit(prepare, batch) for batch in islice(batches, self.depth))
+        try:
+            while pending:
+                ready = sum(future.done() for future in pending)
+                self.batches += 1
+                self.ready += ready
+                self.full += ready == self.depth
+                future = pending.popleft()
+                waited = time.perf_counter()
+                result = future.result()
+                self.stall_s += time.perf_counter() - waited
+                # Keep `depth` batches in preparation while this one is written
+                for batch in islice(batches, 1):
+                    pending.append(pool.submit(prepare, batch))
+                yield result
+        finally:
+            # The writer stopped (or failed): drop the batches not started
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+    def counters(self):
+        """The hand-off counts, as performance counters"""
+        return {
+            'pipeline_batches': self.batches,
+            'pipeline_ready_batches': self.ready,
+            'pipeline_full_batches': self.full,
+            'pipeline_stall_ms': round(self.stall_s * 1000)
+        }
@@ -7,6 +7,8 @@ CREATE TABLE vendors (
 );
 
 
+-- One row per pickup second (SERIAL ids), or with the loader's --time-grain hour
+-- one per hour, keyed YYYYMMDDHH
 CREATE TABLE time_dimensions (
     time_id SERIAL PRIMARY KEY,
     pickup_datetime TIMESTAMP NOT NULL UNIQUE,
@@ -33,8 +35,10 @@ CREATE TABLE locations (
 );
 
 
+-- Partitioned by month of pickup_datetime (trip_facts_YYYY_MM); the loader
+-- creates the partitions of the months it loads (trip_partitions.py)
 CREATE TABLE trip_facts (
-    trip_id VARCHAR(50) PRIMARY KEY,
+    trip_id VARCHAR(50) NOT NULL,
     vendor_id INTEGER NOT NULL,
     pickup_location_id INTEGER NOT NULL,
     dropoff_location_id INTEGER NOT NULL,
@@ -54,8 +58,51 @@ CREATE TABLE trip_facts (
     CONSTRAINT fk_dropoff_location FOREIGN KEY (dropoff_location_id) REFERENCES locations(location_id),
     CONSTRAINT fk_time FOREIGN KEY (time_id) REFERENCES time_dimensions(time_id),
     
-    CONSTRAINT valid_trip_timing CHECK (dropoff_datetime > pickup_datetime)
+    CONSTRAINT valid_trip_timing CHECK (dropoff_datetime > pickup_datetime),
+
+    -- Unique keys of a partitioned table include the partition key
+    PRIMARY KEY (trip_id, pickup_datetime)
+) PARTITION BY RANGE (pickup_datetime);
+
+-- The primary key alone would let a trip id be stored again under another
+-- pickup time: trip_ids holds every stored trip id once, kept by triggers
+-- cloned onto every partition (an insert of a stored trip id is skipped, a
+-- delete frees the id); see trip_partitions.py
+CREATE TABLE trip_ids (
+    trip_id VARCHAR(50) PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION guard_trip_id() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM trip_ids WHERE trip_id = OLD.trip_id;
+        RETURN OLD;
+    ELSIF TG_OP = 'UPDATE' THEN
+        RAISE EXCEPTION 'trip_id % cannot change to %', OLD.trip_id, NEW.trip_id;
+    END IF;
+    INSERT INTO trip_ids (trip_id) VALUES (NEW.trip_id) ON CONFLICT DO NOTHING;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trip_facts_trip_id_guard
+    BEFORE INSERT OR DELETE ON trip_facts
+    FOR EACH ROW EXECUTE FUNCTION guard_trip_id();
+
+CREATE TRIGGER trip_facts_trip_id_fixed
+    BEFORE UPDATE OF trip_id ON trip_facts
+    FOR EACH ROW WHEN (OLD.trip_id IS DISTINCT FROM NEW.trip_id) EXECUTE FUNCTION guard_trip_id();
+
+-- Generation of trip_facts: advanced by every transaction writing to it, so a
+-- copy of its trip ids (the loader's --trip-index) can tell it is current; see
+-- trip_index.py
+CREATE TABLE trip_facts_generation (
+    generation BIGINT NOT NULL
 );
+INSERT INTO trip_facts_generation (generation) VALUES (0);
 
 -- =============================================================================
 -- DATA QUALITY LOGGING TABLE
@@ -68,7 +115,18 @@ CREATE TABLE data_quality_log (
     records_inserted INTEGER,
     records_rejected INTEGER,
     rejection_reason TEXT,
-    load_status VARCHAR(20) CHECK (load_status IN ('SUCCESS', 'PARTIAL', 'FAILED'))
+    load_status VARCHAR(20) CHECK (load_status IN ('SUCCESS', 'PARTIAL', 'FAILED')),
+    performance JSONB,
+    reconciliation JSONB
+);
+
+-- Checkpoints of trip_facts loads, for resuming an interrupted load (--resume)
+CREATE TABLE load_checkpoints (
+    input_id VARCHAR(64) PRIMARY KEY,
+    input_path TEXT,
+    rows_committed BIGINT NOT NULL,
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- INDEXES for Query Performance
@@ -96,35 +154,83 @@ CREATE INDEX idx_location_zone ON locations(zone_name);
 
 
 
--- VIEWS for Analytics Queries
+-- SUMMARY TABLES for the analytics views: counts and sums the loader merges
+-- the partial aggregates of every batch of new trips into (trip_aggregates.py)
+
+CREATE TABLE hourly_trip_totals (
+    pickup_hour INTEGER NOT NULL,
+    is_weekend BOOLEAN NOT NULL,
+    time_of_day VARCHAR(20) NOT NULL,
+    trip_count BIGINT NOT NULL,
+    total_distance NUMERIC(18, 3) NOT NULL,
+    total_duration BIGINT NOT NULL,
+    total_speed NUMERIC(18, 3) NOT NULL,
+    speed_count BIGINT NOT NULL,
+    PRIMARY KEY (pickup_hour, is_weekend)
+);
+
+-- 32-bit hash of a trip id, summed per day so the loader can fingerprint a
+-- month from daily_trip_totals (load_reconciliation.py)
+CREATE OR REPLACE FUNCTION trip_id_hash(trip_id TEXT) RETURNS BIGINT AS $$
+DECLARE
+    packed BIGINT;
+    h BIGINT;
+BEGIN
+    IF trip_id !~ '^id[0-9]{1,17}$' THEN
+        RETURN ('x' || LEFT(MD5(trip_id), 8))::BIT(32)::BIGINT;
+    END IF;
+    packed := ((LENGTH(trip_id) - 2)::BIGINT << 57) | SUBSTRING(trip_id FROM 3)::BIGINT;
+    h := packed >> 32;
+    h := (((h >> 16) # h) * 73244475) & 4294967295;
+    h := (((h >> 16) # h) * 73244475) & 4294967295;
+    h := ((h >> 16) # h) # (packed & 4294967295);
+    h := (((h >> 16) # h) * 73244475) & 4294967295;
+    h := (((h >> 16) # h) * 73244475) & 4294967295;
+    RETURN (h >> 16) # h;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+
+CREATE TABLE daily_trip_totals (
+    trip_date DATE PRIMARY KEY,
+    is_weekend BOOLEAN NOT NULL,
+    trip_count BIGINT NOT NULL,
+    total_distance NUMERIC(18, 3) NOT NULL,
+    total_duration BIGINT NOT NULL,
+    total_speed NUMERIC(18, 3) NOT NULL,
+    speed_count BIGINT NOT NULL,
+    trip_id_hash BIGINT NOT NULL
+);
+
+CREATE TABLE location_trip_totals (
+    location_id INTEGER PRIMARY KEY,
+    pickup_count BIGINT NOT NULL
+);
+
+-- VIEWS for Analytics Queries (averages from the summary tables)
 
 -- Hourly trip statistics view
 CREATE OR REPLACE VIEW hourly_trip_stats AS
 SELECT 
-    td.pickup_hour,
-    td.time_of_day,
-    td.is_weekend,
-    COUNT(*) as trip_count,
-    AVG(tf.trip_distance_km) as avg_distance,
-    AVG(tf.trip_duration) as avg_duration,
-    AVG(tf.trip_speed_kmh) as avg_speed,
-    SUM(tf.trip_distance_km) as total_distance
-FROM trip_facts tf
-JOIN time_dimensions td ON tf.time_id = td.time_id
-GROUP BY td.pickup_hour, td.time_of_day, td.is_weekend;
+    pickup_hour,
+    time_of_day,
+    is_weekend,
+    trip_count,
+    total_distance / trip_count as avg_distance,
+    total_duration::NUMERIC / trip_count as avg_duration,
+    total_speed / NULLIF(speed_count, 0) as avg_speed,
+    total_distance
+FROM hourly_trip_totals;
 
 -- Daily trip statistics view
 CREATE OR REPLACE VIEW daily_trip_stats AS
 SELECT 
-    DATE(td.pickup_datetime) as trip_date,
-    td.is_weekend,
-    COUNT(*) as trip_count,
-    AVG(tf.trip_distance_km) as avg_distance,
-    AVG(tf.trip_duration) as avg_duration,
-    AVG(tf.trip_speed_kmh) as avg_speed
-FROM trip_facts tf
-JOIN time_dimensions td ON tf.time_id = td.time_id
-GROUP BY DATE(td.pickup_datetime), td.is_weekend;
+    trip_date,
+    is_weekend,
+    trip_count,
+    total_distance / trip_count as avg_distance,
+    total_duration::NUMERIC / trip_count as avg_duration,
+    total_speed / NULLIF(speed_count, 0) as avg_speed
+FROM daily_trip_totals;
 
 -- Location-based trip statistics
 CREATE OR REPLACE VIEW location_trip_stats AS
@@ -133,10 +239,9 @@ SELECT
     l.latitude,
     l.longitude,
     l.zone_name,
-    COUNT(*) as pickup_count
-FROM trip_facts tf
-JOIN locations l ON tf.pickup_location_id = l.location_id
-GROUP BY l.location_id, l.latitude, l.longitude, l.zone_name;
+    t.pickup_count
+FROM location_trip_totals t
+JOIN locations l ON t.location_id = l.location_id;
 
 
 
@@ -0,0 +1,71 @@
+"""
+Checkpoints of trip_facts loads, kept in the database.
+
+A load is identified by its input: the content hash of the cleaned CSV (or of
+every file of the Parquet dataset) plus the months selected. After every
+committed batch the loader records, in the same transaction, the input row
+up to which trips are committed, so a resumed load skips straight to the
+first uncommitted row. Rows are counted in input order, including rejected
+ones, so the offset does not depend on which rows were rejected.
+"""
+import hashlib
+import os
+
+from cleaning_manifest import file_sha256
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS load_checkpoints (
+        input_id VARCHAR(64) PRIMARY KEY,
+        input_path TEXT,
+        rows_committed BIGINT NOT NULL,
+        completed BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def input_identity(path, months=None):
+    """Hex digest identifying the content of a CSV file or Parquet dataset, and the months read"""
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(file_sha256(file_path).encode())
+    else:
+        digest.update(file_sha256(path).encode())
+    for year, month in sorted(months or []):
+        digest.update(f'{year:04d}-{month:02d}'.encode())
+    return digest.hexdigest()
+
+
+class LoadCheckpoints:
+    """load_checkpoints rows of one input, through a loader's cursor"""
+
+    def __init__(self, cursor, input_id, input_path):
+        self.cursor = cursor
+        self.input_id = input_id
+        self.input_path = input_path
+
+    def create_table(self):
+        self.cursor.execute(CREATE_TABLE)
+
+    def get(self):
+        """(rows committed, completed) of the input, or None when never loaded"""
+        self.cursor.execute(
+            "SELECT rows_committed, completed FROM load_checkpoints WHERE input_id = %s",
+            (self.input_id,)
+        )
+        return self.cursor.fetchone()
+
+    def record(self, rows_committed, completed=False):
+        """Record progress; commits with the caller's transaction"""
+        self.cursor.execute("""
+            INSERT INTO load_checkpoints (input_id, input_path, rows_committed, completed)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (input_id) DO UPDATE
+                SET rows_committed = EXCLUDED.rows_committed, completed = EXCLUDED.completed,
+                    updated_at = CURRENT_TIMESTAMP
+        """, (self.input_id, self.input_path, int(rows_committed), completed))
@@ -4,10 +4,36 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 import argparse
+import functools
+import json
+import multiprocessing
+import os
+import queue
 import sys
+import time
 from tqdm import tqdm
 import logging
 
+# Shared pipeline modules live in the project root, next to data_cleaning.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from columnar_io import parse_months, read_partitioned
+from instrumentation import DbCounters, InstrumentedConnection, PerformanceLog
+from surrogate_keys import MISSING_ID, SurrogateKeyMap, coordinate_keys, hour_keys, time_keys
+from taxi_schema import DATETIME_COLUMNS, memory_report, read_cleaned_csv, time_of_day
+from taxi_zones import ZoneIndex
+from timestamp_parser import parse_timestamps
+
+from batch_pipeline import PIPELINE_DEPTH, BatchPipeline
+from load_checkpoints import LoadCheckpoints, input_identity
+from load_reconciliation import LoadReconciliation, check_cleaning_log, cleaning_log_path
+from pg_copy import column_type, copy_buffer
+from trip_index import LoadedTripIndex, advance_generation, create_generation
+from trip_aggregates import add_totals, create_summary_tables, merge_clause, partial_aggregates
+from trip_partitions import (
+    PARTITION_KEY, attached_partition, create_partitions, create_replacement, create_trip_id_guard,
+    is_partitioned, month_codes, month_of, month_bounds, replacement_name, route_batch, swap_partition
+)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -18,12 +44,78 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Columns of the cleaned dataset that the loader reads
+LOADER_COLUMNS = [
+    'id', 'vendor_id', 'pickup_datetime', 'dropoff_datetime', 'passenger_count',
+    'pickup_longitude', 'pickup_latitude', 'dropoff_longitude', 'dropoff_latitude',
+    'store_and_fwd_flag', 'trip_duration', 'pickup_hour', 'pickup_day', 'pickup_month',
+    'pickup_weekday', 'pickup_year', 'trip_distance_km', 'trip_speed_kmh',
+    'trip_efficiency', 'time_of_day', 'is_weekend'
+]
+
+# Rows per transaction of each load method
+DEFAULT_BATCH_SIZES = {'insert': 1000, 'copy': 100000}
+
+# Seconds the parallel load waits for every worker to report at each phase
+# (shard written, then committed) before it gives up on the missing ones
+WORKER_TIMEOUT = 3600
+
+# Bulk mode: UNLOGGED table the trips are staged in, and session settings for
+# rebuilding trip_facts' indexes (each build uses parallel maintenance workers)
+BULK_STAGING_TABLE = 'trip_facts_bulk'
+BULK_SETTINGS = {'maintenance_work_mem': '1GB', 'max_parallel_maintenance_workers': 4}
+
+# Grains of time_dimensions: a row per pickup second (SERIAL ids), or per hour
+# (smart-key ids YYYYMMDDHH, see surrogate_keys.hour_keys). Serial ids stay
+# below HOUR_KEY_MIN, so the grain of a loaded table shows in its ids.
+TIME_GRAINS = ['second', 'hour']
+HOUR_KEY_MIN = 1900010100
+
+# Columns stored in trip_facts; rows missing any of them are rejected
+TRIP_FACT_COLUMNS = [
+    'id', 'vendor_id', 'pickup_datetime', 'dropoff_datetime', 'trip_duration',
+    'trip_distance_km', 'trip_speed_kmh', 'trip_efficiency', 'passenger_count',
+    'store_and_fwd_flag'
+]
+
+
+def _timed_phase(method):
+    """
+    Record every call of a loader phase as a stage of self.performance.
+    A DataFrame argument gives the rows in; phases report rows out themselves.
+    """
+    @functools.wraps(method)
+    def phase(self, *args, **kwargs):
+        frame = next((arg for arg in args if isinstance(arg, pd.DataFrame)), None)
+        rows_in = len(frame) if frame is not None else None
+        with self.performance.stage(method.__name__, rows_in=rows_in):
+            return method(self, *args, **kwargs)
+    return phase
+
 
 class DatabaseLoader:
     """Handles loading cleaned taxi data into PostgreSQL database"""
     
-    def __init__(self, host, database, user, password, port=5432):
-        """Initialize database connection parameters"""
+    def __init__(self, host, database, user, password, port=5432, zone_index=None,
+                 method='insert', copy_format='binary', workers=None, bulk=False, replace_months=False,
+                 time_grain='second', trip_index=None, pipeline_depth=PIPELINE_DEPTH, prepare_threads=1,
+                 commit_every=1, worker_timeout=WORKER_TIMEOUT):
+        """
+        Initialize database connection parameters. `zone_index` (a ZoneIndex)
+        fills location zones; `method` is 'insert' (multi-row INSERTs) or
+        'copy' (COPY FROM STDIN in `copy_format` 'binary' or 'text');
+        `workers` > 1 loads trip_facts on that many processes and connections,
+        giving up on a worker silent for `worker_timeout` seconds;
+        `bulk` loads trip_facts with its secondary indexes and foreign keys
+        dropped and rebuilt (see _move_bulk); `replace_months` replaces the
+        partitions of the months loaded instead of adding to them (see
+        _replace_months); `time_grain` 'hour' keys time_dimensions by hour
+        (see populate_time_dimensions); `trip_index` is the path of the file
+        indexing the trip ids loaded (see trip_index.py). Batches are prepared
+        up to `pipeline_depth` ahead of their writes on `prepare_threads`
+        threads (see batch_pipeline.py) and committed every `commit_every`
+        batches.
+        """
         self.conn_params = {
             'host': host,
             'database': database,
@@ -33,18 +125,62 @@ class DatabaseLoader:
         }
         self.conn = None
         self.cursor = None
+        self.zone_index = zone_index
+        self.method = method
+        self.copy_format = copy_format
+        self.workers = workers
+        self.worker_timeout = worker_timeout
+        self.bulk = bulk
+        self.replace_months = replace_months
+        self.time_grain = time_grain
+        self.trip_index = LoadedTripIndex(trip_index) if trip_index else None
+        self.pipeline_depth = pipeline_depth
+        self.prepare_threads = prepare_threads
+        self.commit_every = commit_every
+        
+        # Whether trip_facts is partitioned by month (see trip_partitions.py)
+        self.partitioned = False
+        
+        # Per-phase timings plus the round trips and bytes sent through self.conn
+        self.db_counters = DbCounters()
+        self.performance = PerformanceLog(self.db_counters)
+        self.fact_counts = None
+        
+        # Fingerprints of the trips written, checked against trip_facts once
+        # loaded, and the check of the input against the cleaner's log
+        self.reconciliation = LoadReconciliation()
+        self.cleaning_check = None
+        self.reconciliation_report = None
+        
+        # Input of the load (path, months) and its checkpoints; input_offset is
+        # the input row the loaded frame starts at (non-zero when resuming)
+        self.input = None
+        self.checkpoints = None
+        self.input_offset = 0
+        
+        # Natural key -> surrogate id of every dimension row this loader has
+        # written or looked up; ids are assigned here, not read back
+        self.location_map = SurrogateKeyMap.empty()
+        self.time_map = SurrogateKeyMap.empty()
+        
+        # Hourly grain: codes (months since 1970-01) of the months whose hours are in time_dimensions
+        self.time_months = set()
         
     def connect(self):
         """Establish database connection"""
         try:
-            self.conn = psycopg2.connect(**self.conn_params)
-            self.cursor = self.conn.cursor()
+            self.use_connection(psycopg2.connect(**self.conn_params))
             logger.info("Successfully connected to PostgreSQL database")
             return True
         except psycopg2.Error as e:
             logger.error(f"Database connection failed: {e}")
             return False
     
+    def use_connection(self, conn):
+        """Load through `conn` (a psycopg2 connection or a stand-in), counting its traffic"""
+        self.conn = InstrumentedConnection(conn, self.db_counters)
+        self.cursor = self.conn.cursor()
+    
     def close(self):
         """Close database connection"""
         if self.cursor:
@@ -53,228 +189,529 @@ class DatabaseLoader:
             self.conn.close()
         logger.info("Database connection closed")
     
+    @_timed_phase
     def load_csv(self, csv_path):
         """Load cleaned CSV file into pandas DataFrame"""
         try:
             logger.info(f"Loading CSV file: {csv_path}")
-            df = pd.read_csv(csv_path)
+            df = read_cleaned_csv(csv_path, usecols=LOADER_COLUMNS)
+            self.input = (csv_path, None)
+            self.cleaning_check = check_cleaning_log(df, cleaning_log_path(csv_path))
+            
+            # Parse datetimes once here; later phases get typed columns
+            for column in DATETIME_COLUMNS:
+                df[column] = parse_timestamps(df[column])
+            
+            self.performance.current.add_rows(rows_out=len(df))
             logger.info(f"Loaded {len(df)} records from CSV")
             logger.info(f"Columns: {list(df.columns)}")
+            logger.info(memory_report(df))
             return df
         except Exception as e:
             logger.error(f"Failed to load CSV: {e}")
             return None
     
+    @_timed_phase
+    def load_parquet(self, dataset_path, months=None):
+        """Load the partitioned Parquet dataset, optionally only some (year, month) partitions"""
+        try:
+            logger.info(f"Loading Parquet dataset: {dataset_path}")
+            if months:
+                logger.info(f"Restricting to months: {months}")
+            df = read_partitioned(dataset_path, columns=LOADER_COLUMNS, months=months)
+            self.input = (dataset_path, months)
+            # The cleaner's log covers the whole dataset
+            self.cleaning_check = None if months else check_cleaning_log(df, cleaning_log_path(dataset_path))
+            self.performance.current.add_rows(rows_out=len(df))
+            logger.info(f"Loaded {len(df)} records from Parquet")
+            logger.info(memory_report(df))
+            return df
+        except Exception as e:
+            logger.error(f"Failed to load Parquet dataset: {e}")
+            return None
+    
+    def _write_rows(self, table, names, columns, conflict, batch_size=None, progress=None, commit=True,
+                    before_commit=None, route=None):
+        """
+        Write the rows formed by `columns` (arrays, one per name in `names`) to
+        `table` with the loader's method, committing every `commit_every`
+        batches of `batch_size` rows (or not at all without `commit`).
+        `conflict` is the ON CONFLICT clause; with None, COPY writes straight
+        into `table`, whose column types must then be those of column_type().
+        `before_commit(end)` runs in each transaction, `end` being the number
+        of rows written so far. `route(batch)` splits a batch into (table,
+        rows) parts that are written to their tables instead of `table`
+        (e.g. the partitions of its rows). Batches are prepared ahead of
+        their writes (see batch_pipeline.py). Returns the number of rows sent.
+        """
+        total = len(columns[0])
+        if not batch_size:
+            # Dimension rows: one transaction for INSERTs, COPY-sized ones otherwise
+            batch_size = max(total, 1) if self.method == 'insert' else DEFAULT_BATCH_SIZES['copy']
+        starts = range(0, total, batch_size)
+        batches = ([column[start:start + batch_size] for column in columns] for start in starts)
+        
+        def prepare(batch):
+            return [(target, rows, self._encode_rows(rows)) for target, rows in
+                    (route(batch) if route else [(table, batch)])]
+        
+        pipeline = BatchPipeline(self.pipeline_depth, self.prepare_threads)
+        prepared = pipeline.prepared(prepare, batches)
+        try:
+            for number, parts in enumerate(tqdm(prepared, total=len(starts), desc=progress)
+                                           if progress else prepared, 1):
+                for target, rows, encoded in parts:
+                    if self.method == 'copy':
+                        self._copy_batch(target, names, rows, conflict, encoded)
+                    else:
+                        self._insert_batch(target, names, rows, conflict or '', encoded)
+                if commit and (number % self.commit_every == 0 or number == len(starts)):
+                    if before_commit:
+                        before_commit(min(number * batch_size, total))
+                    self.conn.commit()
+        finally:
+            prepared.close()
+            if self.performance.current is not None and pipeline.batches:
+                self.performance.current.add_counters(pipeline.counters())
+        return total
+    
+    def _encode_rows(self, columns):
+        """The rows formed by `columns` as the method sends them: INSERT records or a COPY buffer"""
+        if self.method == 'copy':
+            return copy_buffer(columns, self.copy_format)
+        return list(zip(*[
+            pd.DatetimeIndex(column).to_pydatetime().tolist() if column.dtype.kind == 'M'
+            else column.tolist()
+            for column in columns
+        ]))
+    
+    def _insert_batch(self, table, names, batch, conflict='', records=None):
+        """One multi-row INSERT per 1000 rows; `records` are the rows already encoded"""
+        insert_query = f"""
+            INSERT INTO {table} ({', '.join(names)})
+            VALUES %s
+            {conflict}
+        """
+        records = self._encode_rows(batch) if records is None else records
+        execute_values(self.cursor, insert_query, records, page_size=1000)
+    
+    def _stage_rows(self, stage, names, columns, encoded=None):
+        """
+        Create the temporary table `stage` (dropped on commit) holding the
+        rows formed by `columns`; `encoded` are the rows already encoded
+        """
+        definitions = ', '.join(f'{name} {column_type(column)}' for name, column in zip(names, columns))
+        self.cursor.execute(f"CREATE TEMP TABLE {stage} ({definitions}) ON COMMIT DROP")
+        encoded = self._encode_rows(columns) if encoded is None else encoded
+        if self.method == 'copy':
+            self.cursor.copy_expert(
+                f"COPY {stage} ({', '.join(names)}) FROM STDIN WITH (FORMAT {self.copy_format})",
+                encoded
+            )
+        else:
+            self._insert_batch(stage, names, columns, records=encoded)
+    
+    def _copy_batch(self, table, names, batch, conflict, buffer=None):
+        """
+        COPY the rows into a temporary staging table, then INSERT ... SELECT
+        them; `buffer` is their COPY buffer, if already encoded
+        """
+        column_list = ', '.join(names)
+        if conflict is None:
+            self.cursor.copy_expert(
+                f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT {self.copy_format})",
+                copy_buffer(batch, self.copy_format) if buffer is None else buffer
+            )
+            return
+        stage = f'copy_{table}'
+        self._stage_rows(stage, names, batch, buffer)
+        self.cursor.execute(f"""
+            INSERT INTO {table} ({column_list})
+            SELECT {column_list} FROM {stage}
+            {conflict}
+        """)
+        # Dropped now too, for batches sharing one transaction
+        self.cursor.execute(f"DROP TABLE {stage}")
+    
+    def _assign_ids(self, table, id_column, key_map, keys, key_names, key_columns, key_function, join):
+        """
+        Give every key in `keys` (unique natural keys of the rows formed by
+        `key_columns`) that `key_map` lacks a surrogate id. Keys already in
+        `table` keep theirs, found by joining just these keys against it; the
+        rest get ids reserved from the table's SERIAL sequence in one call.
+        Returns (key map with the new ids, mask of keys that were unknown,
+        mask of keys given reserved ids). The loader is assumed to be the only
+        writer of the dimension between this call and its insert.
+        """
+        unknown = key_map.resolve(keys) == MISSING_ID
+        reserved = np.zeros(len(keys), dtype=bool)
+        if not unknown.any():
+            return key_map, unknown, reserved
+        
+        # Keys loaded by earlier runs
+        stage = f'keys_{table}'
+        self._stage_rows(stage, key_names, [column[unknown] for column in key_columns])
+        self.cursor.execute(f"""
+            SELECT d.{id_column}, {', '.join('d.' + name for name in key_names)}
+            FROM {table} d JOIN {stage} k ON {join}
+        """)
+        rows = self.cursor.fetchall()
+        self.conn.commit()
+        if rows:
+            columns = list(zip(*rows))
+            key_map = key_map.merged(key_function(*columns[1:]), np.array(columns[0], dtype=np.int32))
+        
+        # New keys: a block of ids from the sequence
+        reserved = unknown & (key_map.resolve(keys) == MISSING_ID)
+        if reserved.any():
+            self.cursor.execute(
+                f"SELECT nextval(pg_get_serial_sequence('{table}', '{id_column}')) "
+                f"FROM generate_series(1, %s)",
+                (int(reserved.sum()),)
+            )
+            ids = np.array([row[0] for row in self.cursor.fetchall()], dtype=np.int32)
+            self.conn.commit()
+            key_map = key_map.merged(keys[reserved], ids)
+        
+        logger.info(f"{table}: {int(unknown.sum())} new keys, {len(rows)} already loaded, "
+                    f"{int(reserved.sum())} ids reserved")
+        return key_map, unknown, reserved
+    
+    @_timed_phase
     def populate_time_dimensions(self, df):
-        """Populate time_dimensions table with unique datetime entries"""
+        """
+        Populate time_dimensions table with unique datetime entries, or with
+        the hourly grain every hour of the months of the frame's pickups
+        """
         logger.info("Populating time_dimensions table...")
+        if self.time_grain == 'hour':
+            return self._populate_hours(df)
+        known_map = self.time_map
         
         try:
             # Convert pickup_datetime to datetime if it's not already
-            df['pickup_datetime'] = pd.to_datetime(df['pickup_datetime'])
+            df['pickup_datetime'] = parse_timestamps(df['pickup_datetime'])
             
             # Get unique datetime entries with all temporal features
+            keys, first = np.unique(time_keys(df['pickup_datetime']), return_index=True)
             time_data = df[['pickup_datetime', 'pickup_hour', 'pickup_day', 
                           'pickup_month', 'pickup_weekday', 'pickup_year', 
-                          'time_of_day', 'is_weekend']].drop_duplicates()
-            
-            # Convert to list of tuples for batch insert
-            time_records = [
-                (
-                    row['pickup_datetime'],
-                    int(row['pickup_hour']),
-                    int(row['pickup_day']),
-                    int(row['pickup_month']),
-                    int(row['pickup_weekday']),
-                    int(row['pickup_year']),
-                    row['time_of_day'],
-                    bool(int(row['is_weekend']))
-                )
-                for _, row in time_data.iterrows()
-            ]
+                          'time_of_day', 'is_weekend']].iloc[first]
             
-            # Batch insert
-            insert_query = """
-                INSERT INTO time_dimensions 
-                (pickup_datetime, pickup_hour, pickup_day, pickup_month, 
-                 pickup_weekday, pickup_year, time_of_day, is_weekend)
-                VALUES %s
-                ON CONFLICT (pickup_datetime) DO NOTHING
-            """
+            # Ids of datetimes loaded before, reserved ones for the rest
+            self.time_map, _, reserved = self._assign_ids(
+                'time_dimensions', 'time_id', self.time_map, keys,
+                ['pickup_datetime'], [time_data['pickup_datetime'].to_numpy()],
+                lambda pickup: time_keys(list(pickup)),
+                'd.pickup_datetime = k.pickup_datetime'
+            )
+            time_data = time_data[reserved]
             
-            execute_values(self.cursor, insert_query, time_records, page_size=1000)
-            self.conn.commit()
+            # Batch insert of the new datetimes
+            inserted = self._write_rows(
+                'time_dimensions',
+                ['time_id', 'pickup_datetime', 'pickup_hour', 'pickup_day', 'pickup_month',
+                 'pickup_weekday', 'pickup_year', 'time_of_day', 'is_weekend'],
+                [
+                    self.time_map.resolve(keys[reserved]).astype(np.int32),
+                    time_data['pickup_datetime'].to_numpy(),
+                    time_data['pickup_hour'].to_numpy(dtype=np.int32),
+                    time_data['pickup_day'].to_numpy(dtype=np.int32),
+                    time_data['pickup_month'].to_numpy(dtype=np.int32),
+                    time_data['pickup_weekday'].to_numpy(dtype=np.int32),
+                    time_data['pickup_year'].to_numpy(dtype=np.int32),
+                    time_data['time_of_day'].to_numpy(dtype=object),
+                    time_data['is_weekend'].to_numpy(dtype=np.int32).astype(bool)
+                ],
+                'ON CONFLICT (pickup_datetime) DO NOTHING'
+            )
             
-            logger.info(f"Inserted {len(time_records)} unique time dimension records")
+            self.performance.current.add_rows(rows_out=inserted)
+            logger.info(f"Inserted {inserted} new time dimension records")
             return True
             
+        except Exception as e:
+            self.conn.rollback()
+            # Ids of rows that may not exist must not reach trip_facts
+            self.time_map = known_map
+            logger.error(f"Failed to populate time_dimensions: {e}")
+            return False
+    
+    def _populate_hours(self, df):
+        """
+        Hourly grain: write every hour of the months the frame's pickups fall
+        in that this loader has not written yet, generated from the calendar
+        (at most 744 rows a month) with their smart keys as ids. Hours loaded
+        before are kept.
+        """
+        try:
+            df['pickup_datetime'] = parse_timestamps(df['pickup_datetime'])
+            codes = np.unique(month_codes(df['pickup_datetime'].to_numpy()))
+            new_months = [int(code) for code in codes if int(code) not in self.time_months]
+            if not new_months:
+                return True
+            
+            hours = pd.DatetimeIndex(np.concatenate([
+                pd.date_range(np.datetime64(code, 'M'), np.datetime64(code + 1, 'M'), freq='h', inclusive='left')
+                for code in new_months
+            ]))
+            inserted = self._write_rows(
+                'time_dimensions',
+                ['time_id', 'pickup_datetime', 'pickup_hour', 'pickup_day', 'pickup_month',
+                 'pickup_weekday', 'pickup_year', 'time_of_day', 'is_weekend'],
+                [
+                    hour_keys(hours).astype(np.int32),
+                    hours.to_numpy(),
+                    hours.hour.to_numpy(dtype=np.int32),
+                    hours.day.to_numpy(dtype=np.int32),
+                    hours.month.to_numpy(dtype=np.int32),
+                    hours.dayofweek.to_numpy(dtype=np.int32),
+                    hours.year.to_numpy(dtype=np.int32),
+                    np.asarray(time_of_day(hours.hour), dtype=object),
+                    hours.dayofweek.to_numpy() >= 5
+                ],
+                'ON CONFLICT (time_id) DO NOTHING'
+            )
+            self.time_months.update(new_months)
+            
+            self.performance.current.add_rows(rows_out=inserted)
+            logger.info(f"Wrote the {inserted} hours of {len(new_months)} months to time_dimensions")
+            return True
+        
         except Exception as e:
             self.conn.rollback()
             logger.error(f"Failed to populate time_dimensions: {e}")
             return False
     
+    @_timed_phase
     def populate_locations(self, df):
         """Populate locations table with unique pickup and dropoff locations"""
         logger.info("Populating locations table...")
+        known_map = self.location_map
         
         try:
-            # Get unique pickup locations
-            pickup_locs = df[['pickup_latitude', 'pickup_longitude']].drop_duplicates()
-            pickup_locs.columns = ['latitude', 'longitude']
-            pickup_locs['location_type'] = 'pickup'
-            
-            # Get unique dropoff locations
-            dropoff_locs = df[['dropoff_latitude', 'dropoff_longitude']].drop_duplicates()
-            dropoff_locs.columns = ['latitude', 'longitude']
-            dropoff_locs['location_type'] = 'dropoff'
-            
-            # Combine and remove duplicates
-            all_locations = pd.concat([pickup_locs, dropoff_locs])
-            all_locations = all_locations.drop_duplicates(subset=['latitude', 'longitude'])
+            # Unique locations at the table's precision, first coordinates of each key
+            pickup_keys = coordinate_keys(df['pickup_latitude'], df['pickup_longitude'])
+            dropoff_keys = coordinate_keys(df['dropoff_latitude'], df['dropoff_longitude'])
+            keys, first = np.unique(np.concatenate([pickup_keys, dropoff_keys]), return_index=True)
+            all_locations = pd.DataFrame({
+                'latitude': np.concatenate([df['pickup_latitude'], df['dropoff_latitude']])[first],
+                'longitude': np.concatenate([df['pickup_longitude'], df['dropoff_longitude']])[first]
+            })
             
             # Mark locations that appear in both pickup and dropoff
-            pickup_set = set(map(tuple, pickup_locs[['latitude', 'longitude']].values))
-            dropoff_set = set(map(tuple, dropoff_locs[['latitude', 'longitude']].values))
-            both_set = pickup_set & dropoff_set
-            
-            all_locations['location_type'] = all_locations.apply(
-                lambda row: 'both' if (row['latitude'], row['longitude']) in both_set 
-                else row['location_type'], axis=1
+            is_pickup = np.isin(keys, pickup_keys)
+            is_dropoff = np.isin(keys, dropoff_keys)
+            all_locations['location_type'] = np.where(
+                is_pickup & is_dropoff, 'both', np.where(is_pickup, 'pickup', 'dropoff')
             )
             
-            # Convert to list of tuples
-            location_records = [
-                (float(row['latitude']), float(row['longitude']), row['location_type'])
-                for _, row in all_locations.iterrows()
-            ]
+            # Taxi zone and borough of every location
+            zone_names = boroughs = np.full(len(all_locations), None, dtype=object)
+            if self.zone_index is not None:
+                with self.performance.stage('assign_zones', rows_in=len(all_locations)) as stage:
+                    zone_names, boroughs = self.zone_index.assign(
+                        all_locations['latitude'].to_numpy(), all_locations['longitude'].to_numpy()
+                    )
+                    matched = int(pd.notna(zone_names).sum())
+                    stage.add_rows(rows_out=matched)
+                logger.info(f"Assigned taxi zones to {matched} of {len(all_locations)} locations")
             
-            # Batch insert
-            insert_query = """
-                INSERT INTO locations (latitude, longitude, location_type)
-                VALUES %s
-                ON CONFLICT (latitude, longitude) DO NOTHING
-            """
+            # Ids of locations loaded before, reserved ones for the rest
+            self.location_map, unknown, reserved = self._assign_ids(
+                'locations', 'location_id', self.location_map, keys,
+                ['latitude', 'longitude'],
+                [all_locations['latitude'].to_numpy(), all_locations['longitude'].to_numpy()],
+                lambda lat, lon: coordinate_keys(np.array(lat, dtype=np.float64), np.array(lon, dtype=np.float64)),
+                'd.latitude = k.latitude::DECIMAL(10, 7) AND d.longitude = k.longitude::DECIMAL(10, 7)'
+            )
             
-            execute_values(self.cursor, insert_query, location_records, page_size=1000)
-            self.conn.commit()
+            # Batch insert of the new locations; ones loaded before zones were
+            # known get them now
+            write = reserved | (unknown & pd.notna(zone_names))
+            inserted = self._write_rows(
+                'locations',
+                ['location_id', 'latitude', 'longitude', 'location_type', 'zone_name', 'borough'],
+                [
+                    self.location_map.resolve(keys[write]).astype(np.int32),
+                    all_locations['latitude'].to_numpy()[write],
+                    all_locations['longitude'].to_numpy()[write],
+                    all_locations['location_type'].to_numpy(dtype=object)[write],
+                    zone_names[write],
+                    boroughs[write]
+                ],
+                """ON CONFLICT (latitude, longitude) DO UPDATE
+                    SET zone_name = EXCLUDED.zone_name, borough = EXCLUDED.borough
+                    WHERE locations.zone_name IS NULL AND EXCLUDED.zone_name IS NOT NULL"""
+            )
             
-            logger.info(f"Inserted {len(location_records)} unique location records")
+            self.performance.current.add_rows(rows_out=inserted)
+            logger.info(f"Wrote {inserted} location records ({int(reserved.sum())} new)")
             return True
             
         except Exception as e:
             self.conn.rollback()
+            self.location_map = known_map
             logger.error(f"Failed to populate locations: {e}")
             return False
     
-    def get_location_id_map(self):
-        """Create a mapping of (lat, lon) -> location_id for fast lookups"""
-        logger.info("Creating location ID mapping...")
-        
-        self.cursor.execute("SELECT location_id, latitude, longitude FROM locations")
-        location_map = {
-    (round(float(row[1]), 6), round(float(row[2]), 6)): row[0] 
-    for row in self.cursor.fetchall()
-}        
-        logger.info(f"Created location map with {len(location_map)} entries")
-        return location_map
-    
-    def get_time_id_map(self):
-        """Create a mapping of pickup_datetime -> time_id for fast lookups"""
-        logger.info("Creating time ID mapping...")
-        
-        self.cursor.execute("SELECT time_id, pickup_datetime FROM time_dimensions")
-        time_map = {row[1]: row[0] for row in self.cursor.fetchall()}
-        
-        logger.info(f"Created time map with {len(time_map)} entries")
-        return time_map
-    
-    def populate_trip_facts(self, df, location_map, time_map, batch_size=1000):
-        """Populate trip_facts table with main trip data"""
+    @_timed_phase
+    def populate_trip_facts(self, df, location_map, time_map, batch_size=None, indexed=None):
+        """
+        Populate trip_facts table with main trip data. `indexed` masks the
+        rows the trip index knows are loaded; they are skipped unchecked.
+        """
         logger.info("Populating trip_facts table...")
         
         try:
-            df['pickup_datetime'] = pd.to_datetime(df['pickup_datetime'])
-            df['dropoff_datetime'] = pd.to_datetime(df['dropoff_datetime'])
+            df['pickup_datetime'] = parse_timestamps(df['pickup_datetime'])
+            df['dropoff_datetime'] = parse_timestamps(df['dropoff_datetime'])
+            
+            # Resolve surrogate keys for whole columns at once
+            pickup_ids = location_map.resolve(coordinate_keys(df['pickup_latitude'], df['pickup_longitude']))
+            dropoff_ids = location_map.resolve(coordinate_keys(df['dropoff_latitude'], df['dropoff_longitude']))
+            if self.time_grain == 'hour':
+                # Smart keys straight from the timestamps, for the months whose hours are written
+                time_ids = hour_keys(df['pickup_datetime'])
+                time_ids[~np.isin(month_codes(df['pickup_datetime'].to_numpy()), list(self.time_months))] = MISSING_ID
+            else:
+                time_ids = time_map.resolve(time_keys(df['pickup_datetime']))
             
+            # Rows that cannot be loaded, by reason (the dimensions skip indexed trips)
+            indexed = np.zeros(len(df), dtype=bool) if indexed is None else indexed
+            rejections = {
+                'unknown pickup location': (pickup_ids == MISSING_ID) & ~indexed,
+                'unknown dropoff location': (dropoff_ids == MISSING_ID) & ~indexed,
+                'unknown pickup time': (time_ids == MISSING_ID) & ~indexed,
+                'missing values': df[TRIP_FACT_COLUMNS].isna().any(axis=1).to_numpy() & ~indexed
+            }
+            rejected = np.logical_or.reduce(list(rejections.values()))
+            for reason, mask in rejections.items():
+                if mask.any():
+                    logger.warning(f"{int(mask.sum())} records rejected: {reason}")
+            
+            keep = ~rejected & ~indexed
             total_records = len(df)
-            inserted_records = 0
-            rejected_records = 0
-            
-            # Process in batches
-            for start_idx in tqdm(range(0, total_records, batch_size), desc="Loading trips"):
-                end_idx = min(start_idx + batch_size, total_records)
-                batch_df = df.iloc[start_idx:end_idx]
-                
-                trip_records = []
-                
-                for _, row in batch_df.iterrows():
-                    try:
-                        # Get location IDs
-                        pickup_loc_id = location_map.get(
-                            (round(float(row['pickup_latitude']), 6), round(float(row['pickup_longitude']), 6))
-                        )
-                        dropoff_loc_id = location_map.get(
-                            (round(float(row['dropoff_latitude']), 6), round(float(row['dropoff_longitude']), 6))
-                        )
-                        
-                        # Get time ID
-                        time_id = time_map.get(pd.Timestamp(row['pickup_datetime']))
-                        
-                        if pickup_loc_id and dropoff_loc_id and time_id:
-                            trip_records.append((
-                                str(row['id']),
-                                int(row['vendor_id']),
-                                pickup_loc_id,
-                                dropoff_loc_id,
-                                time_id,
-                                row['pickup_datetime'],
-                                row['dropoff_datetime'],
-                                int(row['trip_duration']),
-                                float(row['trip_distance_km']),
-                                float(row['trip_speed_kmh']),
-                                float(row['trip_efficiency']),
-                                int(row['passenger_count']),
-                                str(row['store_and_fwd_flag']).upper()
-                            ))
-                        else:
-                            rejected_records += 1
-                            
-                    except Exception as e:
-                        rejected_records += 1
-                        logger.warning(f"Skipped record {row.get('id', 'unknown')}: {e}")
-                
-                # Batch insert
-                if trip_records:
-                    insert_query = """
-                        INSERT INTO trip_facts 
-                        (trip_id, vendor_id, pickup_location_id, dropoff_location_id, time_id,
-                         pickup_datetime, dropoff_datetime, trip_duration, trip_distance_km,
-                         trip_speed_kmh, trip_efficiency, passenger_count, store_and_fwd_flag)
-                        VALUES %s
-                        ON CONFLICT (trip_id) DO NOTHING
-                    """
-                    
-                    execute_values(self.cursor, insert_query, trip_records, page_size=1000)
-                    self.conn.commit()
-                    inserted_records += len(trip_records)
+            rejected_records = int(rejected.sum())
             
-            logger.info(f"Successfully inserted {inserted_records} trip records")
-            logger.info(f"Rejected {rejected_records} records due to missing references")
+            # Months of the trips, by partition of trip_facts
+            replacing = self.replace_months
+            if replacing and not self.partitioned:
+                raise RuntimeError("Replacing months needs a trip_facts partitioned by month")
+            codes = month_codes(df['pickup_datetime'].to_numpy()[keep])
+            months = [month_of(code) for code in np.unique(codes)]
+            if self.partitioned and not replacing:
+                create_partitions(self.cursor, months)
+                self.conn.commit()
+            self.reconciliation.watch(self.cursor, codes, replacing)
             
-            # Log to data_quality_log table
-            self.cursor.execute("""
-                INSERT INTO data_quality_log 
-                (total_records_processed, records_inserted, records_rejected, 
-                 rejection_reason, load_status)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (
-                total_records,
-                inserted_records,
-                rejected_records,
-                'Missing location or time references',
-                'SUCCESS' if rejected_records == 0 else 'PARTIAL'
-            ))
+            # Trips an earlier load inserted are skipped (and kept out of the summary
+            # totals), except those of months being replaced. A trip index holds
+            # every loaded trip, so the rest need no check in the database.
+            trip_ids = df['id'].astype(str).to_numpy(dtype=object)
+            if self._trip_index_usable():
+                loaded = np.zeros(int(keep.sum()), dtype=bool)
+            else:
+                loaded = self._loaded_trips(trip_ids[keep], months if replacing else ())
+            if loaded.any():
+                keep[np.flatnonzero(keep)[loaded]] = False
+            if loaded.any() or indexed.any():
+                logger.info(f"Skipping {int(loaded.sum() + indexed.sum())} records already loaded")
+            
+            names = ['trip_id', 'vendor_id', 'pickup_location_id', 'dropoff_location_id', 'time_id',
+                     'pickup_datetime', 'dropoff_datetime', 'trip_duration', 'trip_distance_km',
+                     'trip_speed_kmh', 'trip_efficiency', 'passenger_count', 'store_and_fwd_flag']
+            columns = [
+                trip_ids[keep],
+                df['vendor_id'].to_numpy(dtype=np.int32, na_value=0)[keep],
+                pickup_ids[keep].astype(np.int32),
+                dropoff_ids[keep].astype(np.int32),
+                time_ids[keep].astype(np.int32),
+                df['pickup_datetime'].to_numpy()[keep],
+                df['dropoff_datetime'].to_numpy()[keep],
+                df['trip_duration'].to_numpy(dtype=np.int32, na_value=0)[keep],
+                df['trip_distance_km'].to_numpy(dtype=np.float64)[keep],
+                df['trip_speed_kmh'].to_numpy(dtype=np.float64)[keep],
+                df['trip_efficiency'].to_numpy(dtype=np.float64)[keep],
+                df['passenger_count'].to_numpy(dtype=np.int32, na_value=0)[keep],
+                df['store_and_fwd_flag'].astype(str).str.upper().to_numpy(dtype=object)[keep]
+            ]
+            # A partitioned trip_facts' primary key includes the partition key
+            conflict = (f'ON CONFLICT (trip_id, {PARTITION_KEY}) DO NOTHING' if self.partitioned
+                        else 'ON CONFLICT (trip_id) DO NOTHING')
+            
+            # Input row after each written row, for the checkpoints
+            resume_rows = self.input_offset + np.flatnonzero(keep) + 1
+            
+            # Summary totals of each batch, merged in the batch's transaction
+            trips = dict(zip(names, columns))
+            merged = 0
+            
+            def before_commit(end):
+                nonlocal merged
+                self._merge_aggregates({name: column[merged:end] for name, column in trips.items()})
+                merged = end
+                self._advance_generation()
+                if self.checkpoints is not None:
+                    self.checkpoints.record(resume_rows[end - 1])
+            
+            # Batch insert, batch_size rows per transaction (or per worker statement)
+            parallel = self.workers and self.workers > 1
+            write_rows = self._write_rows_parallel if parallel else self._write_rows
+            batch_size = batch_size or DEFAULT_BATCH_SIZES[self.method]
+            if replacing:
+                # Loaded beside trip_facts and swapped in with their summary totals
+                inserted_records = self._replace_months(names, columns, codes[~loaded], conflict, batch_size)
+            elif self.bulk:
+                # Staged as they are, then moved into trip_facts in one statement
+                self._create_bulk_staging(names, columns)
+                try:
+                    write_rows(BULK_STAGING_TABLE, names, columns, None, batch_size, progress="Staging trips")
+                    inserted_records = self._move_bulk('trip_facts', names, conflict)
+                finally:
+                    self._drop_bulk_staging()
+            elif parallel:
+                inserted_records = write_rows('trip_facts', names, columns, conflict, batch_size,
+                                              progress="Loading trips")
+            else:
+                # Each batch written straight into the partitions of its months
+                route = functools.partial(route_batch, names) if self.partitioned else None
+                inserted_records = write_rows('trip_facts', names, columns, conflict, batch_size,
+                                              progress="Loading trips", before_commit=before_commit, route=route)
+            
+            if (self.bulk or parallel) and not replacing:
+                # The trips committed in transactions of their own; their totals follow
+                self._merge_aggregates(trips)
+            if self.checkpoints is not None:
+                self.checkpoints.record(self.input_offset + total_records, completed=True)
             self.conn.commit()
+            self.reconciliation.add(columns[0], columns[7], columns[8], codes[~loaded])
+            if self.trip_index is not None and self.trip_index.ids is not None:
+                if replacing:
+                    # Trips of the replaced months are gone, unknown to the index
+                    self.trip_index.discard()
+                else:
+                    self.trip_index.add(columns[0])
+            
+            logger.info(f"Successfully inserted {inserted_records} trip records")
+            logger.info(f"Rejected {rejected_records} records due to missing references or values")
+            
+            # Written to data_quality_log by log_load() once every phase has
+            # run; a streamed load adds up the counts of its chunks. A row can
+            # fail several checks, so the reasons may add up to more than rejected.
+            counts = self.fact_counts or {'total': 0, 'inserted': 0, 'rejected': 0, 'reasons': {}}
+            reasons = dict(counts['reasons'])
+            for reason, mask in rejections.items():
+                reasons[reason] = reasons.get(reason, 0) + int(mask.sum())
+            reasons['already loaded (skipped)'] = (reasons.get('already loaded (skipped)', 0)
+                                                   + int(loaded.sum() + indexed.sum()))
+            self.fact_counts = {
+                'total': counts['total'] + total_records,
+                'inserted': counts['inserted'] + inserted_records,
+                'rejected': counts['rejected'] + rejected_records,
+                'reasons': reasons
+            }
+            self.performance.current.add_rows(rows_out=inserted_records)
             
             return True
             
@@ -283,81 +720,697 @@ class DatabaseLoader:
             logger.error(f"Failed to populate trip_facts: {e}")
             return False
     
-    def verify_data_integrity(self):
-        """Verify data was loaded correctly"""
-        logger.info("\n=== Data Integrity Check ===")
+    def _loaded_trips(self, trip_ids, except_months=()):
+        """
+        Mask of the trip ids already in trip_facts, found by joining just these
+        ids against it; trips picked up in `except_months` do not count.
+        """
+        self.cursor.execute("SELECT trip_id FROM trip_facts LIMIT 1")
+        if self.cursor.fetchone() is None:
+            self.conn.commit()
+            return np.zeros(len(trip_ids), dtype=bool)
+        self._stage_rows('keys_trip_facts', ['trip_id'], [trip_ids])
+        excluded = [bound for month in except_months for bound in month_bounds(month)]
+        outside = ''.join(f" AND NOT (d.{PARTITION_KEY} >= %s AND d.{PARTITION_KEY} < %s)" for _ in except_months)
+        self.cursor.execute(
+            f"SELECT d.trip_id FROM trip_facts d JOIN keys_trip_facts k ON d.trip_id = k.trip_id{outside}",
+            excluded or None
+        )
+        loaded = [row[0] for row in self.cursor.fetchall()]
+        self.conn.commit()
+        return pd.Series(trip_ids).isin(loaded).to_numpy()
+    
+    def _merge_aggregates(self, trips):
+        """Add the partial aggregates of written trips to the summary tables, uncommitted"""
+        for table, names, columns in partial_aggregates(trips):
+            self._write_rows(table, names, columns, merge_clause(table), commit=False)
+    
+    def _replace_months(self, names, columns, codes, conflict, batch_size):
+        """
+        Replace the partitions of the months in `codes` (the month code of
+        every row) with the trips given: each month is loaded into a
+        replacement table of its own, committed batch by batch while
+        trip_facts is untouched, then every replacement is swapped in for its
+        month's partition in one transaction that also moves the summary
+        totals from the old trips to the new. A failure before that commit
+        leaves trip_facts as it was. Returns the number of rows written.
+        """
+        parallel = self.workers and self.workers > 1
+        write_rows = self._write_rows_parallel if parallel else self._write_rows
+        months = [month_of(code) for code in np.unique(codes)]
+        written = 0
+        try:
+            for code, month in zip(np.unique(codes), months):
+                table = create_replacement(self.cursor, month)
+                self.conn.commit()
+                rows = codes == code
+                written += write_rows(table, names, [column[rows] for column in columns], conflict, batch_size,
+                                      progress=f"Loading {table}")
+            
+            with self.performance.stage('swap_partitions'):
+                for month in months:
+                    partition = attached_partition(self.cursor, month)
+                    if partition:
+                        add_totals(self.cursor, partition, sign=-1)
+                    add_totals(self.cursor, replacement_name(month))
+                    swap_partition(self.cursor, month)
+                self._advance_generation()
+                self.conn.commit()
+            logger.info(f"Replaced the trips of {len(months)} months: "
+                        f"{', '.join(f'{year:04d}-{number:02d}' for year, number in months)}")
+            return written
+        except Exception:
+            self._drop_replacements(months)
+            raise
+    
+    def _drop_replacements(self, months):
+        try:
+            self.conn.rollback()
+            for month in months:
+                self.cursor.execute(f"DROP TABLE IF EXISTS {replacement_name(month)}")
+            self.conn.commit()
+        except psycopg2.Error as e:
+            logger.error(f"Failed to drop the replacement tables: {e}")
+    
+    def _create_bulk_staging(self, names, columns):
+        """(Re)create the UNLOGGED, index-free table the trips are staged in, typed for COPY"""
+        definitions = ', '.join(f'{name} {column_type(column)}' for name, column in zip(names, columns))
+        self.cursor.execute(f"DROP TABLE IF EXISTS {BULK_STAGING_TABLE}")
+        self.cursor.execute(f"CREATE UNLOGGED TABLE {BULK_STAGING_TABLE} ({definitions})")
+        self.conn.commit()
+    
+    def _drop_bulk_staging(self):
+        try:
+            self.conn.rollback()
+            self.cursor.execute(f"DROP TABLE IF EXISTS {BULK_STAGING_TABLE}")
+            self.conn.commit()
+        except psycopg2.Error as e:
+            logger.error(f"Failed to drop {BULK_STAGING_TABLE}: {e}")
+    
+    def _move_bulk(self, table, names, conflict):
+        """
+        Move the staged trips into `table` in one transaction: drop its
+        secondary indexes and foreign keys, INSERT ... SELECT every row, then
+        rebuild the indexes and re-add the foreign keys, each validated in one
+        pass instead of per row. DDL is transactional, so a failure at any step
+        leaves `table` exactly as it was. The table is locked against readers
+        until the commit. Returns the number of rows inserted.
+        """
+        try:
+            self.cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+            for setting, value in BULK_SETTINGS.items():
+                self.cursor.execute(f"SET LOCAL {setting} = %s", (str(value),))
+            
+            # Indexes not backing a constraint (the primary key stays for ON CONFLICT)
+            self.cursor.execute("""
+                SELECT i.relname, pg_get_indexdef(i.oid)
+                FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+                WHERE x.indrelid = %s::regclass
+                  AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+            """, (table,))
+            indexes = self.cursor.fetchall()
+            self.cursor.execute("""
+                SELECT conname, pg_get_constraintdef(oid)
+                FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'
+            """, (table,))
+            foreign_keys = self.cursor.fetchall()
+            
+            with self.performance.stage('bulk_drop_indexes'):
+                for name, _ in foreign_keys:
+                    self.cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+                for name, _ in indexes:
+                    self.cursor.execute(f"DROP INDEX {name}")
+            logger.info(f"Dropped {len(indexes)} indexes and {len(foreign_keys)} foreign keys of {table}")
+            
+            with self.performance.stage('bulk_move') as call:
+                column_list = ', '.join(names)
+                self.cursor.execute(f"""
+                    INSERT INTO {table} ({column_list})
+                    SELECT {column_list} FROM {BULK_STAGING_TABLE}
+                    {conflict}
+                """)
+                inserted = self.cursor.rowcount
+                call.add_rows(rows_out=inserted)
+                self._advance_generation()
+            
+            with self.performance.stage('bulk_rebuild_indexes'):
+                for _, definition in indexes:
+                    # A partitioned table's indexes read ON ONLY; rebuilt, they cover every partition
+                    self.cursor.execute(definition.replace(' ON ONLY ', ' ON ', 1))
+            
+            with self.performance.stage('bulk_validate_constraints'):
+                for name, definition in foreign_keys:
+                    if self.partitioned:
+                        # Partitioned tables take no NOT VALID foreign keys; added, they are checked at once
+                        self.cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+                        continue
+                    self.cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition} NOT VALID")
+                    self.cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+            
+            self.conn.commit()
+            logger.info(f"Moved {inserted} rows into {table} and rebuilt its indexes")
+            
+            # Planner statistics for the new rows
+            self.cursor.execute(f"ANALYZE {table}")
+            self.conn.commit()
+            return inserted
+        except Exception:
+            self.conn.rollback()
+            logger.error(f"Bulk load of {table} failed; its indexes and foreign keys are unchanged")
+            raise
+    
+    def _write_rows_parallel(self, table, names, columns, conflict, batch_size=None, progress=None):
+        """
+        _write_rows on `workers` processes, each with its own connection and a
+        shard of the rows by hash of the first column. Every worker writes its
+        shard in one transaction and reports; only if all succeed are all
+        told to commit, otherwise all roll back and this raises. A worker that
+        dies, or has not reported within worker_timeout seconds, fails the
+        load: a hung one is terminated, which drops its connection and so
+        rolls its transaction back. (A commit failing after others succeeded
+        is the one case not undone.)
+        """
+        shards = pd.util.hash_array(np.asarray(columns[0])) % np.uint64(self.workers)
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        workers = []
+        for index in range(self.workers):
+            rows = shards == index
+            decision, send_decision = context.Pipe(duplex=False)
+            task = {
+                'index': index,
+                'loader': {**self.conn_params, 'method': self.method, 'copy_format': self.copy_format,
+                           'pipeline_depth': self.pipeline_depth, 'prepare_threads': self.prepare_threads},
+                'table': table,
+                'names': names,
+                'columns': [column[rows] for column in columns],
+                'conflict': conflict,
+                'batch_size': batch_size,
+                # One transaction of the load advances trip_facts' generation
+                'advance_generation': index == 0 and table == 'trip_facts'
+            }
+            process = context.Process(target=_write_shard, args=(task, decision, results), daemon=True)
+            process.start()
+            workers.append((process, send_decision))
+        logger.info(f"Writing {len(columns[0])} {table} rows on {self.workers} connections")
         
-        queries = {
-            'Total Trips': 'SELECT COUNT(*) FROM trip_facts',
-            'Total Locations': 'SELECT COUNT(*) FROM locations',
-            'Total Time Dimensions': 'SELECT COUNT(*) FROM time_dimensions',
-            'Average Trip Distance (km)': 'SELECT ROUND(AVG(trip_distance_km)::NUMERIC, 2) FROM trip_facts',
-            'Average Trip Duration (sec)': 'SELECT ROUND(AVG(trip_duration)::NUMERIC, 2) FROM trip_facts',
-            'Average Speed (km/h)': 'SELECT ROUND(AVG(trip_speed_kmh)::NUMERIC, 2) FROM trip_facts',
-            'Date Range': 'SELECT MIN(pickup_datetime), MAX(pickup_datetime) FROM trip_facts'
-        }
+        try:
+            # Phase 1: every shard written, uncommitted
+            reports = self._collect_reports(workers, results, self.worker_timeout)
+            failed = {index: detail for index, (status, detail) in reports.items() if status != 'ready'}
+            outcome = 'rollback' if failed else 'commit'
+            for process, send_decision in workers:
+                try:
+                    send_decision.send(outcome)
+                except OSError:
+                    pass  # exited; its report is in already
+            
+            # Phase 2: all shards committed or rolled back; the workers that
+            # failed phase 1 without exiting are asked to roll back but not
+            # waited on again
+            gone = {index: reports[index] for index, (process, _) in enumerate(workers)
+                    if not process.is_alive()}
+            finals = self._collect_reports(workers, results, self.worker_timeout, gone)
+            for status, detail in reports.values():
+                if status == 'ready':
+                    self.performance.merge(detail)
+            unfinished = {index: detail for index, (status, detail) in finals.items()
+                          if status not in ('committed', 'rolled back')}
+            for status, detail in finals.values():
+                if status == 'committed' and detail is not None:
+                    self._follow_generation(detail)
+        finally:
+            for process, _ in workers:
+                process.join(timeout=60)
+                if process.is_alive():
+                    process.terminate()
         
-        for description, query in queries.items():
-            self.cursor.execute(query)
-            result = self.cursor.fetchone()
-            logger.info(f"{description}: {result[0] if len(result) == 1 else result}")
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {self.workers} workers failed, all rolled back: "
+                               f"{'; '.join(f'worker {i}: {d}' for i, d in sorted(failed.items()))}")
+        if unfinished:
+            raise RuntimeError(f"{len(unfinished)} of {self.workers} workers failed to commit: "
+                               f"{'; '.join(f'worker {i}: {d}' for i, d in sorted(unfinished.items()))}")
+        return len(columns[0])
+    
+    @staticmethod
+    def _collect_reports(workers, results, timeout, reports=None):
+        """
+        One (status, detail) report per worker, beyond those in `reports`. A
+        worker that died reports 'failed'; one still silent after `timeout`
+        seconds is terminated and reports 'failed' too.
+        """
+        reports = dict(reports or {})
+        deadline = time.monotonic() + timeout
+        while len(reports) < len(workers):
+            try:
+                index, status, detail = results.get(timeout=1)
+                if index not in reports:
+                    reports[index] = (status, detail)
+            except queue.Empty:
+                for index, (process, _) in enumerate(workers):
+                    if index not in reports and not process.is_alive():
+                        reports[index] = ('failed', f'exited with code {process.exitcode}')
+                if time.monotonic() >= deadline:
+                    for index, (process, _) in enumerate(workers):
+                        if index not in reports:
+                            process.terminate()
+                            process.join(timeout=10)
+                            reports[index] = ('failed', f'no report within {timeout} s, terminated')
+        return reports
+    
+    @_timed_phase
+    def reconcile_load(self):
+        """
+        Check every month the load wrote: trip_facts has to hold its trips
+        before the load plus the trips written (see load_reconciliation.py).
+        The input is checked against the cleaner's log too, but only a
+        mismatch in trip_facts fails the load. False on a mismatch.
+        """
+        logger.info("\n=== Load Reconciliation ===")
+        try:
+            report = self.reconciliation.reconcile(self.cursor)
+            self.conn.commit()
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            logger.error(f"Failed to reconcile the load: {e}")
+            return False
+        
+        for month, fingerprints in report['months'].items():
+            expected, found = fingerprints['expected'], fingerprints['found']
+            if expected == found:
+                logger.info(f"{month}: {found['trips']} trips, as written")
+            else:
+                logger.error(f"{month}: trip_facts holds {found}, expected {expected}")
+        if self.cleaning_check is not None:
+            report['cleaning_log'] = self.cleaning_check
+            if self.cleaning_check['matches']:
+                logger.info(f"Input matches the cleaning log ({self.cleaning_check['trips'][1]} trips)")
+            else:
+                logger.warning(f"Input differs from the cleaning log {self.cleaning_check['log']}: "
+                               f"{self.cleaning_check}")
+        self.reconciliation_report = report
         
-        logger.info("=== Data Integrity Check Complete ===\n")
+        logger.info("=== Load Reconciliation Complete ===\n")
+        return report['matches']
+    
+    @_timed_phase
+    def start_aggregates(self):
+        """Create the summary tables behind the analytics views if the database lacks them"""
+        try:
+            if create_summary_tables(self.cursor):
+                logger.info("Created the summary tables of the analytics views from trip_facts")
+            self.conn.commit()
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            logger.error(f"Failed to create the summary tables: {e}")
+    
+    @_timed_phase
+    def start_partitions(self):
+        """
+        Find out whether trip_facts is partitioned by month and, if so, make
+        sure trip_ids guards its trip ids (see trip_partitions.py); True if
+        the load can go on.
+        """
+        try:
+            self.partitioned = is_partitioned(self.cursor)
+            if self.partitioned and create_trip_id_guard(self.cursor):
+                logger.info("Created trip_ids, keeping the trip ids of the partitioned trip_facts unique")
+            self.conn.commit()
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            self.partitioned = False
+            logger.error(f"Failed to set up the partitions of trip_facts: {e}")
+            return False
+        if self.partitioned:
+            logger.info("trip_facts is partitioned by month; loading into the partitions of the months loaded")
+        return True
+    
+    @_timed_phase
+    def start_time_dimensions(self):
+        """Check that time_dimensions holds no rows of the other grain; True if so"""
+        try:
+            self.cursor.execute("SELECT MIN(time_id), MAX(time_id) FROM time_dimensions")
+            low, high = self.cursor.fetchone()
+            self.conn.commit()
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            logger.error(f"Failed to read time_dimensions: {e}")
+            return False
+        if low is None:
+            return True
+        grains = {'hour' if time_id >= HOUR_KEY_MIN else 'second' for time_id in (low, high)}
+        if grains != {self.time_grain}:
+            logger.error(f"time_dimensions holds rows of the {' and '.join(sorted(grains))} grain; "
+                         f"it cannot be loaded with the {self.time_grain} grain")
+            return False
+        return True
+    
+    @_timed_phase
+    def start_trip_index(self):
+        """
+        Create trip_facts' generation counter if the database lacks it, then
+        open the index of the trip ids loaded, rebuilding it from trip_facts
+        if it is out of date; True if the load can go on.
+        """
+        try:
+            if create_generation(self.cursor):
+                logger.info("Created trip_facts_generation, counting the transactions writing trip_facts")
+            self.conn.commit()
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            logger.error(f"Failed to create trip_facts' generation counter: {e}")
+            return False
+        if self.trip_index is None:
+            return True
+        try:
+            if self.trip_index.open(self.conn):
+                logger.info(f"Trip index {self.trip_index.path}: {len(self.trip_index.ids)} trips")
+            else:
+                logger.info(f"Rebuilt trip index {self.trip_index.path} from trip_facts: "
+                            f"{len(self.trip_index.ids)} trips")
+        except (psycopg2.Error, OSError, ValueError) as e:
+            self.conn.rollback()
+            self.trip_index.ids = None
+            logger.error(f"Trip index unavailable, checking trip ids in the database: {e}")
+        return True
+    
+    def _advance_generation(self):
+        """Advance trip_facts' generation in the current transaction, which writes trips"""
+        self._follow_generation(advance_generation(self.cursor))
+    
+    def _follow_generation(self, generation):
+        if self.trip_index is not None and self.trip_index.ids is not None:
+            self.trip_index.follow(generation)
+    
+    def _save_trip_index(self, success):
+        """
+        Save the trip index after a load, or drop it if the load failed or
+        someone else wrote to trip_facts meanwhile (the index may be behind)
+        """
+        if self.trip_index is None or self.trip_index.ids is None:
+            return
+        try:
+            if not success:
+                self.trip_index.discard()
+                logger.info("Discarded the trip index after the failed load; the next load rebuilds it")
+                return
+            if self.trip_index.behind:
+                self.trip_index.discard()
+                logger.info("Discarded the trip index: trip_facts was written to by someone else during "
+                            "the load; the next load rebuilds it")
+                return
+            self.trip_index.save()
+        except OSError as e:
+            logger.error(f"Failed to save the trip index: {e}")
+    
+    @_timed_phase
+    def start_checkpoints(self, resume=False):
+        """
+        Set up the checkpoints of the loaded input. Returns the input row to
+        start at: 0, or with `resume` the first uncommitted one (None when the
+        input was already loaded completely).
+        """
+        self.checkpoints, self.input_offset = None, 0
+        if self.input is None:
+            return 0
+        checkpoints = LoadCheckpoints(self.cursor, input_identity(*self.input), self.input[0])
+        try:
+            checkpoints.create_table()
+            state = checkpoints.get() if resume else None
+            if state is None:
+                checkpoints.record(0)
+            self.conn.commit()
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            logger.error(f"Checkpoints unavailable, loading without them: {e}")
+            return 0
+        
+        self.checkpoints = checkpoints
+        if state is None:
+            return 0
+        rows_committed, completed = state
+        if completed:
+            return None
+        return int(rows_committed)
+    
+    def load(self, df, batch_size=None, resume=False):
+        """
+        Populate every table from the cleaned frame, verify and log the load;
+        True on success. With `resume`, input rows an earlier load of the same
+        input committed are skipped.
+        """
+        self.fact_counts = None
+        self.reconciliation = LoadReconciliation()
+        if not self.start_time_dimensions():
+            return self._finish_load(False)
+        self.start_aggregates()
+        if not self.start_partitions():
+            return self._finish_load(False)
+        if not self.start_trip_index():
+            return self._finish_load(False)
+        start = self.start_checkpoints(resume)
+        if start is None:
+            logger.info("This input was already loaded completely; nothing to resume")
+            return True
+        if start:
+            logger.info(f"Resuming at input row {start} of {len(df)}")
+            df = df.iloc[start:].copy()
+            self.input_offset = start
+        
+        success = self.load_chunk(df, batch_size)
+        return self._finish_load(success)
+    
+    def load_stream(self, chunks, batch_size=None):
+        """
+        Populate every table from an iterable of cleaned frames, each loaded
+        as it arrives (e.g. straight from the cleaner), then verify and log
+        the load as one; True on success. A stream has no input to identify,
+        so it is loaded without checkpoints and cannot be resumed.
+        """
+        self.fact_counts = None
+        self.reconciliation = LoadReconciliation()
+        if not self.start_time_dimensions():
+            return self._finish_load(False)
+        self.start_aggregates()
+        if not self.start_partitions():
+            return self._finish_load(False)
+        if not self.start_trip_index():
+            return self._finish_load(False)
+        self.checkpoints, self.input_offset = None, 0
+        
+        success = True
+        try:
+            for number, df in enumerate(chunks, start=1):
+                logger.info(f"Loading chunk {number}: {len(df)} records")
+                if not self.load_chunk(df, batch_size):
+                    success = False
+        except Exception as e:
+            logger.error(f"Chunk stream failed: {e}")
+            success = False
+        
+        return self._finish_load(success)
+    
+    def load_chunk(self, df, batch_size=None):
+        """Populate the dimensions, then the facts, from one cleaned frame; True on success"""
+        success = True
+        
+        # Trips the trip index knows are loaded need no dimension rows either
+        indexed = None
+        new_trips = df
+        if self._trip_index_usable():
+            indexed = self.trip_index.contains(df['id'].astype(str).to_numpy(dtype=object))
+            if indexed.any():
+                new_trips = df[~indexed].copy()
+        
+        # 1. Time dimensions
+        if not self.populate_time_dimensions(new_trips):
+            success = False
+        
+        # 2. Locations
+        if not self.populate_locations(new_trips):
+            success = False
+        
+        # 3. Trip facts, with the dimension ids assigned above
+        if not self.populate_trip_facts(df, self.location_map, self.time_map, batch_size, indexed):
+            success = False
+        return success
+    
+    def _trip_index_usable(self):
+        """Whether known trips are found in the trip index (not when replacing the months they are in)"""
+        return self.trip_index is not None and self.trip_index.ids is not None and not self.replace_months
+    
+    def _finish_load(self, success):
+        # Check what a completed load wrote; a mismatch fails it
+        self.reconciliation_report = None
+        if success and not self.reconcile_load():
+            success = False
+        self._save_trip_index(success)
+        
+        # Record the load, with per-phase performance
+        self.log_load(success)
+        return success
+    
+    def log_load(self, success):
+        """Record the load and its per-phase performance in data_quality_log"""
+        logger.info("=== Performance by phase ===")
+        for line in self.performance.format_lines():
+            logger.info(line)
+        
+        counts = self.fact_counts or {'total': 0, 'inserted': 0, 'rejected': 0, 'reasons': {}}
+        if self.fact_counts is None:
+            status = 'FAILED'
+        elif success and counts['rejected'] == 0:
+            status = 'SUCCESS'
+        else:
+            status = 'PARTIAL'
+        
+        try:
+            # Databases created before the performance and reconciliation columns were added
+            self.cursor.execute(
+                "ALTER TABLE data_quality_log ADD COLUMN IF NOT EXISTS performance JSONB"
+            )
+            self.cursor.execute(
+                "ALTER TABLE data_quality_log ADD COLUMN IF NOT EXISTS reconciliation JSONB"
+            )
+            self.cursor.execute("""
+                INSERT INTO data_quality_log 
+                (total_records_processed, records_inserted, records_rejected, 
+                 rejection_reason, load_status, performance, reconciliation)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (
+                counts['total'],
+                counts['inserted'],
+                counts['rejected'],
+                '; '.join(f"{reason}: {count}" for reason, count in counts['reasons'].items() if count) or None,
+                status,
+                json.dumps(self.performance.summary()),
+                json.dumps(self.reconciliation_report) if self.reconciliation_report else None
+            ))
+            self.conn.commit()
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            logger.error(f"Failed to write data_quality_log: {e}")
+
+
+def _write_shard(task, decision, results):
+    """
+    Parallel trip_facts load (worker process): write one shard in a single
+    transaction on a connection of its own, report 'ready' (or 'failed') on
+    `results`, then commit or roll back as the parent decides on `decision`.
+    The one worker told to also advances trip_facts' generation in its
+    transaction and reports the new generation with 'committed'.
+    """
+    generation = None
+    index = task['index']
+    loader = DatabaseLoader(**task['loader'])
+    try:
+        if not loader.connect():
+            raise RuntimeError('could not connect')
+        with loader.performance.stage(f"write_{task['table']}_shard", rows_in=len(task['columns'][0])) as call:
+            written = loader._write_rows(task['table'], task['names'], task['columns'], task['conflict'],
+                                         task['batch_size'], commit=False)
+            call.add_rows(rows_out=written)
+        generation = advance_generation(loader.cursor) if task['advance_generation'] else None
+        results.put((index, 'ready', loader.performance.stages()))
+    except Exception as e:
+        results.put((index, 'failed', str(e)))
+    
+    try:
+        if decision.recv() == 'commit':
+            loader.conn.commit()
+            results.put((index, 'committed', generation))
+        else:
+            if loader.conn:
+                loader.conn.rollback()
+            results.put((index, 'rolled back', None))
+    except Exception as e:
+        results.put((index, 'failed', str(e)))
+    finally:
+        if loader.conn:
+            loader.close()
 
 
 def main():
     """Main execution function"""
     parser = argparse.ArgumentParser(description='Load cleaned NYC taxi data into PostgreSQL')
-    parser.add_argument('--csv', required=True, help='Path to cleaned CSV file')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help='Path to cleaned CSV file')
+    source.add_argument('--parquet', help='Path to cleaned Parquet dataset directory')
+    parser.add_argument('--months', nargs='+', metavar='YYYY-MM',
+                        help='Only load these months of the Parquet dataset')
     parser.add_argument('--host', default='localhost', help='Database host')
     parser.add_argument('--db', default='nyc_taxi_analytics', help='Database name')
     parser.add_argument('--user', default='postgres', help='Database user')
     parser.add_argument('--password', default='postgres', help='Database password')
     parser.add_argument('--port', type=int, default=5432, help='Database port')
-    parser.add_argument('--batch-size', type=int, default=1000, help='Batch size for inserts')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='Trip rows per batch (default 1000 for insert, 100000 for copy)')
+    parser.add_argument('--commit-every', type=int, default=1, metavar='N',
+                        help='Batches per transaction (default 1)')
+    parser.add_argument('--pipeline-depth', type=int, default=PIPELINE_DEPTH, metavar='N',
+                        help=f'Batches prepared ahead of the database writes (default {PIPELINE_DEPTH}, 0 for none)')
+    parser.add_argument('--prepare-threads', type=int, default=1, metavar='N',
+                        help='Threads preparing batches ahead (default 1)')
+    parser.add_argument('--method', choices=['insert', 'copy'], default='insert',
+                        help='Load with multi-row INSERTs or with COPY FROM STDIN')
+    parser.add_argument('--copy-format', choices=['binary', 'text'], default='binary',
+                        help='COPY format used by --method copy')
+    parser.add_argument('--zones', help='Taxi zone boundaries (GeoJSON) to assign location zones and boroughs')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Load trip_facts on N parallel connections, committed together')
+    parser.add_argument('--worker-timeout', type=float, default=WORKER_TIMEOUT, metavar='SECONDS',
+                        help='Abort a --workers load when a worker has not reported within SECONDS '
+                             f'of a phase (default {WORKER_TIMEOUT})')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip the trips an interrupted load of the same input already committed')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Stage trip_facts unlogged and rebuild its indexes and foreign keys after the load')
+    parser.add_argument('--time-grain', choices=TIME_GRAINS, default='second',
+                        help='time_dimensions row per pickup second, or per hour keyed YYYYMMDDHH')
+    parser.add_argument('--trip-index', metavar='PATH',
+                        help='File indexing the trip ids loaded, to skip known trips without asking the database')
+    parser.add_argument('--replace-months', action='store_true',
+                        help='Replace the trip_facts partitions of the months loaded, swapping them in at once')
     
     args = parser.parse_args()
+    if args.replace_months and (args.bulk or args.resume):
+        parser.error('--replace-months loads each month into a table of its own; '
+                     'it cannot be combined with --bulk or --resume')
     
     logger.info("=" * 70)
     logger.info("NYC Taxi Analytics Platform - Database Loader")
     logger.info("=" * 70)
     
     # Initialize database loader
-    loader = DatabaseLoader(args.host, args.db, args.user, args.password, args.port)
+    zone_index = None
+    if args.zones:
+        logger.info(f"Loading taxi zones: {args.zones}")
+        zone_index = ZoneIndex.from_geojson(args.zones)
+        logger.info(f"Loaded {len(zone_index.names)} taxi zones")
+    loader = DatabaseLoader(args.host, args.db, args.user, args.password, args.port, zone_index,
+                            args.method, args.copy_format, args.workers, args.bulk, args.replace_months,
+                            args.time_grain, args.trip_index, args.pipeline_depth, args.prepare_threads,
+                            args.commit_every, args.worker_timeout)
     
     # Connect to database
     if not loader.connect():
         logger.error("Failed to connect to database. Exiting.")
         sys.exit(1)
     
-    # Load CSV data
-    df = loader.load_csv(args.csv)
+    # Load cleaned data
+    if args.parquet:
+        months = parse_months(args.months) if args.months else None
+        df = loader.load_parquet(args.parquet, months)
+    else:
+        df = loader.load_csv(args.csv)
     if df is None:
-        logger.error("Failed to load CSV file. Exiting.")
+        logger.error("Failed to load cleaned data. Exiting.")
         loader.close()
         sys.exit(1)
     
-    # Populate tables in correct order (dimensions first, then facts)
-    success = True
-    
-    # 1. Time dimensions
-    if not loader.populate_time_dimensions(df):
-        success = False
-    
-    # 2. Locations
-    if not loader.populate_locations(df):
-        success = False
-    
-    # 3. Create lookup maps
-    location_map = loader.get_location_id_map()
-    time_map = loader.get_time_id_map()
-    
-    # 4. Trip facts
-    if not loader.populate_trip_facts(df, location_map, time_map, args.batch_size):
-        success = False
-    
-    # Verify data integrity
-    loader.verify_data_integrity()
+    # Populate, verify and log
+    success = loader.load(df, args.batch_size, args.resume)
     
     # Close connection
     loader.close()
@@ -0,0 +1,141 @@
+"""
+Reconciliation of a load against trip_facts and the cleaner's log.
+
+The loader fingerprints the trips it writes, per month of pickup_datetime
+(a partition of trip_facts): trips, total trip_duration, total
+trip_distance_km (in thousandths, as trip_facts stores it) and the sum of
+trip_id_hash(trip_id), a 32-bit hash of every trip id that numpy computes
+as SQL does (trip_aggregates.py). Sums do not depend on row order, so the
+fingerprint of a month is the sum of its batches'.
+
+Before its first write to a month the loader reads the month's fingerprint
+from the rows of its days in daily_trip_totals, which the loader keeps in
+step with trip_facts; after the load it reads it from trip_facts (a scan
+of that month only). The difference has to be the fingerprint of the trips
+written: a trip missing, written twice, altered or written by someone else
+in between shows up, as do summary totals that disagree with the trips. A
+replaced month starts from nothing. The cost grows with the months a load
+touches, not with trip_facts.
+
+A cleaned CSV (or dataset) read with the cleaner's log next to it
+(logs/cleaning_log.json) is also checked against the log: the number of
+trips and the means of duration, distance and speed.
+"""
+import json
+import os
+
+import numpy as np
+
+from taxi_schema import STATISTIC_COLUMNS
+
+from trip_aggregates import thousandths, trip_id_hashes
+from trip_partitions import month_bounds, month_of
+
+FINGERPRINT_FIELDS = ['trips', 'total_duration', 'total_distance', 'trip_id_hash']
+
+MONTH_FINGERPRINT = """
+    SELECT COUNT(*), COALESCE(SUM(trip_duration), 0), COALESCE(SUM(trip_distance_km), 0),
+           COALESCE(SUM(trip_id_hash(trip_id)), 0)
+    FROM trip_facts
+    WHERE pickup_datetime >= %s AND pickup_datetime < %s
+"""
+
+# The same fingerprint from the summary rows of the month's days
+MONTH_SUMMARY = """
+    SELECT COALESCE(SUM(trip_count), 0), COALESCE(SUM(total_duration), 0), COALESCE(SUM(total_distance), 0),
+           COALESCE(SUM(trip_id_hash), 0)
+    FROM daily_trip_totals
+    WHERE trip_date >= %s AND trip_date < %s
+"""
+
+# Relative difference tolerated between a logged mean and the loaded one
+MEAN_TOLERANCE = 1e-9
+
+
+def month_name(code):
+    year, month = month_of(code)
+    return f'{year:04d}-{month:02d}'
+
+
+def _fingerprint(values):
+    return dict(zip(FINGERPRINT_FIELDS, (int(value) for value in values)))
+
+
+def cleaning_log_path(input_path):
+    """Where the cleaner wrote the log of the cleaned CSV or dataset at `input_path`"""
+    return os.path.join(os.path.dirname(os.path.abspath(input_path)), 'logs', 'cleaning_log.json')
+
+
+def check_cleaning_log(df, log_path):
+    """
+    Compare the trips read with the cleaner's log of them; None without a
+    log. Returns {'log': path, 'trips': [logged, read], '<statistic>_mean':
+    [logged, read], 'matches': bool}.
+    """
+    if not os.path.exists(log_path):
+        return None
+    with open(log_path) as f:
+        statistics = json.load(f).get('statistics', {})
+    result = {'log': log_path, 'trips': [statistics.get('final_record_count'), len(df)]}
+    matches = result['trips'][0] == len(df)
+    for name, column in STATISTIC_COLUMNS.items():
+        logged = statistics.get(name, {}).get('mean')
+        read = float(df[column].mean()) if len(df) else None
+        result[f'{name}_mean'] = [logged, read]
+        if logged is not None and read is not None:
+            matches &= abs(logged - read) <= MEAN_TOLERANCE * max(abs(logged), abs(read), 1.0)
+    result['matches'] = bool(matches)
+    return result
+
+
+class LoadReconciliation:
+    """Fingerprints of the trips a load writes and of their months in trip_facts, per month code"""
+
+    def __init__(self):
+        self.written = {}
+        self.before = {}
+
+    def _read_month(self, cursor, code, query=MONTH_FINGERPRINT):
+        cursor.execute(query, month_bounds(month_of(code)))
+        trips, duration, distance, trip_id_hash = cursor.fetchone()
+        return np.array([trips, duration, int(round(distance * 1000)), trip_id_hash], dtype=object)
+
+    def watch(self, cursor, codes, replacing=False):
+        """
+        Read the fingerprint of every month in `codes` not watched yet from
+        daily_trip_totals, before the load writes to it. Months being
+        replaced start empty, forgetting the trips written to them so far.
+        """
+        for code in sorted(set(int(code) for code in codes)):
+            if replacing:
+                self.before[code] = np.zeros(4, dtype=object)
+                self.written.pop(code, None)
+            elif code not in self.before:
+                self.before[code] = self._read_month(cursor, code, MONTH_SUMMARY)
+
+    def add(self, trip_ids, durations, distances, codes):
+        """Fingerprint written trips, given with their month codes"""
+        hashes = trip_id_hashes(trip_ids)
+        durations = np.asarray(durations, dtype=np.int64)
+        distances = thousandths(distances)
+        for code in np.unique(codes):
+            rows = codes == code
+            totals = np.array([int(rows.sum()), int(durations[rows].sum()), int(distances[rows].sum()),
+                               int(hashes[rows].sum())], dtype=object)
+            self.written[int(code)] = self.written.get(int(code), np.zeros(4, dtype=object)) + totals
+
+    def reconcile(self, cursor):
+        """
+        Compare every watched month as trip_facts holds it now with its
+        fingerprint before the load plus the trips written. Returns
+        {'months': {'YYYY-MM': {'expected': ..., 'found': ...}}, 'mismatched':
+        [months], 'matches': bool}.
+        """
+        months, mismatched = {}, []
+        for code, before in sorted(self.before.items()):
+            expected = before + self.written.get(code, np.zeros(4, dtype=object))
+            found = self._read_month(cursor, code)
+            months[month_name(code)] = {'expected': _fingerprint(expected), 'found': _fingerprint(found)}
+            if any(expected != found):
+                mismatched.append(month_name(code))
+        return {'months': months, 'mismatched': mismatched, 'matches': not mismatched}
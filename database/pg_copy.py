@@ -0,0 +1,161 @@
+"""
+COPY FROM STDIN buffers built straight from column arrays.
+
+Columns are numpy arrays or pandas Series of integers, floats, booleans,
+datetime64 or strings (object); None, NaN and NaT are written as NULL. The
+PostgreSQL type of each column follows from its dtype (column_type), so the
+buffers load into a staging table of those types, from which INSERT ... SELECT
+casts to the target columns (e.g. double precision -> DECIMAL).
+
+Both COPY formats are supported: text (tab-separated, backslash escapes) and
+binary. The binary buffer is made of numpy record arrays, one per distinct row
+layout, rather than by packing rows one at a time; it is also several times
+faster to build than text, where every float needs a repr().
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + (0).to_bytes(4, 'big') + (0).to_bytes(4, 'big')
+BINARY_TRAILER = (-1).to_bytes(2, 'big', signed=True)
+
+# PostgreSQL timestamps count microseconds from 2000-01-01
+_PG_EPOCH_US = np.datetime64('2000-01-01T00:00:00', 'us').astype(np.int64)
+
+_TEXT_ESCAPES = [('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')]
+
+
+def _array(values):
+    if isinstance(values, pd.Series):
+        values = values.to_numpy()
+    return np.asarray(values)
+
+
+def column_type(values):
+    """PostgreSQL type a column is copied as"""
+    kind = _array(values).dtype
+    if kind.kind == 'b':
+        return 'boolean'
+    if kind.kind in 'iu':
+        return 'integer' if kind.itemsize <= 4 and kind != np.uint32 else 'bigint'
+    if kind.kind == 'f':
+        return 'double precision'
+    if kind.kind == 'M':
+        return 'timestamp'
+    return 'text'
+
+
+def _nulls(values):
+    if values.dtype.kind == 'f':
+        return np.isnan(values)
+    if values.dtype.kind == 'M':
+        return np.isnat(values)
+    if values.dtype.kind == 'O':
+        return pd.isna(values)
+    return np.zeros(len(values), dtype=bool)
+
+
+def _text_column(values):
+    """Column as a list of COPY text fields"""
+    values = _array(values)
+    kind = values.dtype.kind
+    if kind == 'b':
+        fields = np.where(values, 't', 'f').tolist()
+    elif kind in 'iu':
+        fields = list(map(str, values.tolist()))
+    elif kind == 'f':
+        # repr() of a float is its shortest round-tripping form
+        fields = list(map(repr, values.tolist()))
+    elif kind == 'M':
+        fields = np.datetime_as_string(values.astype('datetime64[us]'), unit='us').tolist()
+    else:
+        fields = [str(v) for v in values]
+        joined = '\x00'.join(fields)
+        if any(char in joined for char, _ in _TEXT_ESCAPES):
+            for char, escaped in _TEXT_ESCAPES:
+                fields = [field.replace(char, escaped) for field in fields]
+    for row in np.flatnonzero(_nulls(values)):
+        fields[row] = '\\N'
+    return fields
+
+
+def text_copy_buffer(columns):
+    """COPY ... (FORMAT text) buffer of the rows formed by `columns`"""
+    fields = [_text_column(values) for values in columns]
+    if not fields or not len(fields[0]):
+        return io.BytesIO()
+    return io.BytesIO(('\n'.join(map('\t'.join, zip(*fields))) + '\n').encode())
+
+
+def _binary_column(values):
+    """(field length or -1 per row, fixed-width big-endian payload array) of a column"""
+    values = _array(values)
+    nulls = _nulls(values)
+    kind = values.dtype.kind
+    if kind == 'b':
+        data = values.astype(np.uint8)
+    elif kind in 'iu':
+        data = values.astype('>i4' if column_type(values) == 'integer' else '>i8')
+    elif kind == 'f':
+        data = values.astype('>f8')
+    elif kind == 'M':
+        data = (values.astype('datetime64[us]').astype(np.int64) - _PG_EPOCH_US).astype('>i8')
+    else:
+        strings = np.where(nulls, '', values)
+        try:
+            # ASCII (the common case) converts in one pass
+            data = strings.astype(bytes)
+            lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+        except UnicodeEncodeError:
+            encoded = [str(v).encode() for v in strings]
+            data = np.array(encoded, dtype=bytes)
+            lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        return np.where(nulls, -1, lengths), data
+    return np.where(nulls, -1, data.dtype.itemsize), data
+
+
+def binary_copy_buffer(columns):
+    """
+    COPY ... (FORMAT binary) buffer of the rows formed by `columns`.
+
+    Rows whose fields all have the same widths are written together as one
+    numpy record array; rows of different widths (strings of another length,
+    NULLs) go in further groups, in order of their first row. Rows therefore
+    reach the table grouped by layout rather than in their original order.
+    """
+    fields = [_binary_column(values) for values in columns]
+    parts = [BINARY_HEADER]
+    rows = len(fields[0][0]) if fields else 0
+    if rows:
+        # Number the row layouts by the widths of the columns whose widths vary
+        layout_keys = np.zeros(rows, dtype=np.int64)
+        for field_lengths, _ in fields:
+            if field_lengths.min() != field_lengths.max():
+                layout_keys = layout_keys * (int(field_lengths.max()) + 2) + field_lengths + 1
+        order = np.argsort(layout_keys, kind='stable')
+        bounds = np.flatnonzero(np.diff(layout_keys[order])) + 1
+        groups = np.split(order, bounds)
+        for group in sorted(groups, key=lambda g: g[0]):
+            widths = [int(field_lengths[group[0]]) for field_lengths, _ in fields]
+            layout = [('count', '>i2')]
+            for number, ((_, data), width) in enumerate(zip(fields, widths)):
+                layout.append((f'length{number}', '>i4'))
+                if width > 0:
+                    layout.append((f'value{number}', f'S{width}' if data.dtype.kind == 'S' else data.dtype))
+            records = np.empty(len(group), dtype=layout)
+            records['count'] = len(fields)
+            for number, ((field_lengths, data), width) in enumerate(zip(fields, widths)):
+                records[f'length{number}'] = field_lengths[group]
+                if width > 0:
+                    records[f'value{number}'] = data[group]
+            parts.append(records.tobytes())
+    parts.append(BINARY_TRAILER)
+    return io.BytesIO(b''.join(parts))
+
+
+def copy_buffer(columns, copy_format):
+    """Buffer of `columns` in COPY format 'text' or 'binary'"""
+    if copy_format == 'binary':
+        return binary_copy_buffer(columns)
+    return text_copy_buffer(columns)
@@ -0,0 +1,293 @@
+"""
+Summary tables behind the analytics views, maintained by the loader.
+
+hourly_trip_stats, daily_trip_stats and location_trip_stats are views over
+small tables of counts and sums instead of aggregations of all of trip_facts.
+After every batch of trips it inserts, the loader merges the batch's partial
+aggregates into those tables in the batch's transaction (for parallel and
+bulk loads, in a transaction right after the trips commit); averages are
+sums over counts, so merging is plain addition. Only trips new to trip_facts
+may be merged, so the loader skips trips loaded before. Sums are of the
+values as trip_facts stores them (rounded to 3 decimals) and are kept as
+exact NUMERICs. Replacing a month of trips (trip_partitions.py) takes the old
+partition's totals out and adds the new trips' in the swap's transaction.
+
+daily_trip_totals also sums trip_id_hash(trip_id), a 32-bit hash of every
+trip id, so a month's fingerprint (load_reconciliation.py) can be read from
+its days' rows instead of from its trips. Ids of the form id<digits> are
+packed as trip_ids.py packs them and mixed with integer steps that fit
+BIGINT in SQL and uint64 in numpy; other ids hash to the first 4 bytes of
+their MD5.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from taxi_schema import time_of_day
+from trip_ids import encode_trip_ids
+
+# Summary table -> (key columns, summed columns)
+SUMMARY_TABLES = {
+    'hourly_trip_totals': (
+        ['pickup_hour', 'is_weekend'],
+        ['trip_count', 'total_distance', 'total_duration', 'total_speed', 'speed_count']
+    ),
+    'daily_trip_totals': (
+        ['trip_date'],
+        ['trip_count', 'total_distance', 'total_duration', 'total_speed', 'speed_count', 'trip_id_hash']
+    ),
+    'location_trip_totals': (
+        ['location_id'],
+        ['pickup_count']
+    ),
+}
+
+CREATE_TABLES = """
+    CREATE TABLE IF NOT EXISTS hourly_trip_totals (
+        pickup_hour INTEGER NOT NULL,
+        is_weekend BOOLEAN NOT NULL,
+        time_of_day VARCHAR(20) NOT NULL,
+        trip_count BIGINT NOT NULL,
+        total_distance NUMERIC(18, 3) NOT NULL,
+        total_duration BIGINT NOT NULL,
+        total_speed NUMERIC(18, 3) NOT NULL,
+        speed_count BIGINT NOT NULL,
+        PRIMARY KEY (pickup_hour, is_weekend)
+    );
+    CREATE TABLE IF NOT EXISTS daily_trip_totals (
+        trip_date DATE PRIMARY KEY,
+        is_weekend BOOLEAN NOT NULL,
+        trip_count BIGINT NOT NULL,
+        total_distance NUMERIC(18, 3) NOT NULL,
+        total_duration BIGINT NOT NULL,
+        total_speed NUMERIC(18, 3) NOT NULL,
+        speed_count BIGINT NOT NULL,
+        trip_id_hash BIGINT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS location_trip_totals (
+        location_id INTEGER PRIMARY KEY,
+        pickup_count BIGINT NOT NULL
+    )
+"""
+
+# Totals of the trips of a table ({source}), added to the summary tables ({sign} 1)
+# or taken out of them ({sign} -1)
+TOTALS = [
+    """
+    INSERT INTO hourly_trip_totals (pickup_hour, is_weekend, time_of_day, trip_count, total_distance,
+                                    total_duration, total_speed, speed_count)
+    SELECT td.pickup_hour, td.is_weekend, MIN(td.time_of_day), {sign} * COUNT(*),
+           {sign} * SUM(tf.trip_distance_km), {sign} * SUM(tf.trip_duration),
+           {sign} * COALESCE(SUM(tf.trip_speed_kmh), 0), {sign} * COUNT(tf.trip_speed_kmh)
+    FROM {source} tf JOIN time_dimensions td ON tf.time_id = td.time_id
+    GROUP BY td.pickup_hour, td.is_weekend
+    """,
+    """
+    INSERT INTO daily_trip_totals (trip_date, is_weekend, trip_count, total_distance,
+                                   total_duration, total_speed, speed_count, trip_id_hash)
+    SELECT DATE(td.pickup_datetime), BOOL_AND(td.is_weekend), {sign} * COUNT(*),
+           {sign} * SUM(tf.trip_distance_km), {sign} * SUM(tf.trip_duration),
+           {sign} * COALESCE(SUM(tf.trip_speed_kmh), 0), {sign} * COUNT(tf.trip_speed_kmh),
+           {sign} * SUM(trip_id_hash(tf.trip_id))
+    FROM {source} tf JOIN time_dimensions td ON tf.time_id = td.time_id
+    GROUP BY DATE(td.pickup_datetime)
+    """,
+    """
+    INSERT INTO location_trip_totals (location_id, pickup_count)
+    SELECT tf.pickup_location_id, {sign} * COUNT(*)
+    FROM {source} tf
+    GROUP BY tf.pickup_location_id
+    """,
+]
+
+TRIP_ID_HASH_FUNCTION = """
+    CREATE OR REPLACE FUNCTION trip_id_hash(trip_id TEXT) RETURNS BIGINT AS $$
+    DECLARE
+        packed BIGINT;
+        h BIGINT;
+    BEGIN
+        IF trip_id !~ '^id[0-9]{1,17}$' THEN
+            RETURN ('x' || LEFT(MD5(trip_id), 8))::BIT(32)::BIGINT;
+        END IF;
+        packed := ((LENGTH(trip_id) - 2)::BIGINT << 57) | SUBSTRING(trip_id FROM 3)::BIGINT;
+        h := packed >> 32;
+        h := (((h >> 16) # h) * 73244475) & 4294967295;
+        h := (((h >> 16) # h) * 73244475) & 4294967295;
+        h := ((h >> 16) # h) # (packed & 4294967295);
+        h := (((h >> 16) # h) * 73244475) & 4294967295;
+        h := (((h >> 16) # h) * 73244475) & 4294967295;
+        RETURN (h >> 16) # h;
+    END;
+    $$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE
+"""
+
+# Fills trip_id_hash of the daily totals of a database summarised before it was added
+_FILL_TRIP_ID_HASH = """
+    UPDATE daily_trip_totals d SET trip_id_hash = t.trip_id_hash
+    FROM (SELECT DATE(td.pickup_datetime) AS trip_date, SUM(trip_id_hash(tf.trip_id)) AS trip_id_hash
+          FROM trip_facts tf JOIN time_dimensions td ON tf.time_id = td.time_id
+          GROUP BY DATE(td.pickup_datetime)) t
+    WHERE d.trip_date = t.trip_date
+"""
+
+# Count column of each summary table; rows counting no trips are deleted
+_COUNTS = {'hourly_trip_totals': 'trip_count', 'daily_trip_totals': 'trip_count',
+           'location_trip_totals': 'pickup_count'}
+
+# The analytics views, with the columns they had as aggregations of trip_facts
+VIEWS = [
+    """
+    CREATE VIEW hourly_trip_stats AS
+    SELECT pickup_hour, time_of_day, is_weekend, trip_count,
+           total_distance / trip_count AS avg_distance,
+           total_duration::NUMERIC / trip_count AS avg_duration,
+           total_speed / NULLIF(speed_count, 0) AS avg_speed,
+           total_distance
+    FROM hourly_trip_totals
+    """,
+    """
+    CREATE VIEW daily_trip_stats AS
+    SELECT trip_date, is_weekend, trip_count,
+           total_distance / trip_count AS avg_distance,
+           total_duration::NUMERIC / trip_count AS avg_duration,
+           total_speed / NULLIF(speed_count, 0) AS avg_speed
+    FROM daily_trip_totals
+    """,
+    """
+    CREATE VIEW location_trip_stats AS
+    SELECT l.location_id, l.latitude, l.longitude, l.zone_name, t.pickup_count
+    FROM location_trip_totals t
+    JOIN locations l ON t.location_id = l.location_id
+    """,
+]
+
+
+def create_summary_tables(cursor):
+    """
+    Create the summary tables, filled from the trips already loaded, and
+    point the analytics views at them. Once the tables exist, only adds
+    trip_id_hash to daily_trip_totals if it lacks it; commits with the
+    caller's transaction.
+    """
+    cursor.execute("SELECT 1 FROM pg_proc WHERE oid = to_regprocedure('trip_id_hash(text)')")
+    if not cursor.fetchall():
+        cursor.execute(TRIP_ID_HASH_FUNCTION)
+    cursor.execute("SELECT to_regclass('hourly_trip_totals')")
+    if cursor.fetchone()[0] is not None:
+        cursor.execute("SELECT 1 FROM pg_attribute WHERE attrelid = 'daily_trip_totals'::regclass "
+                       "AND attname = 'trip_id_hash'")
+        if not cursor.fetchall():
+            cursor.execute("ALTER TABLE daily_trip_totals "
+                           "ADD COLUMN IF NOT EXISTS trip_id_hash BIGINT NOT NULL DEFAULT 0")
+            cursor.execute(_FILL_TRIP_ID_HASH)
+            cursor.execute("ALTER TABLE daily_trip_totals ALTER COLUMN trip_id_hash DROP DEFAULT")
+        return False
+    cursor.execute(CREATE_TABLES)
+    add_totals(cursor, 'trip_facts')
+    for view, statement in zip(['hourly_trip_stats', 'daily_trip_stats', 'location_trip_stats'], VIEWS):
+        cursor.execute(f"DROP VIEW IF EXISTS {view}")
+        cursor.execute(statement)
+    return True
+
+
+def add_totals(cursor, source, sign=1):
+    """
+    Add the totals of every trip in the table `source` to the summary tables,
+    or with `sign` -1 take them out (e.g. of a partition about to be
+    dropped). Commits with the caller's transaction.
+    """
+    for table, statement in zip(SUMMARY_TABLES, TOTALS):
+        cursor.execute(statement.format(source=source, sign=int(sign)) + merge_clause(table))
+    if sign < 0:
+        for table, count in _COUNTS.items():
+            cursor.execute(f"DELETE FROM {table} WHERE {count} = 0")
+
+
+def merge_clause(table):
+    """ON CONFLICT clause adding a row's sums to the existing row of its key"""
+    keys, sums = SUMMARY_TABLES[table]
+    additions = ', '.join(f'{column} = {table}.{column} + EXCLUDED.{column}' for column in sums)
+    return f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {additions}"
+
+
+def thousandths(values):
+    """Values as trip_facts stores them (DECIMAL(10, 3)), in integer thousandths so sums are exact"""
+    return np.round(np.asarray(values, dtype=np.float64) * 1000).astype(np.int64)
+
+
+_HASH_MULTIPLIER = np.uint64(0x45d9f3b)
+_LOW_32_BITS = np.uint64(0xFFFFFFFF)
+
+
+def _mix(values):
+    """Mix uint64 values below 2**32 as trip_id_hash() does, staying below 2**32"""
+    shift = np.uint64(16)
+    values = ((values >> shift) ^ values) * _HASH_MULTIPLIER & _LOW_32_BITS
+    values = ((values >> shift) ^ values) * _HASH_MULTIPLIER & _LOW_32_BITS
+    return (values >> shift) ^ values
+
+
+def trip_id_hashes(trip_ids):
+    """Hash of every trip id as trip_id_hash(trip_id) computes it, an int64 array"""
+    trip_ids = np.asarray(trip_ids, dtype=object)
+    keys, encodable = encode_trip_ids(trip_ids)
+    keys = keys.view(np.uint64)
+    hashes = _mix(_mix(keys >> np.uint64(32)) ^ (keys & _LOW_32_BITS)).astype(np.int64)
+    for position in np.flatnonzero(~encodable):
+        digest = hashlib.md5(str(trip_ids[position]).encode()).digest()
+        hashes[position] = int.from_bytes(digest[:4], 'big')
+    return hashes
+
+
+def partial_aggregates(trips):
+    """
+    Partial aggregates of a batch of trips, `trips` mapping trip_facts
+    column names to arrays: a list of (summary table, column names, column
+    arrays) with one row per key of the batch.
+    """
+    pickup = pd.DatetimeIndex(trips['pickup_datetime'])
+    speed = np.asarray(trips['trip_speed_kmh'], dtype=np.float64)
+    has_speed = ~np.isnan(speed)
+    frame = pd.DataFrame({
+        'pickup_hour': pickup.hour.to_numpy(dtype=np.int32),
+        'is_weekend': pickup.dayofweek.to_numpy() >= 5,
+        'trip_date': pickup.normalize().to_numpy(),
+        'location_id': np.asarray(trips['pickup_location_id'], dtype=np.int32),
+        'trip_count': np.ones(len(pickup), dtype=np.int64),
+        'total_distance': thousandths(trips['trip_distance_km']),
+        'total_duration': np.asarray(trips['trip_duration'], dtype=np.int64),
+        'total_speed': thousandths(np.where(has_speed, speed, 0)),
+        'speed_count': has_speed.astype(np.int64),
+        'trip_id_hash': trip_id_hashes(trips['trip_id'])
+    })
+    sums = ['trip_count', 'total_distance', 'total_duration', 'total_speed', 'speed_count']
+
+    hourly = frame.groupby(['pickup_hour', 'is_weekend'], sort=False)[sums].sum().reset_index()
+    daily = frame.groupby('trip_date', sort=False).agg(
+        is_weekend=('is_weekend', 'first'), **{column: (column, 'sum') for column in [*sums, 'trip_id_hash']}
+    ).reset_index()
+    pickups = frame.groupby('location_id', sort=False).size()
+
+    def totals(group):
+        return [
+            group['trip_count'].to_numpy(),
+            group['total_distance'].to_numpy() / 1000,
+            group['total_duration'].to_numpy(),
+            group['total_speed'].to_numpy() / 1000,
+            group['speed_count'].to_numpy()
+        ]
+
+    return [
+        ('hourly_trip_totals',
+         ['pickup_hour', 'is_weekend', 'time_of_day', *sums],
+         [hourly['pickup_hour'].to_numpy(), hourly['is_weekend'].to_numpy(),
+          np.asarray(time_of_day(hourly['pickup_hour']), dtype=object), *totals(hourly)]),
+        ('daily_trip_totals',
+         ['trip_date', 'is_weekend', *sums, 'trip_id_hash'],
+         [daily['trip_date'].to_numpy(), daily['is_weekend'].to_numpy(), *totals(daily),
+          daily['trip_id_hash'].to_numpy()]),
+        ('location_trip_totals',
+         ['location_id', 'pickup_count'],
+         [pickups.index.to_numpy(dtype=np.int32), pickups.to_numpy(dtype=np.int64)]),
+    ]
@@ -0,0 +1,157 @@
+"""
+Persistent index of the trip ids in trip_facts, kept in a file by the loader.
+
+The index is a TripIdSet (8 bytes per trip id) saved with the generation of
+trip_facts it matches. The generation is a counter in the database
+(trip_facts_generation) that every transaction writing trip_facts advances
+before it commits: the loader's batches, the bulk move, a worker of a
+parallel load, a month swap. Other writers of trip_facts are expected to
+advance it too. It is a row, not a sequence, so it moves with the commit of
+the trips and concurrent writers take turns at it.
+
+A loader opening the index reads the generation: if the file's is the same
+the index is taken as exact, and trips are checked against it in memory
+instead of sending their ids to the database; otherwise (trips loaded or
+deleted by something else, a recreated database) it is rebuilt with one
+scan of trip_facts' ids, in the snapshot the generation was read in. While
+the load runs, every generation its transactions reach has to follow the
+last one it knows; a gap means someone else wrote to trip_facts meanwhile,
+and the index is not saved but dropped, for the next load to rebuild.
+Trips are added once committed, so between a commit and the save the index
+can only miss trips, never hold extra ones. The cleaner reads the same file,
+after checking its generation against the database, to drop trips that were
+loaded already (see cleaning_rules).
+
+Replacing months drops trips without the index knowing which, so a load that
+replaces months discards the index; the next load rebuilds it.
+"""
+import os
+
+import numpy as np
+
+from trip_ids import TripIdSet
+
+# Trip ids fetched per round trip while rebuilding
+REBUILD_FETCH_ROWS = 100_000
+
+GENERATION_TABLE = 'trip_facts_generation'
+
+
+def create_generation(cursor):
+    """Create trip_facts' generation counter, at 0, unless it exists; commits with the caller's transaction"""
+    cursor.execute("SELECT to_regclass(%s)", (GENERATION_TABLE,))
+    if cursor.fetchone()[0] is not None:
+        return False
+    cursor.execute(f"CREATE TABLE {GENERATION_TABLE} (generation BIGINT NOT NULL)")
+    cursor.execute(f"INSERT INTO {GENERATION_TABLE} (generation) VALUES (%s)", (0,))
+    return True
+
+
+def advance_generation(cursor):
+    """
+    Advance trip_facts' generation in the caller's transaction, which writes
+    to trip_facts; returns the new generation. Holds the counter's row lock
+    until that transaction ends.
+    """
+    cursor.execute(f"UPDATE {GENERATION_TABLE} SET generation = generation + 1 RETURNING generation")
+    return int(cursor.fetchone()[0])
+
+
+def current_generation(conn):
+    """trip_facts' generation as last committed; commits the connection's transaction"""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT generation FROM {GENERATION_TABLE}")
+    generation = int(cursor.fetchone()[0])
+    conn.commit()
+    return generation
+
+
+class LoadedTripIndex:
+    """The trip ids of trip_facts, as a TripIdSet kept in `path`"""
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = None
+        # Generation of trip_facts the ids match; None once the index fell behind
+        self.generation = None
+
+    def read(self, generation):
+        """Read the index if it was saved at `generation` of trip_facts; whether it was"""
+        if not os.path.exists(self.path):
+            return False
+        with np.load(self.path) as data:
+            saved = int(data['generation']) if 'generation' in data else None
+        if saved != generation:
+            return False
+        self.ids = TripIdSet.load(self.path)
+        self.generation = generation
+        return True
+
+    def open(self, conn):
+        """
+        Read the index, or rebuild it from trip_facts when it does not match
+        the table's generation; commits the connection's transaction. Returns
+        whether the index was read as it was.
+        """
+        cursor = conn.cursor()
+        # The generation and the ids of a rebuild come from one snapshot
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cursor.execute(f"SELECT generation FROM {GENERATION_TABLE}")
+        generation = int(cursor.fetchone()[0])
+        if self.read(generation):
+            conn.commit()
+            return True
+
+        self.ids = TripIdSet()
+        # Server-side cursor: the ids arrive in blocks, not all at once
+        scan = conn.cursor(name='trip_index_rebuild')
+        scan.execute("SELECT trip_id FROM trip_facts")
+        while True:
+            rows = scan.fetchmany(REBUILD_FETCH_ROWS)
+            if not rows:
+                break
+            self.ids.add([row[0] for row in rows])
+        scan.close()
+        conn.commit()
+        self.generation = generation
+        self.save()
+        return False
+
+    def follow(self, generation):
+        """
+        Record a generation a transaction of the load advanced trip_facts to.
+        Unless it is the one after the last, someone else wrote to trip_facts
+        in between and the index is behind.
+        """
+        if self.generation is not None:
+            self.generation = generation if generation == self.generation + 1 else None
+
+    @property
+    def behind(self):
+        """Whether trip_facts may hold changes the index does not know"""
+        return self.generation is None
+
+    def contains(self, trip_ids):
+        """Mask of the trip ids in trip_facts"""
+        return self.ids.contains(trip_ids)
+
+    def add(self, trip_ids):
+        """Record trips committed to trip_facts"""
+        self.ids.add(trip_ids)
+
+    def save(self):
+        """Write the index, matching trip_facts at its generation"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Written aside and renamed, so a crash leaves the old index or the new one
+        partial = f'{self.path}.partial.npz'
+        self.ids.save(partial, generation=np.int64(self.generation))
+        os.replace(partial, self.path)
+
+    def discard(self):
+        """Drop the index (trips left trip_facts); the next load rebuilds it"""
+        self.ids = None
+        self.generation = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,188 @@
+"""
+Monthly range partitions of trip_facts on pickup_datetime.
+
+In a database created from database_schema.sql, trip_facts is partitioned by
+RANGE (pickup_datetime) with one partition per month, trip_facts_YYYY_MM, so
+queries filtering on pickup_datetime only scan the months they select. The
+primary key has to include the partition key and is (trip_id,
+pickup_datetime), which alone would let a trip id be stored again under
+another pickup time. trip_ids holds every stored trip id once, under its own
+primary key, and triggers on trip_facts (cloned onto every partition) keep
+it: an insert of a trip id already stored is skipped, as ON CONFLICT DO
+NOTHING would skip it, a delete frees the id, and a trip id cannot be
+changed in place. So the database itself keeps trip ids unique, whichever
+client writes, at the cost of a trigger call and an index insert per trip.
+The loader still skips trip ids loaded before, and creates the partitions of
+the months it loads and writes every batch straight into them.
+
+A month can also be replaced: its trips are loaded into a table of their own
+outside trip_facts (trip_facts_YYYY_MM_load), which then takes the place of
+the month's partition in one short transaction (detach and drop the old
+partition, attach the new one). The replacement is loaded past the triggers,
+so the swap moves the month's trip ids in trip_ids itself and fails if the
+replacement holds a trip id stored in another month. Readers see the old month until the commit
+and the new one after it. The new table carries a CHECK constraint of the
+month's bounds, so attaching it skips the scan that would prove them.
+
+A trip_facts created before, as a plain table, is loaded as it always was.
+"""
+import numpy as np
+
+PARTITION_KEY = 'pickup_datetime'
+
+# Table of the trip ids stored in trip_facts, and the triggers keeping it
+TRIP_ID_TABLE = 'trip_ids'
+TRIP_ID_GUARD = """
+CREATE TABLE trip_ids (
+    trip_id VARCHAR(50) PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION guard_trip_id() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM trip_ids WHERE trip_id = OLD.trip_id;
+        RETURN OLD;
+    ELSIF TG_OP = 'UPDATE' THEN
+        RAISE EXCEPTION 'trip_id % cannot change to %', OLD.trip_id, NEW.trip_id;
+    END IF;
+    INSERT INTO trip_ids (trip_id) VALUES (NEW.trip_id) ON CONFLICT DO NOTHING;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER {table}_trip_id_guard
+    BEFORE INSERT OR DELETE ON {table}
+    FOR EACH ROW EXECUTE FUNCTION guard_trip_id();
+
+CREATE TRIGGER {table}_trip_id_fixed
+    BEFORE UPDATE OF trip_id ON {table}
+    FOR EACH ROW WHEN (OLD.trip_id IS DISTINCT FROM NEW.trip_id) EXECUTE FUNCTION guard_trip_id();
+"""
+
+
+def is_partitioned(cursor, table='trip_facts'):
+    """Whether `table` is a partitioned table"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def month_codes(pickup):
+    """Month of every pickup time, as months since 1970-01"""
+    return np.asarray(pickup, dtype='datetime64[ns]').astype('datetime64[M]').astype(np.int64)
+
+
+def month_of(code):
+    """(year, month) of a month code"""
+    return 1970 + int(code) // 12, int(code) % 12 + 1
+
+
+def month_bounds(month):
+    """First day of the month and of the next one, as 'YYYY-MM-DD'"""
+    year, number = month
+    following = (year + 1, 1) if number == 12 else (year, number + 1)
+    return f'{year:04d}-{number:02d}-01', f'{following[0]:04d}-{following[1]:02d}-01'
+
+
+def partition_name(month, table='trip_facts'):
+    year, number = month
+    return f'{table}_{year:04d}_{number:02d}'
+
+
+def create_trip_id_guard(cursor, table='trip_facts'):
+    """
+    Create trip_ids and the triggers keeping it, filled with the trip ids
+    `table` holds, unless trip_ids exists. The triggers lock `table` against
+    writes until the caller's transaction commits, so no trip slips in
+    between. True if created.
+    """
+    cursor.execute("SELECT to_regclass(%s)", (TRIP_ID_TABLE,))
+    if cursor.fetchone()[0] is not None:
+        return False
+    cursor.execute(TRIP_ID_GUARD.format(table=table))
+    cursor.execute(f"INSERT INTO {TRIP_ID_TABLE} (trip_id) SELECT DISTINCT trip_id FROM {table}")
+    return True
+
+
+def create_partitions(cursor, months, table='trip_facts'):
+    """Create the partitions of `months` that do not exist yet; commits with the caller's transaction"""
+    for month in months:
+        start, end = month_bounds(month)
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(month, table)} "
+            f"PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            (start, end)
+        )
+
+
+def route_batch(names, batch, table='trip_facts'):
+    """(partition, rows) of a batch of `table` rows, one per month the batch spans"""
+    codes = month_codes(batch[names.index(PARTITION_KEY)])
+    months = np.unique(codes)
+    if len(months) == 1:
+        return [(partition_name(month_of(months[0]), table), batch)]
+    return [
+        (partition_name(month_of(code), table), [column[codes == code] for column in batch])
+        for code in months
+    ]
+
+
+def replacement_name(month, table='trip_facts'):
+    """Table a month's replacement is loaded into"""
+    return f'{partition_name(month, table)}_load'
+
+
+def create_replacement(cursor, month, table='trip_facts'):
+    """
+    (Re)create the empty table a month's trips are loaded into before they
+    replace its partition: the columns, constraints and indexes of `table`,
+    plus a CHECK constraint of the month's bounds. Commits with the caller's
+    transaction.
+    """
+    name = replacement_name(month, table)
+    start, end = month_bounds(month)
+    cursor.execute(f"DROP TABLE IF EXISTS {name}")
+    cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING INDEXES)")
+    cursor.execute(
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds "
+        f"CHECK ({PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s)",
+        (start, end)
+    )
+    return name
+
+
+def attached_partition(cursor, month, table='trip_facts'):
+    """Name of the month's partition of `table`, or None when it has none"""
+    name = partition_name(month, table)
+    cursor.execute(
+        "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(%s) AND inhparent = to_regclass(%s)",
+        (name, table)
+    )
+    return name if cursor.fetchone() is not None else None
+
+
+def swap_partition(cursor, month, table='trip_facts'):
+    """
+    Put the month's replacement table in place of its partition: detach and
+    drop the partition (if any), then attach the replacement under the
+    partition's name, moving the month's trip ids in trip_ids along. A trip
+    id of the replacement stored in another month (or twice in the
+    replacement) violates trip_ids' primary key and fails the swap. Commits
+    with the caller's transaction.
+    """
+    name = partition_name(month, table)
+    replacement = replacement_name(month, table)
+    start, end = month_bounds(month)
+    if attached_partition(cursor, month, table):
+        # Dropping a partition fires no delete triggers
+        cursor.execute(f"DELETE FROM {TRIP_ID_TABLE} WHERE trip_id IN (SELECT trip_id FROM {name})")
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
+    cursor.execute(f"INSERT INTO {TRIP_ID_TABLE} (trip_id) SELECT trip_id FROM {replacement}")
+    cursor.execute(f"ALTER TABLE {replacement} RENAME TO {name}")
+    cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    # Only there to spare the attach its scan; the partition bound holds now
+    cursor.execute(f"ALTER TABLE {name} DROP CONSTRAINT {replacement}_bounds")
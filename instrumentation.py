@@ -0,0 +1,350 @@
+"""
+Stage-level performance instrumentation shared by the cleaner and the loader.
+
+A PerformanceLog records, per named stage: wall and CPU time, rows in/out,
+rows/s and peak RSS, plus any counters it is given (the loader passes its
+database round-trip and bytes-sent counters) and any a stage adds itself
+(the loader's batch pipeline). Repeated calls of a stage
+(e.g. one per chunk, or one per worker process) are aggregated under one
+name. Stages may nest; an outer stage's figures include its inner stages.
+
+Peak RSS is per stage on Linux: the highest resident set size of the
+process seen while the stage ran, polled every RSS_POLL_INTERVAL seconds
+by a background thread (a spike shorter than that can be missed). Nothing
+is reset, so stages running at once in other threads (the streaming
+pipeline's cleaner and loader, the batch pipeline) do not disturb each
+other's figures, though each stage sees the memory of the whole process.
+Elsewhere it is the process-wide peak at the end of the stage.
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Seconds between two samples of the resident set size while stages run
+RSS_POLL_INTERVAL = 0.05
+
+
+def _proc_status_mb(field):
+    """A kB figure of /proc/self/status in MB (Linux only), else None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb():
+    """Current resident set size of this process (Linux only), else None"""
+    return _proc_status_mb('VmRSS:')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = _proc_status_mb('VmHWM:')
+    if peak is not None:
+        return peak
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+class _RssSampler:
+    """Background thread raising the peak of every running stage to the RSS it samples"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = set()
+        self._thread = None
+        self._pid = None
+
+    def start(self, call):
+        with self._lock:
+            self._running.add(call)
+            # A forked child has the sampler's state but not its thread
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._poll, name='rss-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, call):
+        with self._lock:
+            self._running.discard(call)
+
+    def _poll(self):
+        while True:
+            time.sleep(RSS_POLL_INTERVAL)
+            current = rss_mb()
+            with self._lock:
+                for call in self._running:
+                    call._observe_peak(current)
+
+
+_sampler = _RssSampler()
+
+
+class StageRecord:
+    """Figures of one stage (all calls of it so far)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.rows_in = None
+        self.rows_out = None
+        self.peak_rss_mb = None
+        self.counters = {}
+
+    def add_rows(self, rows_in=None, rows_out=None):
+        if rows_in is not None:
+            self.rows_in = (self.rows_in or 0) + rows_in
+        if rows_out is not None:
+            self.rows_out = (self.rows_out or 0) + rows_out
+
+    def add_counters(self, counters):
+        """Add to the stage's counters (e.g. figures a stage measures itself)"""
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _observe_peak(self, peak):
+        if peak is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb or 0.0, peak)
+
+    def merge(self, other):
+        """Fold in another record of the same stage (e.g. from a worker process)"""
+        other = other if isinstance(other, StageRecord) else StageRecord.from_dict(other)
+        self.calls += other.calls
+        self.wall_s += other.wall_s
+        self.cpu_s += other.cpu_s
+        self.add_rows(other.rows_in, other.rows_out)
+        self._observe_peak(other.peak_rss_mb)
+        self.add_counters(other.counters)
+
+    def as_dict(self):
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        return {
+            'stage': self.name,
+            'calls': self.calls,
+            'wall_s': round(self.wall_s, 4),
+            'cpu_s': round(self.cpu_s, 4),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_s': round(rows / self.wall_s, 1) if rows is not None and self.wall_s > 0 else None,
+            'peak_rss_mb': None if self.peak_rss_mb is None else round(self.peak_rss_mb, 1),
+            **self.counters
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(data['stage'])
+        record.calls = data['calls']
+        record.wall_s = data['wall_s']
+        record.cpu_s = data['cpu_s']
+        record.rows_in = data['rows_in']
+        record.rows_out = data['rows_out']
+        record.peak_rss_mb = data['peak_rss_mb']
+        known = {'stage', 'calls', 'wall_s', 'cpu_s', 'rows_in', 'rows_out', 'rows_per_s', 'peak_rss_mb'}
+        record.counters = {name: value for name, value in data.items() if name not in known}
+        return record
+
+
+class PerformanceLog:
+    """
+    Per-stage performance records of one run.
+
+    `counters`, when given, is an object whose snapshot() returns a dict of
+    running totals; every stage records how much each total grew.
+    """
+
+    def __init__(self, counters=None):
+        self.counters = counters
+        self.records = {}
+        self._open = []
+        self._started = time.perf_counter()
+        self._started_cpu = time.process_time()
+        self._per_stage_peak = rss_mb() is not None
+
+    @property
+    def current(self):
+        """The innermost running stage"""
+        return self._open[-1] if self._open else None
+
+    def _record(self, name):
+        if name not in self.records:
+            self.records[name] = StageRecord(name)
+        return self.records[name]
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Time the enclosed block as (one call of) stage `name`; yields the call's record"""
+        call = StageRecord(name)
+        call.add_rows(rows_in=rows_in)
+        before = self.counters.snapshot() if self.counters else {}
+        if self._per_stage_peak:
+            call._observe_peak(rss_mb())
+            _sampler.start(call)
+        self._open.append(call)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield call
+        finally:
+            call.wall_s = time.perf_counter() - wall
+            call.cpu_s = time.process_time() - cpu
+            call.calls = 1
+            if self._per_stage_peak:
+                _sampler.stop(call)
+                call._observe_peak(rss_mb())
+            else:
+                call._observe_peak(peak_rss_mb())
+            if self.counters:
+                after = self.counters.snapshot()
+                call.add_counters({key: after[key] - before.get(key, 0) for key in after})
+            self._open.pop()
+            if self._open:
+                self._open[-1]._observe_peak(call.peak_rss_mb)
+            self._record(name).merge(call)
+
+    def merge(self, stages):
+        """Fold in the stages (as_dict() output) of another process"""
+        for data in stages:
+            self._record(data['stage']).merge(data)
+
+    def stages(self):
+        return [record.as_dict() for record in self.records.values()]
+
+    def summary(self):
+        """Stages plus run totals, as stored in the logs"""
+        return {
+            'stages': self.stages(),
+            'total_wall_s': round(time.perf_counter() - self._started, 4),
+            'total_cpu_s': round(time.process_time() - self._started_cpu, 4),
+            # This process's peak, or a worker's merged in
+            'peak_rss_mb': max([peak_rss_mb() or 0.0] + [r.peak_rss_mb or 0.0 for r in self.records.values()])
+        }
+
+    def format_lines(self):
+        """One human-readable line per stage"""
+        lines = []
+        for stage in self.stages():
+            line = (f"{stage['stage']}: {stage['wall_s']:.2f}s wall, {stage['cpu_s']:.2f}s CPU"
+                    f" x{stage['calls']}")
+            if stage['rows_in'] is not None or stage['rows_out'] is not None:
+                line += f", rows {stage['rows_in']} -> {stage['rows_out']}"
+            if stage['rows_per_s'] is not None:
+                line += f" ({stage['rows_per_s']:,.0f} rows/s)"
+            if stage['peak_rss_mb'] is not None:
+                line += f", peak RSS {stage['peak_rss_mb']:.0f} MB"
+            for name, value in stage.items():
+                if name.startswith(('db_', 'pipeline_')):
+                    line += f", {name} {value}"
+            lines.append(line)
+        return lines
+
+
+class DbCounters:
+    """Database round trips and bytes sent through an InstrumentedConnection"""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.bytes_sent = 0
+
+    def snapshot(self):
+        return {'db_round_trips': self.round_trips, 'db_bytes_sent': self.bytes_sent}
+
+
+class _CountingReader:
+    """File wrapper that counts the bytes COPY reads from it"""
+
+    def __init__(self, file, counters):
+        self._file = file
+        self._counters = counters
+
+    def read(self, *args):
+        data = self._file.read(*args)
+        self._counters.bytes_sent += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self._file.readline(*args)
+        self._counters.bytes_sent += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class InstrumentedCursor:
+    """psycopg2 cursor proxy counting statements and the bytes of their SQL"""
+
+    def __init__(self, cursor, counters):
+        self._cursor = cursor
+        self._counters = counters
+
+    def execute(self, query, vars=None):
+        self._cursor.execute(query, vars)
+        self._counters.round_trips += 1
+        self._counters.bytes_sent += len(self._cursor.query or b'')
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        self._cursor.executemany(query, vars_list)
+        # psycopg2 runs one statement per parameter set
+        self._counters.round_trips += len(vars_list)
+        self._counters.bytes_sent += sum(len(self._cursor.mogrify(query, v)) for v in vars_list)
+
+    def copy_expert(self, sql, file, *args, **kwargs):
+        self._counters.round_trips += 1
+        self._counters.bytes_sent += len(sql)
+        return self._cursor.copy_expert(sql, _CountingReader(file, self._counters), *args, **kwargs)
+
+    def copy_from(self, file, *args, **kwargs):
+        self._counters.round_trips += 1
+        return self._cursor.copy_from(_CountingReader(file, self._counters), *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """psycopg2 connection proxy whose cursors and commits are counted"""
+
+    def __init__(self, conn, counters):
+        self._conn = conn
+        self._counters = counters
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._counters)
+
+    def commit(self):
+        self._conn.commit()
+        self._counters.round_trips += 1
+
+    def rollback(self):
+        self._conn.rollback()
+        self._counters.round_trips += 1
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
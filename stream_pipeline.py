@@ -0,0 +1,191 @@
+"""
+Clean the raw CSV and load it into PostgreSQL in one streaming run.
+
+The cleaner runs in streaming mode and hands every cleaned chunk to a loader
+thread through a small bounded queue, so the database is written while the
+next chunks are cleaned and at most QUEUE_CHUNKS cleaned chunks wait in
+memory. The cleaned CSV is only written with --csv-output.
+
+The first database write waits for a full pass over the input. The cleaner
+reads the whole CSV once (pass 1) for the global trip duration bounds, which
+decide the rows of every chunk, and only the chunks of its second pass are
+loaded. On a large input that first pass takes minutes, not seconds; what
+streaming saves is the cleaned CSV and the separate load after it.
+
+Usage:
+    python stream_pipeline.py --input train.csv --chunk-size 200000 --method copy
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'database'))
+
+from data_cleaning import NYCTaxiDataCleaner
+from batch_pipeline import PIPELINE_DEPTH
+from load_data_to_db import TIME_GRAINS, DatabaseLoader, logger
+from taxi_zones import ZoneIndex
+
+# Cleaned chunks that may wait for the loader before the cleaner blocks
+QUEUE_CHUNKS = 2
+
+# Seconds between checks of the other side while a hand-off is blocked
+_POLL_SECONDS = 1.0
+
+_END = object()
+
+
+class ChunkStream:
+    """
+    Bounded hand-off of cleaned chunks from the cleaner (put) to the loader
+    thread (iteration). Whichever side fails first stops the other: a
+    loader that failed or stopped reading makes put raise, and abort ends
+    the iteration with an error.
+    """
+
+    def __init__(self, max_chunks=QUEUE_CHUNKS):
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self.loader_error = None
+        self.ended = False
+
+    def _put(self, item):
+        while True:
+            if self.loader_error is not None:
+                raise RuntimeError(f"Loader failed: {self.loader_error}") from self.loader_error
+            try:
+                self._queue.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def put(self, df):
+        self._put(df)
+
+    def close(self):
+        self._put(_END)
+
+    def abort(self, error):
+        """End the stream with `error` (raised in the loader thread), unless the loader already failed"""
+        if self.loader_error is None:
+            self._put(error)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                self.ended = True
+                return
+            if isinstance(item, BaseException):
+                raise RuntimeError(f"Cleaner failed: {item}") from item
+            yield item
+
+
+def clean_and_load(cleaner, loader, batch_size=None):
+    """
+    Run `cleaner` (in streaming mode) with its chunks loaded by `loader` as
+    they are cleaned; True when the load succeeded.
+    """
+    stream = ChunkStream()
+    outcome = {}
+
+    def load():
+        try:
+            outcome['success'] = loader.load_stream(stream, batch_size)
+        except BaseException as e:
+            stream.loader_error = e
+        else:
+            if not stream.ended:
+                stream.loader_error = RuntimeError("stopped reading before the last chunk")
+
+    cleaner.chunk_sink = stream.put
+    loading = threading.Thread(target=load, name='loader')
+    loading.start()
+    try:
+        cleaner.run_pipeline()
+        stream.close()
+    except BaseException as e:
+        stream.abort(e)
+        raise
+    finally:
+        loading.join()
+
+    if stream.loader_error is not None:
+        raise RuntimeError(f"Loader failed: {stream.loader_error}") from stream.loader_error
+    return outcome['success']
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(
+        description='Clean the NYC taxi trip dataset straight into PostgreSQL. The first write waits '
+                    'for a full first pass over the input (trip duration bounds); chunks are loaded '
+                    'as the second pass cleans them.')
+    parser.add_argument('--input', default='train.csv', help='Path to the raw CSV file')
+    parser.add_argument('--output-dir', default='data', help='Directory for the cleaning logs (and --csv-output)')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='Rows per cleaned and loaded chunk (default 200000 without --memory-limit-mb)')
+    parser.add_argument('--memory-limit-mb', type=float,
+                        help='Size the chunks to stay under this memory ceiling')
+    parser.add_argument('--csv-output', action='store_true',
+                        help='Also write the cleaned CSV to the output directory')
+    parser.add_argument('--host', default='localhost', help='Database host')
+    parser.add_argument('--db', default='nyc_taxi_analytics', help='Database name')
+    parser.add_argument('--user', default='postgres', help='Database user')
+    parser.add_argument('--password', default='postgres', help='Database password')
+    parser.add_argument('--port', type=int, default=5432, help='Database port')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='Trip rows per batch (default 1000 for insert, 100000 for copy)')
+    parser.add_argument('--commit-every', type=int, default=1, metavar='N',
+                        help='Batches per transaction (default 1)')
+    parser.add_argument('--pipeline-depth', type=int, default=PIPELINE_DEPTH, metavar='N',
+                        help=f'Batches prepared ahead of the database writes (default {PIPELINE_DEPTH}, 0 for none)')
+    parser.add_argument('--prepare-threads', type=int, default=1, metavar='N',
+                        help='Threads preparing batches ahead (default 1)')
+    parser.add_argument('--method', choices=['insert', 'copy'], default='insert',
+                        help='Load with multi-row INSERTs or with COPY FROM STDIN')
+    parser.add_argument('--copy-format', choices=['binary', 'text'], default='binary',
+                        help='COPY format used by --method copy')
+    parser.add_argument('--time-grain', choices=TIME_GRAINS, default='second',
+                        help='time_dimensions row per pickup second, or per hour keyed YYYYMMDDHH')
+    parser.add_argument('--trip-index', metavar='PATH',
+                        help='File indexing the trip ids loaded, to skip known trips without asking the database')
+    parser.add_argument('--zones', help='Taxi zone boundaries (GeoJSON) to assign location zones and boroughs')
+    args = parser.parse_args()
+
+    chunk_size = args.chunk_size
+    if chunk_size is None and args.memory_limit_mb is None:
+        chunk_size = 200_000
+
+    zone_index = ZoneIndex.from_geojson(args.zones) if args.zones else None
+    loader = DatabaseLoader(args.host, args.db, args.user, args.password, args.port, zone_index,
+                            args.method, args.copy_format, time_grain=args.time_grain, trip_index=args.trip_index,
+                            pipeline_depth=args.pipeline_depth, prepare_threads=args.prepare_threads,
+                            commit_every=args.commit_every)
+    if not loader.connect():
+        logger.error("Failed to connect to database. Exiting.")
+        sys.exit(1)
+
+    cleaner = NYCTaxiDataCleaner(
+        input_path=args.input,
+        output_dir=args.output_dir,
+        chunk_size=chunk_size,
+        memory_limit_mb=args.memory_limit_mb,
+        write_output=args.csv_output
+    )
+    try:
+        success = clean_and_load(cleaner, loader, args.batch_size)
+    finally:
+        loader.close()
+
+    if success:
+        logger.info("\n✓ Cleaning and loading completed successfully!")
+    else:
+        logger.error("\n✗ Loading completed with errors. Check logs for details.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import os
+import math
+import numpy as np
+
+
+def _linear_quantile(column, q):
+    """pandas' linear-interpolation quantile from exact order statistics"""
+    if column.count == 0:
+        return math.nan
+    # pandas hands numpy a percentile (q * 100), which numpy divides back
+    position = ((q * 100) / 100) * (column.count - 1)
+    below = int(math.floor(position))
+    t = position - below
+    a = column.kth_smallest(below)
+    if t == 0:
+        return a
+    b = column.kth_smallest(below + 1)
+    diff = b - a
+    return b - diff * (1 - t) if t >= 0.5 else a + diff * t
+
+
+def _median(column):
+    if column.count == 0:
+        return math.nan
+    middle = (column.count - 1) // 2
+    if column.count % 2:
+        return column.kth_smallest(middle)
+    return (column.kth_smallest(middle) + column.kth_smallest(middle + 1)) / 2
+
+
+class CountHistogram:
+    """
+    Exact, mergeable distribution of non-negative whole numbers (such as
+    trip durations in seconds), stored as one counter per value.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def add(self, values):
+        values = np.asarray(values)
+        if len(values) == 0:
+            return self
+        if values.min() < 0 or (values.dtype.kind == 'f' and (values % 1 != 0).any()):
+            raise ValueError("CountHistogram only holds non-negative whole numbers")
+        return self.merge(np.bincount(values.astype(np.int64)))
+
+    def merge(self, counts):
+        """Add another histogram (a CountHistogram or its counts array)"""
+        counts = counts.counts if isinstance(counts, CountHistogram) else counts
+        if len(counts) > len(self.counts):
+            self.counts = np.pad(self.counts, (0, len(counts) - len(self.counts)))
+        self.counts[:len(counts)] += counts
+        return self
+
+    @classmethod
+    def load(cls, path):
+        histogram = cls()
+        histogram.counts = np.load(path)
+        return histogram
+
+    def save(self, path):
+        np.save(path, self.counts)
+
+    def kth_smallest(self, k):
+        """Exact k-th smallest value (0-based)"""
+        if not 0 <= k < self.count:
+            raise IndexError(f"k={k} out of range for {self.count} values")
+        return float(np.searchsorted(np.cumsum(self.counts), k, side='right'))
+
+    def quantile(self, q):
+        """Quantile with the same linear interpolation as pandas/numpy"""
+        return _linear_quantile(self, q)
+
+    def median(self):
+        return _median(self)
+
+
+class RunningSummary:
+    """
+    Mergeable mean/std/median of a non-negative column.
+
+    Count, mean and the sum of squared deviations are exact and merged with
+    Chan et al.'s pairwise formula; the median comes from a histogram of
+    the values rounded to `resolution`, so it is exact to that resolution.
+    """
+
+    def __init__(self, resolution=1.0):
+        self.resolution = resolution
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.histogram = CountHistogram()
+
+    def _merge_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self._mean
+        self._m2 += m2 + delta * delta * self.count * count / total
+        self._mean += delta * count / total
+        self.count = total
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        mean = float(values.mean())
+        self._merge_moments(len(values), mean, float(((values - mean) ** 2).sum()))
+        self.histogram.add(np.rint(values / self.resolution))
+        return self
+
+    def add_file(self, path):
+        """Add the float64 values written to `path` by another process"""
+        return self.add(np.fromfile(path, dtype=np.float64))
+
+    def merge(self, other):
+        if other.resolution != self.resolution:
+            raise ValueError("Cannot merge summaries with different resolutions")
+        if other.count:
+            self._merge_moments(other.count, other._mean, other._m2)
+            self.histogram.merge(other.histogram)
+        return self
+
+    def mean(self):
+        return self._mean if self.count else math.nan
+
+    def std(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def median(self):
+        return _median(self.histogram) * self.resolution
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            summary = cls(float(data['resolution']))
+            summary.count = int(data['count'])
+            summary._mean = float(data['mean'])
+            summary._m2 = float(data['m2'])
+            summary.histogram.counts = data['counts']
+        return summary
+
+    def save(self, path):
+        np.savez(path, resolution=self.resolution, count=self.count, mean=self._mean,
+                 m2=self._m2, counts=self.histogram.counts)
+
+
+class SpilledColumn:
+    """
+    Append-only float64 column spilled to a local file.
+
+    Lets the streaming cleaner compute the same mean/median/std/quantile
+    values as pandas does on a fully loaded Series, while only ever holding
+    one block of values in memory. Order statistics are exact: they are
+    found by repeatedly narrowing a histogram over the spilled values until
+    the candidates fit in `selection_budget` values.
+    """
+
+    def __init__(self, path, block_size=1_000_000, selection_budget=2_000_000, bins=4096):
+        self.path = path
+        self.block_size = block_size
+        self.selection_budget = selection_budget
+        self.bins = bins
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._file = open(path, 'wb')
+
+    def add(self, values):
+        """Append a block of values (NaN is skipped, as pandas does)"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        values.tofile(self._file)
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        return self
+
+    def add_file(self, path):
+        """Append the float64 values written to `path` by another process"""
+        count = os.path.getsize(path) // 8
+        if count:
+            data = np.memmap(path, dtype=np.float64, mode='r', shape=(count,))
+            for start in range(0, count, self.block_size):
+                self.add(data[start:start + self.block_size])
+        return self
+
+    def close(self):
+        """Close and delete the spill file"""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _blocks(self):
+        self._file.flush()
+        if self.count == 0:
+            return
+        data = np.memmap(self.path, dtype=np.float64, mode='r', shape=(self.count,))
+        for start in range(0, self.count, self.block_size):
+            yield np.array(data[start:start + self.block_size])
+
+    def kth_smallest(self, k):
+        """Exact k-th smallest value (0-based)"""
+        if not 0 <= k < self.count:
+            raise IndexError(f"k={k} out of range for {self.count} values")
+
+        # Closed interval [lo, hi] known to contain the answer, and its rank within it
+        lo, hi, rank = self.min, self.max, k
+        while True:
+            if lo == hi:
+                return float(lo)
+
+            if np.nextafter(lo, np.inf) >= hi:
+                # Only two representable values left in the interval
+                n_lo = sum(int((block == lo).sum()) for block in self._blocks())
+                return float(lo if rank < n_lo else hi)
+
+            # Near the float resolution linspace can repeat edges; keep at least two bins
+            edges = np.unique(np.linspace(lo, hi, self.bins + 1))
+            if len(edges) < 3:
+                edges = np.array([lo, np.nextafter(lo, np.inf), hi])
+            counts = np.zeros(len(edges) - 1, dtype=np.int64)
+            for block in self._blocks():
+                block = block[(block >= lo) & (block <= hi)]
+                counts += np.histogram(block, bins=edges)[0]
+
+            if counts.sum() <= self.selection_budget:
+                candidates = np.concatenate([
+                    block[(block >= lo) & (block <= hi)] for block in self._blocks()
+                ])
+                return float(np.partition(candidates, rank)[rank])
+
+            cumulative = np.cumsum(counts)
+            b = int(np.searchsorted(cumulative, rank, side='right'))
+            if b > 0:
+                rank -= int(cumulative[b - 1])
+
+            # np.histogram bins are half-open except the last one
+            lo = edges[b]
+            hi = edges[b + 1] if b == len(counts) - 1 else np.nextafter(edges[b + 1], -np.inf)
+
+    def quantile(self, q):
+        """Quantile with the same linear interpolation as pandas/numpy"""
+        return _linear_quantile(self, q)
+
+    def median(self):
+        return _median(self)
+
+    def mean(self):
+        if self.count == 0:
+            return math.nan
+        return math.fsum(float(block.sum()) for block in self._blocks()) / self.count
+
+    def std(self):
+        """Sample standard deviation (ddof=1), two-pass like pandas"""
+        if self.count < 2:
+            return math.nan
+        mean = self.mean()
+        squares = math.fsum(float(((block - mean) ** 2).sum()) for block in self._blocks())
+        return math.sqrt(squares / (self.count - 1))
@@ -0,0 +1,84 @@
+"""
+Column-wise resolution of natural keys to the loader's surrogate ids.
+
+Coordinates are packed into one int64 per point at the 7-decimal scale of
+the locations table's DECIMAL(10, 7) columns, and pickup datetimes become
+their epoch seconds. A SurrogateKeyMap keeps natural keys and ids as two
+sorted arrays (12 bytes per entry instead of a dict of tuples) and resolves a
+whole column with one binary search. The loader keeps one map per dimension
+for its lifetime and only adds the keys each load brings.
+
+The hourly time dimension needs no map at all: its ids are smart keys,
+YYYYMMDDHH as an integer (2016030108 for 8am on 1 March 2016), computed from
+the timestamps arithmetically.
+"""
+import numpy as np
+import pandas as pd
+
+# Returned for keys that have no id
+MISSING_ID = -1
+
+COORDINATE_SCALE = 10 ** 7
+_LONGITUDE_BITS = 32
+
+
+def coordinate_keys(latitude, longitude):
+    """int64 key of every (latitude, longitude) at the locations table's precision"""
+    lat = np.rint(np.asarray(latitude, dtype=np.float64) * COORDINATE_SCALE).astype(np.int64)
+    lon = np.rint(np.asarray(longitude, dtype=np.float64) * COORDINATE_SCALE).astype(np.int64)
+    # Offset to non-negative: latitude needs 31 bits, longitude 32
+    return ((lat + 90 * COORDINATE_SCALE) << _LONGITUDE_BITS) | (lon + 180 * COORDINATE_SCALE)
+
+
+def time_keys(values):
+    """int64 key (epoch seconds) of every datetime"""
+    values = pd.to_datetime(pd.Series(values) if not isinstance(values, pd.Series) else values)
+    return values.to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+
+def hour_keys(values):
+    """Smart key YYYYMMDDHH of the hour of every datetime"""
+    values = pd.to_datetime(pd.Series(values) if not isinstance(values, pd.Series) else values)
+    hours = values.to_numpy(dtype='datetime64[h]')
+    days = hours.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]')
+    year = years.astype(np.int64) + 1970
+    month = (months - years).astype(np.int64) + 1
+    day = (days - months).astype(np.int64) + 1
+    hour = (hours - days).astype(np.int64)
+    return ((year * 100 + month) * 100 + day) * 100 + hour
+
+
+class SurrogateKeyMap:
+    """Natural key -> surrogate id, as two sorted arrays"""
+
+    def __init__(self, keys, ids):
+        keys = np.asarray(keys, dtype=np.int64)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.ids = np.asarray(ids, dtype=np.int32)[order]
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.ids.nbytes
+
+    def resolve(self, keys):
+        """Id of every key (MISSING_ID when unknown)"""
+        keys = np.asarray(keys, dtype=np.int64)
+        if not len(self.keys):
+            return np.full(len(keys), MISSING_ID, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[positions] == keys, self.ids[positions], MISSING_ID)
+
+    def merged(self, keys, ids):
+        """New map with `keys` (not already in this one) added"""
+        return SurrogateKeyMap(np.concatenate([self.keys, np.asarray(keys, dtype=np.int64)]),
+                               np.concatenate([self.ids, np.asarray(ids, dtype=np.int32)]))
@@ -0,0 +1,143 @@
+"""
+Central in-memory schema for the cleaning and loading frames.
+
+Small integers are downcast, low-cardinality strings become categoricals
+and trip ids use Arrow-backed strings when pyarrow is installed. Columns
+that may still contain missing values in the raw file are only downcast
+when their values allow it, so the missing-value rule keeps working.
+"""
+import numpy as np
+import pandas as pd
+
+from arrow_csv import read_csv
+
+try:
+    import pyarrow  # noqa: F401
+    ID_DTYPE = 'string[pyarrow]'
+except ImportError:
+    ID_DTYPE = object
+
+TIME_OF_DAY_DTYPE = pd.CategoricalDtype(['morning', 'afternoon', 'evening', 'night'])
+
+# time_of_day category code for every pickup hour:
+# night 0-5, morning 6-11, afternoon 12-17, evening 18-21, night 22-23
+_HOUR_TO_TIME_OF_DAY = np.array([3] * 6 + [0] * 6 + [1] * 6 + [2] * 4 + [3] * 2, dtype=np.int8)
+
+# Dtypes pandas can apply while parsing the raw train.csv
+RAW_CSV_DTYPES = {
+    'id': ID_DTYPE,
+    'store_and_fwd_flag': 'category',
+    'pickup_longitude': 'float64',
+    'pickup_latitude': 'float64',
+    'dropoff_longitude': 'float64',
+    'dropoff_latitude': 'float64'
+}
+
+# Integer columns and their compact types (applied when the values fit)
+INTEGER_DTYPES = {
+    'vendor_id': 'int8',
+    'passenger_count': 'int8',
+    'trip_duration': 'int32',
+    'pickup_hour': 'int8',
+    'pickup_day': 'int8',
+    'pickup_month': 'int8',
+    'pickup_weekday': 'int8',
+    'pickup_year': 'int16',
+    'is_weekend': 'int8'
+}
+
+# The cleaned dataset has no missing values, so everything can be typed while parsing
+CLEANED_CSV_DTYPES = {
+    **RAW_CSV_DTYPES,
+    **INTEGER_DTYPES,
+    'trip_distance_km': 'float64',
+    'trip_speed_kmh': 'float64',
+    'trip_efficiency': 'float64',
+    'time_of_day': TIME_OF_DAY_DTYPE
+}
+
+DATETIME_COLUMNS = ['pickup_datetime', 'dropoff_datetime']
+
+# Columns of the cleaned dataset summarised in the cleaner's log (cleaning_log['statistics'])
+STATISTIC_COLUMNS = {
+    'trip_duration': 'trip_duration',
+    'trip_distance': 'trip_distance_km',
+    'trip_speed': 'trip_speed_kmh'
+}
+
+
+def downcast_integers(df):
+    """
+    Downcast integer columns in place where every value fits the compact type.
+
+    Columns pandas had to read as float because of missing values are cast
+    back once they hold only whole numbers (i.e. after validation).
+    """
+    for column, dtype in INTEGER_DTYPES.items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if pd.api.types.is_float_dtype(values.dtype):
+            if values.isna().any() or (values % 1 != 0).any():
+                continue
+        elif not pd.api.types.is_integer_dtype(values.dtype):
+            continue
+        info = np.iinfo(dtype)
+        if len(values) == 0 or (values.min() >= info.min and values.max() <= info.max):
+            df[column] = values.astype(dtype)
+    return df
+
+
+def read_raw_csv(path, **kwargs):
+    """
+    Read the raw trip CSV with the compact schema (multithreaded with
+    pyarrow, see arrow_csv).
+
+    Passing `chunksize` returns an iterator of compact chunks, like pd.read_csv.
+    """
+    reader = read_csv(path, timestamps=DATETIME_COLUMNS, dtype=RAW_CSV_DTYPES, **kwargs)
+    if kwargs.get('chunksize') is None:
+        return downcast_integers(reader)
+    return (downcast_integers(chunk) for chunk in reader)
+
+
+def read_cleaned_csv(path, **kwargs):
+    """Read the cleaned CSV with the compact schema (multithreaded with pyarrow, see arrow_csv)"""
+    return read_csv(path, timestamps=DATETIME_COLUMNS, dtype=CLEANED_CSV_DTYPES, **kwargs)
+
+
+def time_of_day(hours):
+    """Vectorized time_of_day bucketing of pickup hours (0-23)"""
+    codes = _HOUR_TO_TIME_OF_DAY[np.asarray(hours, dtype=np.intp)]
+    return pd.Categorical.from_codes(codes, dtype=TIME_OF_DAY_DTYPE)
+
+
+def bytes_per_row(df):
+    """Deep memory use of a frame per row"""
+    return df.memory_usage(deep=True).sum() / max(len(df), 1)
+
+
+def _with_default_dtypes(df):
+    """The frame as pandas would type it without a schema"""
+    dtypes = {}
+    for column, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(dtype):
+            dtypes[column] = object
+        elif pd.api.types.is_integer_dtype(dtype):
+            dtypes[column] = 'int64'
+    return df.astype(dtypes)
+
+
+def memory_report(df, sample_rows=10_000):
+    """
+    One-line summary of a frame's memory use, compared with what pandas'
+    default dtypes would take for the same rows (measured on a sample)
+    """
+    sample = df.head(sample_rows)
+    default = bytes_per_row(_with_default_dtypes(sample))
+    compact = bytes_per_row(sample)
+    total_mb = df.memory_usage(deep=True).sum() / 1024 ** 2
+    return (
+        f"Memory: {total_mb:.1f} MB ({compact:.0f} bytes/row; "
+        f"default dtypes: {default:.0f} bytes/row, {default / compact:.1f}x smaller)"
+    )
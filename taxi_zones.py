@@ -0,0 +1,232 @@
+"""
+Taxi zone and borough lookup for pickup/dropoff coordinates.
+
+Zones are read from a GeoJSON file of the TLC taxi zone boundaries in
+longitude/latitude (NYC Open Data's "NYC Taxi Zones" export, or the TLC
+taxi_zones.shp converted with `ogr2ogr -f GeoJSON -t_srs EPSG:4326`).
+
+Points are resolved in bulk on a uniform grid over the zones' extent. Cells
+that no zone boundary passes through lie wholly inside one zone (or none), so
+their points take the zone of the cell centre. Only points in boundary cells
+get an even-odd ray-casting test, against just the zones whose boundary
+passes through the cell and only those zones' edges in the point's thin
+latitude band.
+Tests are batched by how many edges they involve, so millions of points take
+a few numpy passes instead of one polygon test each.
+"""
+import json
+
+import numpy as np
+
+# Grid cell size; about 200 m in NYC
+DEFAULT_CELL_DEGREES = 0.002
+
+# Rows of edges per grid row used for the ray tests; thinner bands mean fewer
+# edges per test
+_BANDS_PER_ROW = 8
+
+# Upper bound on (tests x edges) evaluated at once
+_BLOCK_ELEMENTS = 1 << 22
+
+
+def _ranges(starts, counts):
+    """Concatenation of range(start, start + count) for each pair"""
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(counts.sum())
+
+
+def _ring_edges(ring):
+    """(x1, y1, x2, y2) rows of a ring's edges"""
+    ring = np.asarray(ring, dtype=np.float64)[:, :2]
+    if len(ring) and not np.array_equal(ring[0], ring[-1]):
+        ring = np.vstack([ring, ring[:1]])
+    return np.hstack([ring[:-1], ring[1:]])
+
+
+def _csr(keys, values, n_keys):
+    """values sorted by key, and the start of every key's run (n_keys + 1 offsets)"""
+    order = np.lexsort((values, keys))
+    return values[order], np.searchsorted(keys[order], np.arange(n_keys + 1))
+
+
+class ZoneIndex:
+    """Grid-indexed taxi zone polygons (see module docstring)"""
+
+    def __init__(self, names, boroughs, zone_rings, cell_degrees=DEFAULT_CELL_DEGREES):
+        """
+        names/boroughs: one per zone; zone_rings: per zone, every ring of its
+        polygon(s) as (n, 2) longitude/latitude arrays. Holes and separate
+        parts need no special treatment under the even-odd rule.
+        """
+        self.names = np.array(names, dtype=object)
+        self.boroughs = np.array(boroughs, dtype=object)
+        self.cell = cell_degrees
+        n_zones = len(self.names)
+
+        edges, edge_zone = [np.empty((0, 4))], [np.empty(0, dtype=np.int32)]
+        for zone, rings in enumerate(zone_rings):
+            for ring in rings:
+                edges.append(_ring_edges(ring))
+                edge_zone.append(np.full(len(edges[-1]), zone, dtype=np.int32))
+        edges, edge_zone = np.vstack(edges), np.concatenate(edge_zone)
+
+        x = np.concatenate([edges[:, 0], edges[:, 2]])
+        y = np.concatenate([edges[:, 1], edges[:, 3]])
+        self.min_lon, self.min_lat = (x.min(), y.min()) if len(x) else (0.0, 0.0)
+        self.n_cols = int((x.max() - self.min_lon) // self.cell) + 1 if len(x) else 1
+        self.n_rows = int((y.max() - self.min_lat) // self.cell) + 1 if len(y) else 1
+        n_cells = self.n_rows * self.n_cols
+        self.n_bands = self.n_rows * _BANDS_PER_ROW
+
+        # Edges of every (zone, latitude band); horizontal edges never cross a ray
+        sloped = edges[edges[:, 1] != edges[:, 3]]
+        sloped_zone = edge_zone[edges[:, 1] != edges[:, 3]]
+        first = self._bands(np.minimum(sloped[:, 1], sloped[:, 3]))
+        spans = self._bands(np.maximum(sloped[:, 1], sloped[:, 3])) - first + 1
+        band_edge = np.repeat(np.arange(len(sloped)), spans)
+        band = sloped_zone[band_edge].astype(np.int64) * self.n_bands + _ranges(first, spans)
+        band_edge, self._band_start = _csr(band, band_edge, n_zones * self.n_bands)
+        band_edges = sloped[band_edge]
+        # x1, y1, y2 and dx/dy of every band edge, gathered together in the tests
+        self._band_edges = np.column_stack([
+            band_edges[:, 0], band_edges[:, 1], band_edges[:, 3],
+            (band_edges[:, 2] - band_edges[:, 0]) / (band_edges[:, 3] - band_edges[:, 1])
+        ])
+
+        # Zones whose boundary passes through each cell: split edges into pieces
+        # no longer than a cell and take the (at most 2 x 2) cells of each piece
+        pieces = np.maximum(1, np.ceil(np.maximum(
+            np.abs(edges[:, 2] - edges[:, 0]), np.abs(edges[:, 3] - edges[:, 1])
+        ) / self.cell)).astype(np.int64)
+        piece_edge = np.repeat(np.arange(len(edges)), pieces)
+        step = (_ranges(np.zeros(len(edges), dtype=np.int64), pieces) / pieces[piece_edge])[:, None]
+        length = (edges[piece_edge, 2:] - edges[piece_edge, :2]) / pieces[piece_edge][:, None]
+        start = edges[piece_edge, :2] + step * (edges[piece_edge, 2:] - edges[piece_edge, :2])
+        end = start + length
+        cells, cell_zones = [], []
+        for lon in (start[:, 0], end[:, 0]):
+            for lat in (start[:, 1], end[:, 1]):
+                cells.append(self._rows(lat) * self.n_cols + self._cols(lon))
+                cell_zones.append(edge_zone[piece_edge])
+        keys = np.unique(np.concatenate(cells) * n_zones + np.concatenate(cell_zones))
+        self._boundary_zones, self._boundary_start = _csr(keys // n_zones, (keys % n_zones).astype(np.int32), n_cells)
+
+        # Zone of every cell's centre among the zones not crossing the cell; it
+        # holds for the whole cell. Candidates come from the zones' bounding boxes.
+        zone_x = np.concatenate([edge_zone, edge_zone])
+        bounds = []
+        for values, reduce, initial in ((self._cols(x), np.minimum, self.n_cols),
+                                        (self._cols(x), np.maximum, -1),
+                                        (self._rows(y), np.minimum, self.n_rows),
+                                        (self._rows(y), np.maximum, -1)):
+            bound = np.full(n_zones, initial, dtype=np.int64)
+            reduce.at(bound, zone_x, values)
+            bounds.append(bound)
+        lo_col, hi_col, lo_row, hi_row = bounds
+        box_cells, box_zones = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int32)]
+        for zone in np.flatnonzero(hi_col >= 0):
+            rows, cols = np.mgrid[lo_row[zone]:hi_row[zone] + 1, lo_col[zone]:hi_col[zone] + 1]
+            box_cells.append((rows * self.n_cols + cols).ravel())
+            box_zones.append(np.full(box_cells[-1].size, zone, dtype=np.int32))
+        box_cells, box_zones = np.concatenate(box_cells), np.concatenate(box_zones)
+        covering = ~np.isin(box_cells * n_zones + box_zones, keys)
+        box_cells, box_zones = box_cells[covering], box_zones[covering]
+        centre_lat = self.min_lat + (box_cells // self.n_cols + 0.5) * self.cell
+        centre_lon = self.min_lon + (box_cells % self.n_cols + 0.5) * self.cell
+        inside = self._inside(centre_lat, centre_lon, box_zones)
+        self._cell_zone = np.full(n_cells, n_zones, dtype=np.int64)
+        np.minimum.at(self._cell_zone, box_cells[inside], box_zones[inside])
+
+    def _cols(self, lon):
+        return ((lon - self.min_lon) // self.cell).astype(np.int64)
+
+    def _rows(self, lat):
+        return ((lat - self.min_lat) // self.cell).astype(np.int64)
+
+    def _bands(self, lat):
+        return np.clip(((lat - self.min_lat) // (self.cell / _BANDS_PER_ROW)).astype(np.int64),
+                       0, self.n_bands - 1)
+
+    @classmethod
+    def from_geojson(cls, path, name_property='zone', borough_property='borough',
+                     cell_degrees=DEFAULT_CELL_DEGREES):
+        with open(path) as f:
+            features = json.load(f)['features']
+        names, boroughs, zone_rings = [], [], []
+        for feature in features:
+            geometry = feature.get('geometry')
+            if not geometry:
+                continue
+            if geometry['type'] == 'Polygon':
+                rings = geometry['coordinates']
+            elif geometry['type'] == 'MultiPolygon':
+                rings = [ring for polygon in geometry['coordinates'] for ring in polygon]
+            else:
+                continue
+            properties = feature.get('properties') or {}
+            names.append(properties.get(name_property))
+            boroughs.append(properties.get(borough_property))
+            zone_rings.append(rings)
+        return cls(names, boroughs, zone_rings, cell_degrees)
+
+    def lookup(self, latitude, longitude):
+        """Zone number of every point (-1 outside all zones); the lowest number wins on overlaps"""
+        lat = np.asarray(latitude, dtype=np.float64)
+        lon = np.asarray(longitude, dtype=np.float64)
+        n_zones = len(self.names)
+        found = np.full(len(lat), n_zones, dtype=np.int64)
+
+        rows, cols = self._rows(lat), self._cols(lon)
+        points = np.flatnonzero((rows >= 0) & (rows < self.n_rows) & (cols >= 0) & (cols < self.n_cols))
+        cells = rows[points] * self.n_cols + cols[points]
+        found[points] = self._cell_zone[cells]
+
+        # Points in boundary cells: test the zones crossing the cell
+        counts = self._boundary_start[cells + 1] - self._boundary_start[cells]
+        pair_point = np.repeat(points, counts)
+        pair_zone = self._boundary_zones[_ranges(self._boundary_start[cells], counts)]
+        inside = self._inside(lat[pair_point], lon[pair_point], pair_zone)
+        np.minimum.at(found, pair_point[inside], pair_zone[inside])
+
+        return np.where(found < n_zones, found, -1).astype(np.int32)
+
+    def _inside(self, lat, lon, zones):
+        """Whether each point lies inside the paired zone"""
+        band = zones.astype(np.int64) * self.n_bands + self._bands(lat)
+        band_first = self._band_start[band]
+        band_edges = self._band_start[band + 1] - band_first
+        # Pad each test to the next power of two of its edge count
+        size_class = np.ceil(np.log2(np.maximum(band_edges, 1))).astype(np.int64)
+        size_class[band_edges == 0] = -1
+
+        inside = np.zeros(len(zones), dtype=bool)
+        for width_class in np.unique(size_class[size_class >= 0]):
+            width = 1 << int(width_class)
+            tests = np.flatnonzero(size_class == width_class)
+            step = max(1, _BLOCK_ELEMENTS // width)
+            for start in range(0, len(tests), step):
+                block = tests[start:start + step]
+                inside[block] = self._crossings(
+                    lat[block], lon[block], band_first[block], band_edges[block], width
+                ) % 2 == 1
+        return inside
+
+    def _crossings(self, lat, lon, first, count, width):
+        """Edges crossed by a ray east from each point, among `count` edges from `first`"""
+        offsets = np.arange(width)
+        valid = offsets[None, :] < count[:, None]
+        index = np.where(valid, first[:, None] + offsets[None, :], 0)
+        x1, y1, y2, slope = np.moveaxis(self._band_edges[index], -1, 0)
+        py = lat[:, None]
+        straddles = (y1 > py) != (y2 > py)
+        return (valid & straddles & (lon[:, None] < x1 + (py - y1) * slope)).sum(axis=1)
+
+    def assign(self, latitude, longitude):
+        """Zone name and borough of every point (None outside all zones)"""
+        zones = self.lookup(latitude, longitude)
+        matched = zones >= 0
+        names = np.full(len(zones), None, dtype=object)
+        boroughs = np.full(len(zones), None, dtype=object)
+        names[matched] = self.names[zones[matched]]
+        boroughs[matched] = self.boroughs[zones[matched]]
+        return names, boroughs
@@ -0,0 +1,40 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'database'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'benchmarks'))
+
+SCHEMA_PATH = os.path.join(ROOT_DIR, 'database', 'database_schema.sql')
+
+# A throwaway PostgreSQL database for the tests that need a real server
+TEST_DSN = os.environ.get('TEST_DATABASE_URL')
+
+
+@pytest.fixture
+def postgres():
+    """A connection to a fresh schema of TEST_DATABASE_URL holding database_schema.sql"""
+    if not TEST_DSN:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    psycopg2 = pytest.importorskip('psycopg2')
+    schema = f'test_{uuid.uuid4().hex[:12]}'
+    admin = psycopg2.connect(TEST_DSN)
+    with admin.cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA {schema}")
+    admin.commit()
+    conn = psycopg2.connect(TEST_DSN, options=f'-c search_path={schema}')
+    with conn.cursor() as cursor, open(SCHEMA_PATH) as f:
+        cursor.execute(f.read())
+    conn.commit()
+    try:
+        yield conn
+    finally:
+        conn.close()
+        with admin.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.commit()
+        admin.close()
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+import arrow_csv
+
+pytest.importorskip('pyarrow')
+
+ROWS = 300
+
+
+@pytest.fixture
+def trips_csv(tmp_path):
+    """A CSV with text in a numeric column at row 250, past where Arrow starts streaming"""
+    passengers = ['1'] * ROWS
+    passengers[250] = 'one'
+    path = tmp_path / 'trips.csv'
+    pd.DataFrame({'id': [f'id{n}' for n in range(ROWS)],
+                  'pickup_datetime': pd.date_range('2016-03-01', periods=ROWS, freq='min'),
+                  'passenger_count': passengers, 'trip_duration': range(ROWS)}).to_csv(path, index=False)
+    return str(path)
+
+
+def test_chunks_keep_their_dtypes_when_arrow_gives_up(trips_csv, monkeypatch):
+    monkeypatch.setattr(arrow_csv, 'BLOCK_SIZE', 1 << 10)
+    chunks = list(arrow_csv.read_csv(trips_csv, timestamps=['pickup_datetime'], dtype={'id': str},
+                                     chunksize=20))
+
+    assert sum(len(chunk) for chunk in chunks) == ROWS
+    assert {str(chunk['pickup_datetime'].dtype) for chunk in chunks} == {'datetime64[ns]'}
+    assert {str(chunk['trip_duration'].dtype) for chunk in chunks} == {'int64'}
+    frame = pd.concat(chunks)
+    assert frame.index.tolist() == list(range(ROWS))
+    assert frame['pickup_datetime'].tolist() == pd.date_range('2016-03-01', periods=ROWS, freq='min').tolist()
+    # Arrow read the first chunks, pandas the rest
+    assert chunks[0]['passenger_count'].dtype == 'int64' and chunks[250 // 20]['passenger_count'].dtype == object
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cleaning_rules import Rule, evaluate_rules
+from data_cleaning import NYCTaxiDataCleaner
+from trip_ids import TripIdSet
+
+VALID = {
+    'id': 'id0', 'vendor_id': 1,
+    'pickup_datetime': '2016-03-01 10:00:00', 'dropoff_datetime': '2016-03-01 10:10:00',
+    'passenger_count': 1,
+    'pickup_longitude': -73.98, 'pickup_latitude': 40.75,
+    'dropoff_longitude': -73.97, 'dropoff_latitude': 40.76,
+    'store_and_fwd_flag': 'N', 'trip_duration': 600
+}
+
+
+def trips(*changes):
+    """A frame of valid trips (ids id0, id1, ...), each with its changes applied"""
+    rows = [{**VALID, 'id': f'id{number}', **change} for number, change in enumerate(changes)]
+    df = pd.DataFrame(rows)
+    for column in ['pickup_datetime', 'dropoff_datetime']:
+        df[column] = pd.to_datetime(df[column])
+    return df
+
+
+def evaluate(df, **context):
+    return evaluate_rules(df, {'duration_bounds': (100, 5000), **context})
+
+
+def test_rows_failing_several_rules_count_once_for_their_first():
+    df = trips(
+        {},                                                       # valid
+        {'vendor_id': np.nan, 'passenger_count': 9},              # missing values, passengers
+        {'id': 'id0', 'pickup_latitude': 0.0},                    # duplicate, outside NYC, zero coordinates
+        {'dropoff_datetime': '2016-03-01 09:00:00', 'trip_duration': 30},  # time sequence, duration
+        {'pickup_latitude': 42.0, 'passenger_count': 0},          # outside NYC, passengers, speed
+        {'trip_duration': 30},                                    # duration range, speed
+        {'passenger_count': 0},                                   # passengers
+        {'dropoff_longitude': -73.98, 'dropoff_latitude': 40.75},  # speed (no distance)
+        {'trip_duration': 7000},                                  # duration outlier, speed
+        {},                                                       # valid
+    )
+    result = evaluate(df)
+
+    assert result.reasons.dtype == np.uint16
+    assert result.removed_by_rule() == {
+        'missing_values': 1,
+        'duplicate_id': 1,
+        'invalid_time_sequence': 1,
+        'outside_nyc': 1,
+        'zero_coordinates': 0,
+        'duration_out_of_range': 1,
+        'duration_outlier': 1,
+        'invalid_passenger_count': 1,
+        'unrealistic_speed': 1,
+        'already_loaded': 0
+    }
+    assert result.valid.tolist() == [True] + [False] * 8 + [True]
+
+    # Every failing rule is kept in the mask, not only the first
+    assert np.flatnonzero(result.failed('invalid_passenger_count')).tolist() == [1, 4, 6]
+    assert np.flatnonzero(result.failed('zero_coordinates')).tolist() == [2]
+    assert np.flatnonzero(result.failed('outside_nyc')).tolist() == [2, 4]
+    assert np.flatnonzero(result.first_failed('outside_nyc')).tolist() == [4]
+    assert result.failed('unrealistic_speed')[[4, 5, 7, 8]].all()
+    assert np.flatnonzero(result.first_failed('unrealistic_speed')).tolist() == [7]
+
+
+def test_survivor_rules_only_judge_rows_still_alive():
+    # Row 0 is removed for a missing value, so row 1 is the first survivor with its id
+    df = trips({'vendor_id': np.nan}, {'id': 'id0'}, {'id': 'id0'})
+    result = evaluate(df)
+
+    assert result.removed_by_rule()['missing_values'] == 1
+    assert result.removed_by_rule()['duplicate_id'] == 1
+    assert result.valid.tolist() == [False, True, False]
+    assert result.first_failed('duplicate_id').tolist() == [False, False, True]
+
+
+def test_already_loaded_is_last():
+    loaded = TripIdSet()
+    loaded.add(['id1', 'id2'])
+    df = trips({}, {}, {'passenger_count': 0})
+    result = evaluate(df, loaded_ids=loaded)
+
+    counts = result.removed_by_rule()
+    assert counts['already_loaded'] == 1
+    assert counts['invalid_passenger_count'] == 1
+    assert result.valid.tolist() == [True, False, False]
+
+
+
+@pytest.mark.parametrize('skip_loaded', [False, True])
+def test_already_loaded_is_reported_only_when_skipping(tmp_path, skip_loaded):
+    cleaner = NYCTaxiDataCleaner('unused.csv', str(tmp_path),
+                                 skip_loaded=str(tmp_path / 'trips.npz') if skip_loaded else None)
+    cleaner.verbose = False
+    cleaner._duration_bounds = (100, 5000)
+    if skip_loaded:
+        cleaner._loaded_ids = TripIdSet()
+        cleaner._loaded_ids.add(['id1'])
+    cleaner.df = pd.DataFrame([{**VALID, 'id': f'id{number}'} for number in range(3)])
+    cleaner.validate()
+
+    assert len(cleaner.df) == (2 if skip_loaded else 3)
+    for section in ('removed_records', 'removed_by_rule'):
+        assert ('already_loaded' in cleaner.cleaning_log[section]) == skip_loaded
+
+
+def test_stop_before_and_skip():
+    df = trips({'passenger_count': 0}, {'trip_duration': 30})
+    assert evaluate_rules(df, {}, stop_before='duration_out_of_range').valid.tolist() == [True, True]
+    skipped = evaluate_rules(df, {'duration_bounds': (100, 5000)},
+                             skip=('duration_out_of_range', 'unrealistic_speed'))
+    assert skipped.valid.tolist() == [False, False]
+    assert skipped.first_failed('duration_outlier').tolist() == [False, True]
+
+
+def test_sixteen_rules_at_most():
+    rules = [Rule(f'rule_{i}', None, '', lambda df, alive, context: np.zeros(len(df), dtype=bool))
+             for i in range(17)]
+    with pytest.raises(ValueError):
+        evaluate_rules(trips({}), {}, rules=rules)
+    assert evaluate_rules(trips({}), {}, rules=rules[:16]).removed_by_rule()['rule_15'] == 0
+
+
+def test_highest_bit_attribution():
+    # The sixteenth rule uses the top bit of the uint16 mask
+    rules = [Rule(f'rule_{i}', None, '', lambda df, alive, context, i=i: np.array([i == 15, i >= 14]))
+             for i in range(16)]
+    result = evaluate_rules(trips({}, {}), {}, rules=rules)
+    assert result.reasons.tolist() == [1 << 15, (1 << 15) | (1 << 14)]
+    counts = result.removed_by_rule()
+    assert (counts['rule_15'], counts['rule_14']) == (1, 1)
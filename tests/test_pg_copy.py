@@ -0,0 +1,135 @@
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pg_copy import BINARY_HEADER, binary_copy_buffer, column_type, copy_buffer, text_copy_buffer
+
+PG_EPOCH = datetime(2000, 1, 1)
+
+# Decoding of binary COPY fields by PostgreSQL type, as the server reads them
+BINARY_DECODERS = {
+    'boolean': lambda b: {b'\x00': False, b'\x01': True}[b],
+    'integer': lambda b: struct.unpack('>i', b)[0],
+    'bigint': lambda b: struct.unpack('>q', b)[0],
+    'double precision': lambda b: struct.unpack('>d', b)[0],
+    'timestamp': lambda b: PG_EPOCH + timedelta(microseconds=struct.unpack('>q', b)[0]),
+    'text': lambda b: b.decode('utf-8'),
+}
+
+TEXT_DECODERS = {
+    'boolean': lambda t: {'t': True, 'f': False}[t],
+    'integer': int,
+    'bigint': int,
+    'double precision': float,
+    'timestamp': datetime.fromisoformat,
+    'text': lambda t: t.replace('\\t', '\t').replace('\\n', '\n').replace('\\r', '\r').replace('\\\\', '\\'),
+}
+
+
+def decode_binary(data, types):
+    """Rows of a binary COPY payload, checking its framing on the way"""
+    assert data.startswith(BINARY_HEADER)
+    position, rows = len(BINARY_HEADER), []
+    while True:
+        fields, = struct.unpack_from('>h', data, position)
+        position += 2
+        if fields == -1:
+            assert position == len(data), "bytes after the trailer"
+            return rows
+        assert fields == len(types)
+        row = []
+        for column_type_ in types:
+            length, = struct.unpack_from('>i', data, position)
+            position += 4
+            if length == -1:
+                row.append(None)
+                continue
+            row.append(BINARY_DECODERS[column_type_](data[position:position + length]))
+            position += length
+        rows.append(tuple(row))
+
+
+def decode_text(data, types):
+    rows = []
+    for line in data.decode().split('\n')[:-1]:
+        rows.append(tuple(None if field == '\\N' else TEXT_DECODERS[column_type_](field)
+                          for field, column_type_ in zip(line.split('\t'), types)))
+    return rows
+
+
+def expected_value(value):
+    """A column value as it should come back out of PostgreSQL"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, (np.datetime64, pd.Timestamp)):
+        return None if pd.isna(value) else pd.Timestamp(value).to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+COLUMNS = {
+    'row': np.arange(8, dtype=np.int32),
+    'flag': np.array([True, False, True, True, False, False, True, False]),
+    'small': np.array([0, 1, -1, 2 ** 31 - 1, -2 ** 31, 7, 8, 9], dtype=np.int32),
+    'big': np.array([0, 2 ** 40, -2 ** 62, 2 ** 63 - 1, -1, 5, 6, 7], dtype=np.int64),
+    'unsigned': np.array([0, 2 ** 32 - 1, 1, 2, 3, 4, 5, 6], dtype=np.uint32),
+    'real': np.array([0.1, -2.5e-300, np.nan, np.inf, -np.inf, 1 / 3, np.nan, 40.7589]),
+    'when': np.array(['2016-03-01T10:00:00', '1999-12-31T23:59:59.999999', 'NaT', '2000-01-01',
+                      '1970-01-01', '2016-06-30T23:59:59', 'NaT', '2038-01-19T03:14:08'],
+                     dtype='datetime64[ns]'),
+    'name': np.array(['id2875421', '', None, 'ünïcödé', 'tab\there', np.nan, 'a\\b\nc', 'x' * 300],
+                     dtype=object),
+}
+
+
+def test_column_types():
+    assert [column_type(values) for values in COLUMNS.values()] == [
+        'integer', 'boolean', 'integer', 'bigint', 'bigint', 'double precision', 'timestamp', 'text'
+    ]
+    assert column_type(pd.Series([1, 2], dtype=np.int16)) == 'integer'
+    assert column_type(pd.Series(['a'])) == 'text'
+
+
+@pytest.mark.parametrize('copy_format', ['binary', 'text'])
+def test_round_trip(copy_format):
+    columns = list(COLUMNS.values())
+    types = [column_type(values) for values in columns]
+    data = copy_buffer(columns, copy_format).getvalue()
+    decoded = decode_binary(data, types) if copy_format == 'binary' else decode_text(data, types)
+
+    # Binary rows come grouped by layout; the row number puts them back in order
+    assert sorted(row[0] for row in decoded) == list(range(8))
+    decoded.sort(key=lambda row: row[0])
+    for number, row in enumerate(decoded):
+        expected = tuple(expected_value(values[number]) for values in columns)
+        assert row == expected, f"row {number}"
+
+
+def test_binary_nulls_have_no_payload():
+    data = binary_copy_buffer([np.array([np.nan]), np.array(['NaT'], dtype='datetime64[ns]'),
+                               np.array([None], dtype=object)]).getvalue()
+    body = data[len(BINARY_HEADER):]
+    assert body == struct.pack('>hiii', 3, -1, -1, -1) + struct.pack('>h', -1)
+
+
+def test_binary_field_lengths():
+    data = binary_copy_buffer([np.array([7], dtype=np.int32), np.array([7], dtype=np.int64),
+                               np.array([0.5]), np.array([True]), np.array(['abc'], dtype=object),
+                               np.array(['2000-01-01T00:00:01'], dtype='datetime64[ns]')]).getvalue()
+    assert data[len(BINARY_HEADER):-2] == (
+        struct.pack('>h', 6)
+        + struct.pack('>ii', 4, 7) + struct.pack('>iq', 8, 7) + struct.pack('>id', 8, 0.5)
+        + struct.pack('>iB', 1, 1) + struct.pack('>i', 3) + b'abc' + struct.pack('>iq', 8, 1_000_000)
+    )
+
+
+def test_series_input_and_empty_buffers():
+    series = [pd.Series([1.5, None]), pd.Series(['a', None])]
+    types = [column_type(values) for values in series]
+    assert decode_binary(binary_copy_buffer(series).getvalue(), types) == [(1.5, 'a'), (None, None)]
+    assert decode_binary(binary_copy_buffer([np.zeros(0)]).getvalue(), ['double precision']) == []
+    assert text_copy_buffer([np.zeros(0)]).getvalue() == b''
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from streaming_stats import SpilledColumn
+
+QUANTILES = [0, 0.001, 0.25, 0.5, 0.75, 0.999, 1]
+
+
+def numpy_quantile(values, q):
+    """np.quantile as pandas calls it (a percentile), which SpilledColumn reproduces to the bit"""
+    return np.percentile(values, q * 100)
+
+
+@pytest.fixture
+def spilled(tmp_path):
+    columns = []
+
+    def make(**kwargs):
+        column = SpilledColumn(str(tmp_path / f'column_{len(columns)}.bin'), **kwargs)
+        columns.append(column)
+        return column
+
+    yield make
+    for column in columns:
+        column.close()
+
+
+def test_quantiles_match_numpy_when_narrowing(spilled):
+    # A budget far below the count forces several histogram narrowing rounds
+    values = np.random.default_rng(7).lognormal(6, 1.5, 50_000)
+    column = spilled(block_size=4096, selection_budget=100, bins=16)
+    for start in range(0, len(values), 3000):
+        column.add(values[start:start + 3000])
+
+    assert column.count == len(values)
+    for q in QUANTILES:
+        assert column.quantile(q) == numpy_quantile(values, q)
+    assert column.median() == np.median(values)
+    for k in [0, 1, 12_345, len(values) - 1]:
+        assert column.kth_smallest(k) == np.sort(values)[k]
+
+
+def test_ties_and_adjacent_floats(spilled):
+    # Long runs of equal values and neighbouring representable floats
+    base = 1234.5
+    values = np.concatenate([
+        np.full(10_000, base),
+        np.full(5_000, np.nextafter(base, np.inf)),
+        np.random.default_rng(1).integers(0, 20, 20_000).astype(np.float64)
+    ])
+    np.random.default_rng(2).shuffle(values)
+    column = spilled(block_size=1000, selection_budget=50, bins=8).add(values)
+
+    for q in QUANTILES + [0.6, 0.62, 0.9]:
+        assert column.quantile(q) == numpy_quantile(values, q)
+
+
+def test_nan_is_skipped_like_pandas(spilled):
+    values = np.random.default_rng(3).normal(size=5000)
+    with_nan = values.copy()
+    with_nan[::7] = np.nan
+    column = spilled(selection_budget=64).add(with_nan)
+
+    kept = with_nan[~np.isnan(with_nan)]
+    assert column.count == len(kept)
+    assert column.quantile(0.3) == numpy_quantile(kept, 0.3)
+    assert column.mean() == pytest.approx(kept.mean(), rel=1e-12)
+    assert column.std() == pytest.approx(kept.std(ddof=1), rel=1e-12)
+
+
+def test_values_spilled_by_another_process(spilled, tmp_path):
+    values = np.random.default_rng(4).exponential(300, 20_000)
+    path = tmp_path / 'worker.bin'
+    values.tofile(path)
+    column = spilled(block_size=2048, selection_budget=200).add_file(str(path))
+
+    for q in QUANTILES:
+        assert column.quantile(q) == numpy_quantile(values, q)
+
+
+def test_kth_smallest_out_of_range(spilled):
+    column = spilled().add([1.0, 2.0])
+    with pytest.raises(IndexError):
+        column.kth_smallest(2)
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from load_data_to_db import DatabaseLoader
+from recording_db import RecordingConnection
+from surrogate_keys import MISSING_ID, coordinate_keys, time_keys
+
+
+def trips(first, count):
+    """`count` trips with distinct pickup times and places, numbered from `first`"""
+    numbers = np.arange(first, first + count)
+    pickup = pd.Timestamp('2016-03-01') + pd.to_timedelta(numbers * 61, unit='s')
+    return pd.DataFrame({
+        'pickup_datetime': pickup,
+        'pickup_hour': pickup.hour, 'pickup_day': pickup.day, 'pickup_month': pickup.month,
+        'pickup_weekday': pickup.weekday, 'pickup_year': pickup.year,
+        'time_of_day': 'morning', 'is_weekend': pickup.weekday >= 5,
+        'pickup_latitude': 40.7 + numbers * 1e-5, 'pickup_longitude': -73.9 - numbers * 1e-5,
+        'dropoff_latitude': 40.8 + numbers * 1e-5, 'dropoff_longitude': -73.95,
+    })
+
+
+def loader_on(conn, method='insert'):
+    loader = DatabaseLoader(None, None, None, None, method=method)
+    loader.use_connection(conn)
+    return loader
+
+
+def location_keys(df):
+    return np.unique(np.concatenate([
+        coordinate_keys(df['pickup_latitude'], df['pickup_longitude']),
+        coordinate_keys(df['dropoff_latitude'], df['dropoff_longitude'])
+    ]))
+
+
+@pytest.mark.parametrize('method', ['insert', 'copy'])
+def test_new_keys_get_one_block_of_sequence_ids(method):
+    db = RecordingConnection()
+    loader = loader_on(db, method)
+    df = trips(0, 50)
+    assert loader.populate_time_dimensions(df)
+    assert loader.populate_locations(df)
+
+    # One nextval() call per dimension, for all of its new keys
+    assert db.statements['nextval time_dimensions'] == 1
+    assert db.statements['nextval locations'] == 1
+    time_ids = loader.time_map.resolve(time_keys(df['pickup_datetime']))
+    assert sorted(time_ids) == list(range(1, 51))
+    location_ids = loader.location_map.resolve(location_keys(df))
+    assert sorted(location_ids) == list(range(1, 101))
+
+    # The rows carry the reserved ids
+    rows = db.tables['time_dimensions'].select(['time_id', 'pickup_datetime'])
+    assert {time_id: pd.Timestamp(when) for time_id, when in rows} == dict(zip(time_ids, df['pickup_datetime']))
+
+
+def test_known_keys_reserve_nothing():
+    db = RecordingConnection()
+    loader = loader_on(db)
+    assert loader.populate_locations(trips(0, 30))
+    assert loader.populate_locations(trips(10, 30))
+
+    # Only the 10 trips beyond the first load are new
+    assert db.statements['nextval locations'] == 2
+    assert db.sequences['locations'] == len(location_keys(trips(0, 40)))
+    assert len(db.tables['locations'].rows) == db.sequences['locations']
+
+
+def test_keys_loaded_by_another_loader_keep_their_ids():
+    db = RecordingConnection()
+    first = loader_on(db)
+    assert first.populate_time_dimensions(trips(0, 20))
+
+    second = loader_on(db)
+    df = trips(0, 25)
+    assert second.populate_time_dimensions(df)
+    keys = time_keys(df['pickup_datetime'])
+    # Found by the key join, not reserved again
+    assert (second.time_map.resolve(keys[:20]) == first.time_map.resolve(keys[:20])).all()
+    assert sorted(second.time_map.resolve(keys[20:])) == list(range(21, 26))
+    assert len(db.tables['time_dimensions'].rows) == 25
+
+
+def test_failed_insert_forgets_reserved_ids():
+    db = RecordingConnection()
+    loader = loader_on(db)
+    assert loader.populate_locations(trips(0, 5))
+    known = loader.location_map
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("connection lost")
+    loader._write_rows = fail
+    df = trips(5, 5)
+    assert not loader.populate_locations(df)
+
+    # Reserved but never written: no trip may get these ids
+    assert loader.location_map is known
+    new_keys = np.setdiff1d(location_keys(df), location_keys(trips(0, 5)))
+    assert (loader.location_map.resolve(new_keys) == MISSING_ID).all()
+
+
+@pytest.mark.parametrize('method', ['insert', 'copy'])
+def test_reserved_ids_on_postgres(postgres, method):
+    first = loader_on(postgres, method)
+    assert first.populate_time_dimensions(trips(0, 40))
+    assert first.populate_locations(trips(0, 40))
+
+    # A second loader's overlapping load: known keys are joined, not inserted again
+    second = loader_on(postgres, method)
+    df = trips(20, 40)
+    assert second.populate_time_dimensions(df)
+    assert second.populate_locations(df)
+
+    cursor = postgres.cursor()
+    cursor.execute("SELECT time_id, pickup_datetime FROM time_dimensions")
+    stored = {pd.Timestamp(when): time_id for time_id, when in cursor.fetchall()}
+    assert len(stored) == 60
+    assert all(stored[when] == time_id for when, time_id in
+               zip(df['pickup_datetime'], second.time_map.resolve(time_keys(df['pickup_datetime']))))
+
+    cursor.execute("SELECT location_id, latitude, longitude FROM locations")
+    rows = cursor.fetchall()
+    keys = coordinate_keys(np.array([r[1] for r in rows], dtype=float), np.array([r[2] for r in rows], dtype=float))
+    assert len(set(keys)) == len(rows) == len(location_keys(trips(0, 60)))
+    # The second loader knows the ids of the locations of its own trips
+    own = np.isin(keys, location_keys(df))
+    assert own.any() and not own.all()
+    assert (second.location_map.resolve(keys[own]) == np.array([r[0] for r in rows])[own]).all()
+
+    # Reserved ids come after every id in use: the sequence is never reused
+    cursor.execute("SELECT last_value FROM time_dimensions_time_id_seq")
+    assert cursor.fetchone()[0] == max(stored.values())
+    postgres.commit()
@@ -0,0 +1,95 @@
+import hashlib
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from trip_aggregates import create_summary_tables, partial_aggregates, trip_id_hashes
+from trip_partitions import create_partitions
+
+TRIP_IDS = ['id0', 'id1', 'id01', 'id2875421', 'id' + '9' * 17, 'id' + '9' * 18, 'idx1', 'ID1', '', 'trip-1']
+
+
+def reference_hash(trip_id):
+    """trip_id_hash(trip_id) step by step, as the SQL function computes it"""
+    if not re.fullmatch(r'id[0-9]{1,17}', trip_id):
+        return int.from_bytes(hashlib.md5(trip_id.encode()).digest()[:4], 'big')
+    packed = ((len(trip_id) - 2) << 57) | int(trip_id[2:])
+    h = packed >> 32
+    h = (((h >> 16) ^ h) * 73244475) & 4294967295
+    h = (((h >> 16) ^ h) * 73244475) & 4294967295
+    h = ((h >> 16) ^ h) ^ (packed & 4294967295)
+    h = (((h >> 16) ^ h) * 73244475) & 4294967295
+    h = (((h >> 16) ^ h) * 73244475) & 4294967295
+    return (h >> 16) ^ h
+
+
+def test_hashes_match_the_sql_steps():
+    assert trip_id_hashes(TRIP_IDS).tolist() == [reference_hash(trip_id) for trip_id in TRIP_IDS]
+
+
+def test_hashes_stay_within_32_bits():
+    hashes = trip_id_hashes([f'id{n}' for n in range(0, 10 ** 7, 997)])
+    assert hashes.dtype == np.int64
+    assert 0 <= hashes.min() and hashes.max() < 1 << 32
+    # Neighbouring ids spread over the range
+    assert len(np.unique(hashes)) == len(hashes) and hashes.max() > 1 << 31
+
+
+def test_daily_totals_sum_the_hashes_of_their_trips():
+    trip_ids = ['id1', 'id2', 'odd']
+    aggregates = partial_aggregates({
+        'trip_id': np.array(trip_ids, dtype=object),
+        'pickup_datetime': pd.to_datetime(['2016-03-01 08:00', '2016-03-01 23:00', '2016-03-02 01:00']).to_numpy(),
+        'pickup_location_id': np.array([1, 1, 2]),
+        'trip_distance_km': np.array([1.0, 2.0, 3.0]),
+        'trip_duration': np.array([60, 120, 180]),
+        'trip_speed_kmh': np.array([10.0, np.nan, 20.0]),
+    })
+    _, names, columns = next(aggregate for aggregate in aggregates if aggregate[0] == 'daily_trip_totals')
+    daily = dict(zip(names, columns))
+    hashes = [reference_hash(trip_id) for trip_id in trip_ids]
+    assert daily['trip_id_hash'].tolist() == [hashes[0] + hashes[1], hashes[2]]
+
+
+def test_sql_function_matches_numpy(postgres):
+    cursor = postgres.cursor()
+    cursor.execute("SELECT trip_id_hash(trip_id) FROM UNNEST(%s::TEXT[]) AS trip_id", (TRIP_IDS,))
+    assert [row[0] for row in cursor.fetchall()] == trip_id_hashes(TRIP_IDS).tolist()
+
+
+def test_daily_totals_gain_the_hash_of_the_trips_stored(postgres):
+    psycopg2 = pytest.importorskip('psycopg2')
+    cursor = postgres.cursor()
+    create_partitions(cursor, [(2016, 3)])
+    cursor.execute("INSERT INTO time_dimensions (time_id, pickup_datetime, pickup_hour, pickup_day, pickup_month, "
+                   "pickup_weekday, pickup_year, is_weekend) VALUES (1, '2016-03-01 08:00', 8, 1, 3, 1, 2016, false), "
+                   "(2, '2016-03-02 08:00', 8, 2, 3, 2, 2016, false)")
+    cursor.execute("INSERT INTO locations (location_id, latitude, longitude) VALUES (1, 40.7, -73.9)")
+    trips = [('id1', 1), ('id02', 1), ('odd', 2)]
+    for trip_id, time_id in trips:
+        cursor.execute(
+            "INSERT INTO trip_facts (trip_id, vendor_id, pickup_location_id, dropoff_location_id, time_id, "
+            "pickup_datetime, dropoff_datetime, trip_duration, trip_distance_km) "
+            "SELECT %s, 1, 1, 1, time_id, pickup_datetime, pickup_datetime + interval '10 minutes', 600, 2.5 "
+            "FROM time_dimensions WHERE time_id = %s", (trip_id, time_id)
+        )
+    # Summary tables of a database summarised before trip_id_hash was added
+    cursor.execute("ALTER TABLE daily_trip_totals DROP COLUMN trip_id_hash")
+    cursor.execute("DROP FUNCTION trip_id_hash(TEXT)")
+    cursor.execute("INSERT INTO daily_trip_totals SELECT DATE(td.pickup_datetime), false, COUNT(*), 0, 0, 0, 0 "
+                   "FROM trip_facts tf JOIN time_dimensions td ON tf.time_id = td.time_id GROUP BY 1")
+    cursor.execute("INSERT INTO hourly_trip_totals VALUES (8, false, 'morning', 3, 0, 0, 0, 0)")
+    postgres.commit()
+
+    assert not create_summary_tables(cursor)
+    postgres.commit()
+    cursor.execute("SELECT trip_id_hash FROM daily_trip_totals ORDER BY trip_date")
+    hashes = trip_id_hashes([trip_id for trip_id, _ in trips])
+    assert [row[0] for row in cursor.fetchall()] == [hashes[0] + hashes[1], hashes[2]]
+    # Merged rows have to give the hash from now on
+    with pytest.raises(psycopg2.IntegrityError):
+        cursor.execute("INSERT INTO daily_trip_totals (trip_date, is_weekend, trip_count, total_distance, "
+                       "total_duration, total_speed, speed_count) VALUES ('2016-03-03', false, 1, 0, 0, 0, 0)")
+    postgres.rollback()
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from trip_ids import TripIdSet, encode_trip_ids
+from trip_index import LoadedTripIndex
+
+
+def test_digit_count_keeps_zero_padded_ids_apart():
+    keys, encodable = encode_trip_ids(['id1', 'id01', 'id001', 'id10'])
+    assert encodable.all()
+    assert len(set(keys.tolist())) == 4
+
+
+def test_longest_packed_ids_stay_exact():
+    ids = ['id' + '9' * 17, 'id' + '9' * 16 + '8', 'id' + '0' * 17]
+    keys, encodable = encode_trip_ids(ids)
+    assert encodable.all()
+    assert len(set(keys.tolist())) == 3
+
+
+@pytest.mark.parametrize('trip_id', ['id', 'idx1', 'ID1', 'id1a', 'id-1', 'trip1', 'id' + '1' * 18, ''])
+def test_ids_off_the_pattern_are_not_packed(trip_id):
+    _, encodable = encode_trip_ids([trip_id])
+    assert not encodable[0]
+
+
+def test_packed_and_plain_ids_do_not_collide():
+    id_set = TripIdSet()
+    id_set.add(['id1', 'idx1'])
+    assert id_set.contains(['id1', 'idx1', 'id01', 'idx01', 'x1']).tolist() == [True, True, False, False, False]
+
+
+def test_unseen_ids_are_not_contained():
+    id_set = TripIdSet()
+    assert id_set.contains(['id1', 'other']).tolist() == [False, False]
+
+    id_set.add([f'id{n}' for n in range(0, 1000, 2)])
+    probe = [f'id{n}' for n in range(-1, 1001)]
+    assert id_set.contains(probe).tolist() == [n % 2 == 0 and 0 <= n < 1000 for n in range(-1, 1001)]
+    # Beyond both ends of every run
+    assert not id_set.contains(['id0' + '9' * 16, 'id' + '9' * 17]).any()
+
+
+def test_runs_merge_like_a_binary_counter():
+    id_set = TripIdSet()
+    rng = np.random.default_rng(7)
+    ids = rng.permutation(5000)
+    for start in range(0, 5000, 100):
+        id_set.add([f'id{n}' for n in ids[start:start + 100]])
+        sizes = [len(run) for run in id_set._runs]
+        # Strictly shrinking runs: logarithmically many of them
+        assert sizes == sorted(sizes, reverse=True) and len(set(sizes)) == len(sizes)
+        for run in id_set._runs:
+            assert (np.diff(run) > 0).all()
+    assert len(id_set) == 5000
+    assert len(id_set._runs) <= int(np.log2(50)) + 1
+    assert id_set.contains([f'id{n}' for n in range(5000)]).all()
+
+
+def test_mark_new_flags_the_first_occurrence_of_new_ids():
+    id_set = TripIdSet()
+    id_set.add(['id1', 'odd'])
+    new = id_set.mark_new(['id1', 'id2', 'id2', 'odd', 'new', 'new', 'id3'])
+    assert new.tolist() == [False, True, False, False, True, False, True]
+    assert len(id_set) == 5
+    assert not id_set.mark_new(['id2', 'new', 'id3']).any()
+
+
+def test_saved_set_loads_with_the_same_ids(tmp_path):
+    id_set = TripIdSet()
+    for start in range(0, 300, 100):
+        id_set.add([f'id{n}' for n in range(start, start + 100)])
+    id_set.add(['odd', 'id01'])
+    path = str(tmp_path / 'ids.npz')
+    id_set.save(path, extra=np.int64(3))
+
+    loaded = TripIdSet.load(path)
+    assert len(loaded) == len(id_set) == 302
+    assert loaded.contains(['id0', 'id299', 'odd', 'id01', 'id1', 'id300']).tolist() == [
+        True, True, True, True, True, False
+    ]
+    assert not loaded.contains(['id001', 'other']).any()
+    with np.load(path) as data:
+        assert int(data['extra']) == 3
+
+
+def test_index_is_read_only_at_its_generation(tmp_path):
+    path = str(tmp_path / 'index.npz')
+    index = LoadedTripIndex(path)
+    assert not index.read(0)
+
+    index.ids = TripIdSet()
+    index.ids.add(['id1'])
+    index.generation = 4
+    index.save()
+    assert not LoadedTripIndex(path).read(3)
+    assert not LoadedTripIndex(path).read(5)
+    reread = LoadedTripIndex(path)
+    assert reread.read(4) and reread.contains(['id1', 'id2']).tolist() == [True, False]
+
+
+def test_index_falls_behind_on_a_generation_gap(tmp_path):
+    index = LoadedTripIndex(str(tmp_path / 'index.npz'))
+    index.ids, index.generation = TripIdSet(), 4
+    index.follow(5)
+    index.follow(6)
+    assert index.generation == 6 and not index.behind
+    # Someone else's transaction took 7
+    index.follow(8)
+    assert index.behind
+    index.follow(9)
+    assert index.behind
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from trip_partitions import (
+    TRIP_ID_TABLE, create_partitions, create_replacement, create_trip_id_guard, route_batch, swap_partition
+)
+
+MARCH, APRIL = (2016, 3), (2016, 4)
+
+
+def test_route_batch_splits_by_month():
+    pickup = np.array(['2016-03-31T23:59:59', '2016-04-01T00:00:00', '2016-03-01T00:00:00'], dtype='datetime64[ns]')
+    ids = np.array(['a', 'b', 'c'])
+    routes = route_batch(['trip_id', 'pickup_datetime'], [ids, pickup])
+    assert [(name, list(rows[0])) for name, rows in routes] == [
+        ('trip_facts_2016_03', ['a', 'c']), ('trip_facts_2016_04', ['b'])
+    ]
+
+
+def add_trip(cursor, trip_id, pickup, table='trip_facts'):
+    cursor.execute(
+        f"INSERT INTO {table} (trip_id, vendor_id, pickup_location_id, dropoff_location_id, time_id, "
+        "pickup_datetime, dropoff_datetime, trip_duration, trip_distance_km) "
+        "VALUES (%s, 1, 1, 1, 1, %s, %s::timestamp + interval '10 minutes', 600, 2.5)",
+        (trip_id, pickup, pickup)
+    )
+    return cursor.rowcount
+
+
+@pytest.fixture
+def trip_facts(postgres):
+    """The postgres schema with March and April partitions and a trip's dimension rows"""
+    cursor = postgres.cursor()
+    create_partitions(cursor, [MARCH, APRIL])
+    cursor.execute("INSERT INTO time_dimensions (time_id, pickup_datetime, pickup_hour, pickup_day, pickup_month, "
+                   "pickup_weekday, pickup_year, is_weekend) VALUES (1, '2016-03-01', 0, 1, 3, 1, 2016, false)")
+    cursor.execute("INSERT INTO locations (location_id, latitude, longitude) VALUES (1, 40.7, -73.9)")
+    postgres.commit()
+    return cursor
+
+
+def stored(cursor, table):
+    cursor.execute(f"SELECT trip_id FROM {table} ORDER BY trip_id")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def test_trip_id_is_stored_once_across_months(trip_facts):
+    assert add_trip(trip_facts, 'id1', '2016-03-05') == 1
+    # Another pickup time, even in another month's partition, is skipped
+    assert add_trip(trip_facts, 'id1', '2016-04-05') == 0
+    assert add_trip(trip_facts, 'id1', '2016-04-05', table='trip_facts_2016_04') == 0
+    assert stored(trip_facts, 'trip_facts') == stored(trip_facts, TRIP_ID_TABLE) == ['id1']
+
+
+def test_deleted_trip_frees_its_id(trip_facts):
+    add_trip(trip_facts, 'id1', '2016-03-05')
+    trip_facts.execute("DELETE FROM trip_facts WHERE trip_id = 'id1'")
+    assert stored(trip_facts, TRIP_ID_TABLE) == []
+    assert add_trip(trip_facts, 'id1', '2016-04-05') == 1
+
+
+def test_trip_moved_to_another_month_keeps_its_id(trip_facts):
+    add_trip(trip_facts, 'id1', '2016-03-05')
+    trip_facts.execute("UPDATE trip_facts SET pickup_datetime = '2016-04-05', "
+                       "dropoff_datetime = '2016-04-05 00:10' WHERE trip_id = 'id1'")
+    assert stored(trip_facts, 'trip_facts_2016_04') == stored(trip_facts, TRIP_ID_TABLE) == ['id1']
+
+
+def test_trip_id_cannot_change(trip_facts, postgres):
+    psycopg2 = pytest.importorskip('psycopg2')
+    add_trip(trip_facts, 'id1', '2016-03-05')
+    with pytest.raises(psycopg2.Error):
+        trip_facts.execute("UPDATE trip_facts SET trip_id = 'id2'")
+    postgres.rollback()
+
+
+def test_swap_moves_the_months_trip_ids(trip_facts, postgres):
+    add_trip(trip_facts, 'old', '2016-03-05')
+    add_trip(trip_facts, 'april', '2016-04-05')
+    replacement = create_replacement(trip_facts, MARCH)
+    add_trip(trip_facts, 'new', '2016-03-06', table=replacement)
+    swap_partition(trip_facts, MARCH)
+    postgres.commit()
+    assert stored(trip_facts, TRIP_ID_TABLE) == ['april', 'new']
+    # The attached partition took the triggers on
+    assert add_trip(trip_facts, 'new', '2016-03-07') == 0
+
+
+def test_swap_fails_on_a_trip_id_of_another_month(trip_facts, postgres):
+    psycopg2 = pytest.importorskip('psycopg2')
+    add_trip(trip_facts, 'april', '2016-04-05')
+    replacement = create_replacement(trip_facts, MARCH)
+    add_trip(trip_facts, 'april', '2016-03-06', table=replacement)
+    postgres.commit()
+    with pytest.raises(psycopg2.IntegrityError):
+        swap_partition(trip_facts, MARCH)
+    postgres.rollback()
+    assert stored(trip_facts, 'trip_facts') == stored(trip_facts, TRIP_ID_TABLE) == ['april']
+
+
+def test_guard_is_filled_from_the_trips_stored(trip_facts, postgres):
+    add_trip(trip_facts, 'id1', '2016-03-05')
+    assert not create_trip_id_guard(trip_facts)
+    # A database partitioned before trip_ids existed
+    trip_facts.execute("DROP TRIGGER trip_facts_trip_id_guard ON trip_facts")
+    trip_facts.execute("DROP TRIGGER trip_facts_trip_id_fixed ON trip_facts")
+    trip_facts.execute(f"DROP TABLE {TRIP_ID_TABLE}")
+    add_trip(trip_facts, 'id2', '2016-04-05')
+    assert create_trip_id_guard(trip_facts)
+    postgres.commit()
+    assert stored(trip_facts, TRIP_ID_TABLE) == ['id1', 'id2']
+    assert add_trip(trip_facts, 'id2', '2016-03-06') == 0
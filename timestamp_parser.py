@@ -0,0 +1,114 @@
+"""
+Shared timestamp parsing for the cleaner and the loader.
+
+Trip timestamps come in a known fixed layout, so nothing needs per-call
+format inference. The ISO layout used by train.csv ('YYYY-MM-DD HH:MM:SS')
+goes straight through numpy's C datetime parser. Any other layout (e.g.
+'03/14/2016 05:24:55 PM' in some TLC exports) is parsed per distinct
+string: values are factorized and the parsed uniques are kept in a bounded
+cache that later chunks, the other timestamp column and the loader (in the
+same process) reuse. Columns that are already datetime64 pass through.
+"""
+import numpy as np
+import pandas as pd
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Layouts numpy's ISO 8601 parser reads directly
+ISO_FORMATS = {'%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S'}
+
+
+class TimestampParser:
+    """Format-aware timestamp parser with a cache of already parsed strings"""
+
+    def __init__(self, fmt=TIMESTAMP_FORMAT, max_cache_size=2_000_000):
+        self.format = fmt
+        self.max_cache_size = max_cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = self._empty_cache()
+
+    @staticmethod
+    def _empty_cache():
+        return pd.Series(
+            np.array([], dtype='datetime64[ns]'),
+            index=pd.Index([], dtype=object)
+        )
+
+    def parse(self, values):
+        """Parse a column of timestamp strings into datetime64[ns]"""
+        values = pd.Series(values, copy=False)
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            return values
+
+        if self.format in ISO_FORMATS:
+            try:
+                return self._parse_iso(values)
+            except ValueError:
+                pass  # Not the expected layout after all; use the general path
+        return self._parse_cached(values)
+
+    def _parse_iso(self, values):
+        raw = values.to_numpy(dtype=object)
+        try:
+            result = raw.astype('datetime64[s]').astype('datetime64[ns]')
+        except ValueError:
+            # Missing values (NaN) cannot be converted; parse around them
+            missing = values.isna().to_numpy()
+            result = np.full(len(raw), np.datetime64('NaT'), dtype='datetime64[ns]')
+            result[~missing] = raw[~missing].astype('datetime64[s]')
+        return pd.Series(result, index=values.index, name=values.name)
+
+    def _parse_strings(self, strings):
+        try:
+            parsed = pd.to_datetime(strings, format=self.format)
+        except ValueError:
+            # Unexpected layout somewhere in the batch: fall back to inference
+            parsed = pd.to_datetime(strings)
+        return np.asarray(parsed, dtype='datetime64[ns]')
+
+    def _remember(self, strings, parsed):
+        new = pd.Series(parsed, index=pd.Index(strings, dtype=object))
+        self._cache = pd.concat([self._cache, new])
+        if len(self._cache) > self.max_cache_size:
+            # Keep the most recently added half
+            self._cache = self._cache.iloc[-(self.max_cache_size // 2):]
+
+    def _parse_cached(self, values):
+        codes, uniques = pd.factorize(values)
+        uniques = np.asarray(uniques, dtype=object)
+
+        position = self._cache.index.get_indexer(uniques)
+        known = position >= 0
+        parsed = np.empty(len(uniques), dtype='datetime64[ns]')
+        parsed[known] = self._cache.to_numpy()[position[known]]
+
+        unknown = ~known
+        if unknown.any():
+            parsed[unknown] = self._parse_strings(uniques[unknown])
+            self._remember(uniques[unknown], parsed[unknown])
+        self.hits += int(known.sum())
+        self.misses += int(unknown.sum())
+
+        # factorize marks missing values with -1
+        result = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ns]')
+        present = codes >= 0
+        result[present] = parsed[codes[present]]
+        return pd.Series(result, index=values.index, name=values.name)
+
+
+_default_parser = TimestampParser()
+
+
+def parse_timestamps(values):
+    """Parse timestamp strings with the process-wide shared parser"""
+    return _default_parser.parse(values)
+
+
+def cache_info():
+    """Hit/miss counts (in distinct strings) of the shared parser's cache"""
+    return {
+        'hits': _default_parser.hits,
+        'misses': _default_parser.misses,
+        'cached': len(_default_parser._cache)
+    }
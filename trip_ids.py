@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+# Trip ids look like 'id2875421'. Up to 17 digits pack exactly into an int64
+# key together with the digit count (so 'id01' and 'id1' stay distinct).
+_MAX_DIGITS = 17
+_LENGTH_SHIFT = 57
+
+
+def encode_trip_ids(ids):
+    """
+    Pack 'id<digits>' trip ids into exact int64 keys.
+
+    Returns (keys, encodable) where `encodable` marks the ids that follow the
+    pattern (ASCII digits only); keys for the other ids are meaningless and
+    must not be used. The ids are read as a 2-D array of code points, a
+    column at a time, so no Python code runs per id.
+    """
+    ids = np.asarray(ids).astype(str)
+    width = ids.dtype.itemsize // 4
+    chars = ids.view(np.uint32).reshape(len(ids), width)
+    past_end = np.zeros(len(ids), dtype=np.uint32)
+
+    def column(position):
+        return chars[:, position] if position < width else past_end
+
+    encodable = (column(0) == ord('i')) & (column(1) == ord('d'))
+    reading = encodable.copy()
+    lengths = np.zeros(len(ids), dtype=np.int64)
+    values = np.zeros(len(ids), dtype=np.int64)
+    for position in range(2, 2 + _MAX_DIGITS):
+        code = column(position).astype(np.int64)
+        reading &= (code >= ord('0')) & (code <= ord('9'))
+        values = np.where(reading, values * 10 + code - ord('0'), values)
+        lengths += reading
+    # The digits have to run to the end of the id
+    encodable &= (lengths > 0) & (np.count_nonzero(chars, axis=1) == 2 + lengths)
+
+    keys = np.where(encodable, (lengths << _LENGTH_SHIFT) | values, 0)
+    return keys, encodable
+
+
+class TripIdSet:
+    """
+    Compact, exact set of trip ids seen so far.
+
+    Encodable ids are kept as sorted int64 runs (8 bytes per id) that are
+    merged like a binary counter, so membership checks stay logarithmic.
+    The rare ids that do not follow the 'id<digits>' pattern are kept in a
+    plain Python set.
+    """
+
+    def __init__(self):
+        self._runs = []
+        self._other = set()
+
+    @classmethod
+    def load(cls, path):
+        """Read a set written by save()"""
+        with np.load(path) as data:
+            keys, other = data['keys'], data['other']
+        id_set = cls()
+        if len(keys):
+            id_set._runs.append(keys)
+        id_set._other.update(other.tolist())
+        return id_set
+
+    def save(self, path, **arrays):
+        """
+        Write the set as one sorted key array (plus the non-encodable ids),
+        and any `arrays` of the caller's next to them
+        """
+        if len(self._runs) > 1:
+            self._runs = [np.sort(np.concatenate(self._runs))]
+        keys = self._runs[0] if self._runs else np.zeros(0, dtype=np.int64)
+        np.savez(path, keys=keys, other=np.array(sorted(self._other), dtype=str), **arrays)
+
+    def __len__(self):
+        return sum(len(run) for run in self._runs) + len(self._other)
+
+    def _contains_keys(self, keys):
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self._runs:
+            idx = np.searchsorted(run, keys)
+            idx[idx == len(run)] = 0
+            found |= run[idx] == keys
+        return found
+
+    def _add_keys(self, keys):
+        if len(keys) == 0:
+            return
+        self._runs.append(np.sort(keys))
+        while len(self._runs) > 1 and len(self._runs[-2]) <= len(self._runs[-1]):
+            newest = self._runs.pop()
+            self._runs[-1] = np.sort(np.concatenate([self._runs[-1], newest]), kind='stable')
+
+    def contains(self, ids):
+        """Boolean mask of the ids that are in the set"""
+        ids = pd.Series(ids, copy=False).reset_index(drop=True)
+        keys, encodable = encode_trip_ids(ids)
+        found = np.zeros(len(ids), dtype=bool)
+        found[encodable] = self._contains_keys(keys[encodable])
+        if self._other and not encodable.all():
+            found[~encodable] = ids[~encodable].astype(str).isin(list(self._other)).to_numpy()
+        return found
+
+    def add(self, ids):
+        """Add ids (already in the set or not)"""
+        self.mark_new(ids)
+
+    def mark_new(self, ids):
+        """
+        Return a boolean mask that is True for the first occurrence of every
+        id not already in the set, and add those ids to the set.
+        """
+        ids = pd.Series(ids, copy=False).reset_index(drop=True)
+        keys, encodable = encode_trip_ids(ids)
+        return self.mark_new_encoded(keys, encodable, ids[~encodable].astype(str).tolist())
+
+    def mark_new_encoded(self, keys, encodable, other_ids):
+        """
+        mark_new for ids already packed by encode_trip_ids (e.g. in a worker
+        process); `other_ids` are the non-encodable ids, in order.
+        """
+        new = np.zeros(len(keys), dtype=bool)
+
+        positions = np.flatnonzero(encodable)
+        encoded = keys[positions]
+        first = ~pd.Series(encoded).duplicated(keep='first').to_numpy()
+        is_new = first & ~self._contains_keys(encoded)
+        new[positions] = is_new
+        self._add_keys(encoded[is_new])
+
+        for i, trip_id in zip(np.flatnonzero(~encodable), other_ids):
+            if trip_id not in self._other:
+                self._other.add(trip_id)
+                new[i] = True
+        return new
@@ -0,0 +1,255 @@
+"""
+Mergeable sketches of the cleaned trips, per time bucket and vendor.
+
+For every (pickup date, pickup hour, vendor_id) bucket TripSketches keeps
+
+- a log-binned histogram (a DDSketch) of trip duration, distance and speed:
+  each value is counted in bin ceil(log_gamma(value)), so every quantile is
+  answered within RELATIVE_ACCURACY of the true value;
+- a HyperLogLog sketch of the distinct pickup locations (at the database's
+  coordinate precision): 2^HLL_PRECISION registers, a standard error of
+  1.04 / sqrt(2^HLL_PRECISION), about 2.3%.
+
+Both merge exactly (bin counts add up, registers take their maximum), so the
+sketches of chunks, input files and runs combine into the sketch of all
+their trips. They are kept as two long tables with one row per non-empty bin
+or register of a bucket, so their size grows with the buckets, not the trips.
+Queries select buckets by date, weekday, hour and vendor and merge them on
+the fly.
+
+Usage:
+    python trip_sketches.py data/trip_sketches.npz --quantile 0.5 --metric trip_duration --weekdays 0 1 2 3 4 --hours 8
+    python trip_sketches.py data/trip_sketches.npz --distinct-pickups --dates 2016-03-01
+"""
+import argparse
+import math
+
+import numpy as np
+import pandas as pd
+
+from surrogate_keys import coordinate_keys
+
+RELATIVE_ACCURACY = 0.01
+HLL_PRECISION = 11
+
+# Sketched columns and their codes in the bins table
+METRICS = {'trip_duration': 0, 'trip_distance_km': 1, 'trip_speed_kmh': 2}
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+# Bin of the values <= 0, which have no logarithm
+ZERO_BIN = np.iinfo(np.int16).min
+
+# Tables of the sketches: column -> dtype
+_BIN_DTYPES = {'pickup_date': np.int32, 'pickup_hour': np.int8, 'vendor_id': np.int16,
+               'metric': np.int8, 'bin': np.int16, 'count': np.int64}
+_REGISTER_DTYPES = {'pickup_date': np.int32, 'pickup_hour': np.int8, 'vendor_id': np.int16,
+                    'register': np.int16, 'rank': np.int8}
+
+# Unconsolidated parts kept before they are combined
+_MAX_PENDING = 16
+
+
+def value_bins(values):
+    """Histogram bin of every value"""
+    values = np.asarray(values, dtype=np.float64)
+    bins = np.full(len(values), ZERO_BIN, dtype=np.int16)
+    positive = values > 0
+    scaled = np.ceil(np.log(values[positive]) / _LOG_GAMMA)
+    bins[positive] = np.clip(scaled, ZERO_BIN + 1, np.iinfo(np.int16).max).astype(np.int16)
+    return bins
+
+
+def bin_values(bins):
+    """Value every bin stands for, within RELATIVE_ACCURACY of the values counted in it"""
+    bins = np.asarray(bins)
+    values = 2 * _GAMMA ** bins.astype(np.float64) / (_GAMMA + 1)
+    return np.where(bins == ZERO_BIN, 0.0, values)
+
+
+def hll_registers(keys):
+    """(register, rank) of every int64 key"""
+    hashes = pd.util.hash_array(np.asarray(keys, dtype=np.int64))
+    remaining_bits = 64 - HLL_PRECISION
+    registers = (hashes >> np.uint64(remaining_bits)).astype(np.int16)
+    rest = hashes & np.uint64((1 << remaining_bits) - 1)
+    # rest = m * 2**exponent with 0.5 <= m < 1: the leftmost 1-bit is bit exponent - 1
+    _, exponent = np.frexp(rest.astype(np.float64))
+    return registers, (remaining_bits - exponent + 1).astype(np.int8)
+
+
+def hll_estimate(registers):
+    """Distinct count of a full array of 2^HLL_PRECISION register ranks"""
+    m = 1 << HLL_PRECISION
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(2.0 ** -np.asarray(registers, dtype=np.float64))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Small cardinalities: linear counting of the empty registers
+        estimate = m * math.log(m / zeros)
+    return estimate
+
+
+def _empty(dtypes):
+    return pd.DataFrame({column: np.empty(0, dtype=dtype) for column, dtype in dtypes.items()})
+
+
+def _combine(frames, dtypes, how):
+    """One row per key of the concatenated tables, their values summed or maxed"""
+    keys = list(dtypes)[:-1]
+    value = list(dtypes)[-1]
+    combined = pd.concat(frames, ignore_index=True).groupby(keys, sort=False)[value].agg(how)
+    return combined.reset_index().astype(dtypes)
+
+
+def _days(dates):
+    """Day numbers (since 1970-01-01) of dates given as strings, dates or datetimes"""
+    return pd.to_datetime(pd.Series(list(dates))).to_numpy(dtype='datetime64[D]').astype(np.int32)
+
+
+class TripSketches:
+    """Quantile and distinct-pickup sketches per (pickup date, hour, vendor) bucket"""
+
+    def __init__(self):
+        self._bins = [_empty(_BIN_DTYPES)]
+        self._registers = [_empty(_REGISTER_DTYPES)]
+
+    @property
+    def bins(self):
+        """Histogram table: bucket, metric code, bin, count"""
+        if len(self._bins) > 1:
+            self._bins = [_combine(self._bins, _BIN_DTYPES, 'sum')]
+        return self._bins[0]
+
+    @property
+    def registers(self):
+        """HyperLogLog table: bucket, register, rank"""
+        if len(self._registers) > 1:
+            self._registers = [_combine(self._registers, _REGISTER_DTYPES, 'max')]
+        return self._registers[0]
+
+    def _append(self, bins, registers):
+        self._bins.append(bins)
+        self._registers.append(registers)
+        if len(self._bins) > _MAX_PENDING:
+            self._bins = [_combine(self._bins, _BIN_DTYPES, 'sum')]
+            self._registers = [_combine(self._registers, _REGISTER_DTYPES, 'max')]
+        return self
+
+    def add(self, df):
+        """Add the trips of a cleaned frame"""
+        pickup = pd.DatetimeIndex(df['pickup_datetime'])
+        buckets = {
+            'pickup_date': pickup.to_numpy(dtype='datetime64[D]').astype(np.int32),
+            'pickup_hour': pickup.hour.to_numpy(dtype=np.int8),
+            'vendor_id': df['vendor_id'].to_numpy(dtype=np.int16)
+        }
+
+        bins = []
+        for metric, code in METRICS.items():
+            values = df[metric].to_numpy(dtype=np.float64)
+            present = ~np.isnan(values)
+            frame = pd.DataFrame({
+                **{column: keys[present] for column, keys in buckets.items()},
+                'metric': np.int8(code),
+                'bin': value_bins(values[present])
+            })
+            bins.append(frame.groupby(list(frame.columns), sort=False).size().rename('count').reset_index())
+
+        registers, ranks = hll_registers(coordinate_keys(df['pickup_latitude'], df['pickup_longitude']))
+        frame = pd.DataFrame({**buckets, 'register': registers, 'rank': ranks})
+        return self._append(_combine(bins, _BIN_DTYPES, 'sum'),
+                            _combine([frame], _REGISTER_DTYPES, 'max'))
+
+    def merge(self, other):
+        """Add the trips sketched by `other` (of other chunks, files or runs)"""
+        return self._append(other.bins, other.registers)
+
+    @classmethod
+    def load(cls, path):
+        sketches = cls()
+        with np.load(path) as data:
+            sketches._bins = [pd.DataFrame({c: data[f'bins_{c}'] for c in _BIN_DTYPES})]
+            sketches._registers = [pd.DataFrame({c: data[f'registers_{c}'] for c in _REGISTER_DTYPES})]
+        return sketches
+
+    def save(self, path):
+        bins, registers = self.bins, self.registers
+        np.savez_compressed(
+            path,
+            **{f'bins_{column}': bins[column].to_numpy() for column in _BIN_DTYPES},
+            **{f'registers_{column}': registers[column].to_numpy() for column in _REGISTER_DTYPES}
+        )
+
+    @staticmethod
+    def _select(table, dates=None, weekdays=None, hours=None, vendors=None):
+        """Rows of the buckets matching every filter given"""
+        selected = np.ones(len(table), dtype=bool)
+        days = table['pickup_date'].to_numpy()
+        if dates is not None:
+            selected &= np.isin(days, _days(dates))
+        if weekdays is not None:
+            # 1970-01-01 was a Thursday (weekday 3)
+            selected &= np.isin((days + 3) % 7, list(weekdays))
+        if hours is not None:
+            selected &= np.isin(table['pickup_hour'].to_numpy(), list(hours))
+        if vendors is not None:
+            selected &= np.isin(table['vendor_id'].to_numpy(), list(vendors))
+        return table[selected]
+
+    def _histogram(self, metric, **buckets):
+        bins = self._select(self.bins, **buckets)
+        bins = bins[bins['metric'].to_numpy() == METRICS[metric]]
+        return bins.groupby('bin')['count'].sum()
+
+    def count(self, **buckets):
+        """Trips in the selected buckets"""
+        return int(self._histogram('trip_duration', **buckets).sum())
+
+    def quantile(self, metric, q, **buckets):
+        """q-quantile of `metric` over the selected buckets (NaN when they are empty)"""
+        histogram = self._histogram(metric, **buckets)
+        if histogram.empty:
+            return math.nan
+        cumulative = np.cumsum(histogram.to_numpy())
+        position = np.searchsorted(cumulative, q * (cumulative[-1] - 1), side='right')
+        return float(bin_values(histogram.index.to_numpy()[position]))
+
+    def distinct_pickups(self, **buckets):
+        """Estimated distinct pickup locations over the selected buckets"""
+        registers = self._select(self.registers, **buckets).groupby('register')['rank'].max()
+        dense = np.zeros(1 << HLL_PRECISION, dtype=np.int8)
+        dense[registers.index.to_numpy()] = registers.to_numpy()
+        return hll_estimate(dense)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query trip sketches written by the cleaner')
+    parser.add_argument('sketches', nargs='+', help='Sketch files (.npz); several are merged')
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument('--quantile', type=float, help='Quantile of --metric, e.g. 0.5')
+    query.add_argument('--distinct-pickups', action='store_true', help='Distinct pickup locations')
+    query.add_argument('--count', action='store_true', help='Number of trips')
+    parser.add_argument('--metric', choices=list(METRICS), default='trip_duration')
+    parser.add_argument('--dates', nargs='+', metavar='YYYY-MM-DD', help='Only these pickup dates')
+    parser.add_argument('--weekdays', nargs='+', type=int, help='Only these weekdays (0 = Monday)')
+    parser.add_argument('--hours', nargs='+', type=int, help='Only these pickup hours')
+    parser.add_argument('--vendors', nargs='+', type=int, help='Only these vendor ids')
+    args = parser.parse_args()
+
+    sketches = TripSketches.load(args.sketches[0])
+    for path in args.sketches[1:]:
+        sketches.merge(TripSketches.load(path))
+    buckets = {'dates': args.dates, 'weekdays': args.weekdays, 'hours': args.hours, 'vendors': args.vendors}
+
+    if args.quantile is not None:
+        print(f"{args.metric} q{args.quantile}: {sketches.quantile(args.metric, args.quantile, **buckets):.3f}")
+    elif args.distinct_pickups:
+        print(f"distinct pickup locations: {sketches.distinct_pickups(**buckets):.0f}")
+    else:
+        print(f"trips: {sketches.count(**buckets)}")
+
+
+if __name__ == '__main__':
+    main()